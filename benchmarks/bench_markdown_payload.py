@@ -0,0 +1,122 @@
+"""
+Compact Markdown instructions against the equivalent JSON: a prose report (headings,
+emphasis, lists, small tables) for the PDF tool and the three office formats, and a
+table-heavy workbook. The JSON is what _markdown_to_payload builds from the Markdown,
+so both describe the same document. Reports bytes and tokens of each form, and the
+parse time of the Markdown against json.loads of the same document.
+
+Tokens come from tiktoken when its encoding can be loaded (it downloads the BPE file
+on first use); otherwise a word/punctuation count stands in, which tracks BPE counts
+of prose and JSON closely enough to compare the two forms.
+
+    python benchmarks/bench_markdown_payload.py
+    python benchmarks/bench_markdown_payload.py --sections 20 --rows 2000 --encoding o200k_base
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from bulk_runner import _load_tool  # noqa: E402
+
+_WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua revenue margin growth customer pipeline quarter"
+).split()
+
+
+def _counter(encoding: str) -> Tuple[str, Callable[[str], int]]:
+    try:
+        import tiktoken
+
+        enc = tiktoken.get_encoding(encoding)
+        return encoding, lambda text: len(enc.encode(text))
+    except Exception:
+        return "~words", lambda text: len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def _sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(n)).capitalize() + "."
+
+
+def _report(sections: int) -> str:
+    rng = random.Random(1)
+    lines = ["---", "title: Annual Report", "header_text: Acme Corp", "footer_text: Confidential", "---", ""]
+    for c in range(sections):
+        lines += [f"# Section {c + 1}", ""]
+        for _ in range(6):
+            lines += [" ".join(_sentence(rng, 12) for _ in range(6)).replace(" margin ", " **margin** ", 1), ""]
+        lines += [f"- {_sentence(rng, 8)}" for _ in range(5)] + [""]
+        lines += ["| Region | Q1 | Q2 | Q3 |", "|---|---:|---:|---:|"]
+        lines += [
+            f"| R{r} | {rng.randint(1, 999)} | {rng.randint(1, 999)} | {rng.randint(1, 999)} |"
+            for r in range(10)
+        ]
+        lines += [""]
+    return "\n".join(lines)
+
+
+def _inventory(rows: int) -> str:
+    lines = ["## Inventory", "", "| SKU | Name | Qty | Price |", "|---|---|---:|---:|"]
+    lines += [f"| S{i:04d} | Item {i} | {i % 50} | {i * 1.25:.2f} |" for i in range(rows)]
+    return "\n".join(lines) + "\n"
+
+
+def _best(fn: Callable[[], Any], repeat: int = 20) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sections", type=int, default=10, help="sections of the prose report")
+    parser.add_argument("--rows", type=int, default=500, help="rows of the inventory table")
+    parser.add_argument("--encoding", default="cl100k_base", help="tiktoken encoding")
+    args = parser.parse_args(argv)
+
+    pdf = _load_tool("pdf_document_tool")
+    office = _load_tool("office_document_tool")
+    unit, tokens = _counter(args.encoding)
+    report, inventory = _report(args.sections), _inventory(args.rows)
+    cases = [
+        ("report (pdf)", report, lambda md: pdf._markdown_to_payload(md)),
+        ("report (docx)", report, lambda md: office._markdown_to_payload("docx", md)),
+        ("report (pptx)", report, lambda md: office._markdown_to_payload("pptx", md)),
+        ("report (xlsx)", report, lambda md: office._markdown_to_payload("xlsx", md)),
+        (f"{args.rows} rows (xlsx)", inventory, lambda md: office._markdown_to_payload("xlsx", md)),
+    ]
+
+    print(f"{'case':<18} {'form':<16} {'bytes':>9} {unit:>12} {'vs JSON':>8} {'parse':>9}")
+    for name, md, convert in cases:
+        payload = convert(md)
+        pretty = json.dumps(payload, indent=2, ensure_ascii=False)
+        compact = json.dumps(payload, ensure_ascii=False)
+        baseline = tokens(pretty)
+        forms = [
+            ("JSON (indent=2)", pretty, lambda: json.loads(pretty)),
+            ("JSON (compact)", compact, lambda: json.loads(compact)),
+            ("Markdown", md, lambda: convert(md)),
+        ]
+        for form, text, parse in forms:
+            count = tokens(text)
+            print(
+                f"{name:<18} {form:<16} {len(text.encode('utf-8')):>9,} {count:>12,} "
+                f"{count / baseline - 1:>+8.0%} {_best(parse) * 1000:>7.2f}ms"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Modify benchmark for large-media Office packages: ZIP passthrough (_modify_docx /
+_modify_pptx) against a full python-docx/python-pptx parse and save of the same
+package. Each run appends one slide or paragraph to a deck/document that carries
+incompressible images and, for the deck, a video, then checks that the media came
+through byte-identical.
+
+    python benchmarks/bench_modify_passthrough.py
+    python benchmarks/bench_modify_passthrough.py --video-mb 300 --images 16 --repeat 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import io
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from bulk_runner import _load_tool  # noqa: E402
+
+from docx import Document  # noqa: E402
+from docx.shared import Inches  # noqa: E402
+from PIL import Image  # noqa: E402
+from pptx import Presentation  # noqa: E402
+from pptx.util import Inches as PptInches  # noqa: E402
+
+
+def _noise_png(size: int) -> bytes:
+    bio = io.BytesIO()
+    Image.frombytes("RGB", (size, size), os.urandom(size * size * 3)).save(bio, "PNG")
+    return bio.getvalue()
+
+
+def _build_packages(images: List[bytes], video_mb: int) -> Dict[str, bytes]:
+    prs = Presentation()
+    for png in images:
+        slide = prs.slides.add_slide(prs.slide_layouts[6])
+        slide.shapes.add_picture(io.BytesIO(png), 0, 0, width=PptInches(4))
+    if video_mb:
+        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as fh:
+            fh.write(os.urandom(video_mb * 1024 * 1024))
+        try:
+            slide = prs.slides.add_slide(prs.slide_layouts[6])
+            slide.shapes.add_movie(
+                fh.name, 0, 0, PptInches(4), PptInches(3), mime_type="video/mp4",
+                poster_frame_image=io.BytesIO(images[0]),
+            )
+        finally:
+            os.unlink(fh.name)
+    deck = io.BytesIO()
+    prs.save(deck)
+
+    doc = Document()
+    for png in images:
+        doc.add_picture(io.BytesIO(png), width=Inches(2))
+    word = io.BytesIO()
+    doc.save(word)
+    return {"pptx": deck.getvalue(), "docx": word.getvalue()}
+
+
+def _full_pptx(tool: Any) -> Callable[[bytes, Any], bytes]:
+    def modify(existing: bytes, instr: Any) -> bytes:
+        prs = Presentation(io.BytesIO(existing))
+        with tool._DeckBuilder(prs) as deck:
+            for spec in instr.slides:
+                deck.add_slide(spec)
+        out = io.BytesIO()
+        prs.save(out)
+        return out.getvalue()
+
+    return modify
+
+
+def _full_docx(tool: Any) -> Callable[[bytes, Any], bytes]:
+    def modify(existing: bytes, instr: Any) -> bytes:
+        doc = Document(io.BytesIO(existing))
+        tool._apply_word_instructions(doc, instr)
+        out = io.BytesIO()
+        doc.save(out)
+        return out.getvalue()
+
+    return modify
+
+
+def _media(data: bytes) -> Dict[str, int]:
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        return {i.filename: i.CRC for i in zf.infolist() if "/media/" in i.filename}
+
+
+def _best_of(fn: Callable[[], bytes], repeat: int) -> Tuple[float, bytes]:
+    best, out = float("inf"), b""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=8, help="noise PNGs per package")
+    parser.add_argument("--image-px", type=int, default=1200, help="PNG edge in pixels")
+    parser.add_argument("--video-mb", type=int, default=60, help="video size in the deck")
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    args = parser.parse_args(argv)
+
+    tool = _load_tool("office_document_tool")
+    images = [_noise_png(args.image_px) for _ in range(args.images)]
+    packages = _build_packages(images, args.video_mb)
+    again = base64.b64encode(images[1]).decode()
+    cases = [
+        (
+            "pptx",
+            tool.PptInstructions(slides=[{"title": "Appended", "bullets": ["one more slide"]}]),
+            _full_pptx(tool),
+            tool._modify_pptx,
+        ),
+        (
+            "pptx+image",
+            tool.PptInstructions(slides=[{"title": "Reused", "images": [{"b64": again}]}]),
+            _full_pptx(tool),
+            tool._modify_pptx,
+        ),
+        (
+            "docx",
+            tool.WordInstructions(paragraphs=[{"text": "Appended paragraph."}]),
+            _full_docx(tool),
+            tool._modify_docx,
+        ),
+    ]
+
+    print(f"{'case':<12} {'package':>9} {'full parse+save':>16} {'passthrough':>12} {'speedup':>8}")
+    for name, instr, full, passthrough in cases:
+        existing = packages[name.split("+")[0]]
+        full_s, full_out = _best_of(lambda: full(existing, instr), args.repeat)
+        fast_s, fast_out = _best_of(lambda: passthrough(existing, instr), args.repeat)
+        before, after = _media(existing), _media(fast_out)
+        if any(after.get(member) != crc for member, crc in before.items()):
+            raise SystemExit(f"{name}: media changed by the passthrough writer")
+        if len(after) != len(_media(full_out)):
+            raise SystemExit(f"{name}: passthrough stored {len(after)} media parts, full save {len(_media(full_out))}")
+        print(
+            f"{name:<12} {len(existing) / 1e6:>7.1f}MB {full_s:>15.2f}s {fast_s:>11.2f}s"
+            f" {full_s / fast_s:>7.1f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Combining many attached PDFs: pypdf's PdfWriter.append (every source page held in the
+writer until write()) against _combine_pdfs, which streams each source's pages through
+_PdfStreamWriter as it is parsed. Reports wall time, peak Python heap (tracemalloc, in
+a separate run) and output size; both paths decode the same base64 attachments.
+
+    python benchmarks/bench_pdf_combine.py
+    python benchmarks/bench_pdf_combine.py --files 100 500 --pages 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import io
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pypdf import PdfReader, PdfWriter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from bulk_runner import _load_tool  # noqa: E402
+
+
+def _attachments(tool: Any, count: int, pages: int) -> List[Dict[str, Any]]:
+    """`count` attachments sharing a few distinct sources, as __files__ entries."""
+    sources = []
+    for v in range(4):
+        paragraphs = [{"text": f"Source {v}, paragraph {p}. " * 40} for p in range(pages * 4)]
+        instr = tool.PdfInstructions(paragraphs=paragraphs, header_text=f"Source {v}")
+        sources.append(base64.b64encode(tool._create_pdf(instr)).decode())
+    return [{"name": f"part{i:04d}.pdf", "content": sources[i % len(sources)]} for i in range(count)]
+
+
+def _append(files: List[Dict[str, Any]]) -> Tuple[bytes, int]:
+    writer = PdfWriter()
+    for f in files:
+        reader = PdfReader(io.BytesIO(base64.b64decode(f["content"])))
+        writer.append(reader, outline_item=os.path.splitext(f["name"])[0])
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue(), len(writer.pages)
+
+
+def _measure(fn: Callable[[], Tuple[bytes, int]]) -> Tuple[float, int, int, int]:
+    started = time.perf_counter()
+    data, pages = fn()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()  # a second, traced run: tracing would skew the timing
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, len(data), pages
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, nargs="+", default=[100, 300])
+    parser.add_argument("--pages", type=int, default=4, help="approximate pages per source")
+    args = parser.parse_args(argv)
+
+    tool = _load_tool("pdf_document_tool")
+    print(f"{'files':>6} {'pages':>6} {'writer':<16} {'seconds':>8} {'peak heap':>10} {'size':>9}")
+    for count in args.files:
+        files = _attachments(tool, count, args.pages)
+        for name, fn in (
+            ("pypdf append", lambda: _append(files)),
+            ("stream writer", lambda: tool._combine_pdfs(files)),
+        ):
+            elapsed, peak, size, pages = _measure(fn)
+            print(
+                f"{count:>6} {pages:>6} {name:<16} {elapsed:>8.2f}"
+                f" {peak / 1e6:>8.1f}MB {size / 1e6:>7.2f}MB"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
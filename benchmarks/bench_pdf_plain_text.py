@@ -0,0 +1,74 @@
+"""
+Plain-text fast path benchmark: about 1 MB of log text (with stray "<" and "&")
+rendered as one ParagraphSpec with kind "plain" and "preformatted" (_TextLines), and
+through the markup path (reportlab Paragraph) on growing slices, escaped with <br/>
+line breaks, since raw log text does not parse as markup. The markup path grows
+quadratically with block size; pass --markup-kb 1000 to time it on the full text
+(several minutes).
+
+    python benchmarks/bench_pdf_plain_text.py
+    python benchmarks/bench_pdf_plain_text.py --mb 2 --markup-kb 25 50 100 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from typing import Any, List, Optional
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from bulk_runner import _load_tool  # noqa: E402
+
+from pypdf import PdfReader  # noqa: E402
+
+_WORDS = "error warn info user=<admin> a&b path/to/file.py:123 GET /api?x=1&y=2 took 12ms ok".split()
+
+
+def _log_text(size: int) -> str:
+    rng = random.Random(1)
+    lines: List[str] = []
+    total = 0
+    while total < size:
+        line = f"2026-10-19T12:{len(lines) % 60:02d}:00 " + " ".join(
+            rng.choice(_WORDS) for _ in range(rng.randint(3, 18))
+        )
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines)
+
+
+def _time(tool: Any, paragraph: Any) -> str:
+    started = time.perf_counter()
+    data = tool._create_pdf(tool.PdfInstructions(paragraphs=[paragraph]))
+    elapsed = time.perf_counter() - started
+    pages = len(PdfReader(io.BytesIO(data)).pages)
+    return f"{elapsed:>8.2f}s {pages:>6} pages {len(data) / 1e6:>6.2f}MB"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mb", type=float, default=1.0, help="size of the log text")
+    parser.add_argument("--markup-kb", type=int, nargs="+", default=[25, 50, 100])
+    args = parser.parse_args(argv)
+
+    tool = _load_tool("pdf_document_tool")
+    text = _log_text(int(args.mb * 1_000_000))
+    print(f"{len(text) / 1e6:.2f} MB, {text.count(chr(10)) + 1} lines")
+    for kind in ("plain", "preformatted"):
+        print(f"{kind:<24} {_time(tool, tool.ParagraphSpec(text=text, kind=kind))}")
+    for kb in args.markup_kb:
+        head = text[: kb * 1000].rsplit("\n", 1)[0]
+        markup = tool.ParagraphSpec(text=escape(head).replace("\n", "<br/>"))
+        plain = tool.ParagraphSpec(text=head, kind="plain")
+        print(f"{f'markup {kb} KB':<24} {_time(tool, markup)}")
+        print(f"{f'plain {kb} KB':<24} {_time(tool, plain)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Parallel sectioned PDF rendering: a long manual (chapters start with
+page_break_before) rendered serially and with 1, 2, 4 and 8 render workers. For each
+worker count it reports the first call (which starts the worker pool) and the best
+warm call, and checks the output against the serial render: same pages, and the same
+text at the same positions on every page, running page numbers included.
+
+    python benchmarks/bench_pdf_sections.py
+    python benchmarks/bench_pdf_sections.py --chapters 60 --paragraphs 80 --workers 1 2 4 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import sys
+import time
+from typing import Any, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from bulk_runner import _load_tool  # noqa: E402
+
+from pypdf import PdfReader  # noqa: E402
+
+
+def _manual(tool: Any, chapters: int, paragraphs: int) -> Any:
+    body = "Lorem ipsum dolor sit amet, <i>consectetur</i> adipiscing elit, sed do eiusmod tempor. " * 6
+    paras = []
+    for c in range(chapters):
+        paras.append({"text": f"Chapter {c + 1}", "font_size_pt": 20, "bold": True, "page_break_before": True})
+        paras += [{"text": f"{body} [{c + 1}.{p + 1}]", "align": "justify"} for p in range(paragraphs)]
+    return tool.PdfInstructions(
+        title="Manual",
+        header_text="Operations manual",
+        footer_text="Internal",
+        show_page_numbers=True,
+        paragraphs=paras,
+    )
+
+
+def _signature(data: bytes) -> List[List[Tuple[str, float, float]]]:
+    pages = []
+    for page in PdfReader(io.BytesIO(data)).pages:
+        items: List[Tuple[str, float, float]] = []
+
+        def visit(text: str, cm: Any, tm: Any, *_: Any) -> None:
+            if text.strip():
+                items.append((text, round(cm[4] + tm[4] * cm[0], 2), round(cm[5] + tm[5] * cm[3], 2)))
+
+        page.extract_text(visitor_text=visit)
+        pages.append(sorted(items))
+    return pages
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chapters", type=int, default=40)
+    parser.add_argument("--paragraphs", type=int, default=60, help="paragraphs per chapter")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=2, help="warm calls per worker count")
+    args = parser.parse_args(argv)
+
+    tool = _load_tool("pdf_document_tool")
+    instr = _manual(tool, args.chapters, args.paragraphs)
+
+    started = time.perf_counter()
+    serial = tool._render_serial(instr)
+    serial_s = time.perf_counter() - started
+    reference = _signature(serial)
+    print(f"cpus {os.cpu_count()}, {len(reference)} pages, serial {serial_s:.2f}s")
+    print(f"{'workers':>7} {'first call':>11} {'warm':>8} {'speedup':>8} {'identical':>10}")
+    for workers in args.workers:
+        started = time.perf_counter()
+        out = tool._create_pdf(instr, workers)
+        first = time.perf_counter() - started
+        warm = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            out = tool._create_pdf(instr, workers)
+            warm = min(warm, time.perf_counter() - started)
+        same = _signature(out) == reference
+        print(f"{workers:>7} {first:>10.2f}s {warm:>7.2f}s {serial_s / warm:>7.2f}x {str(same):>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
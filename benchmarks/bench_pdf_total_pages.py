@@ -0,0 +1,119 @@
+"""
+"Page X of Y" footers: the cost of knowing the total. Renders the same long document
+three ways and reports wall time, peak Python heap (tracemalloc, in a separate run)
+and whether the footers match:
+
+  plain      "Page N" drawn by the page callback (the baseline)
+  deferred   _TotalPagesCanvas: pages held until save(), one layout pass
+  two-pass   doc.build once to count pages, then again with the total known
+
+    python benchmarks/bench_pdf_total_pages.py
+    python benchmarks/bench_pdf_total_pages.py --paragraphs 3000 5000
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import re
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from bulk_runner import _load_tool  # noqa: E402
+
+from pypdf import PdfReader  # noqa: E402
+from reportlab.lib import colors  # noqa: E402
+from reportlab.platypus import SimpleDocTemplate  # noqa: E402
+
+
+def _report(tool: Any, paragraphs: int, with_total: bool) -> Any:
+    body = "Lorem ipsum dolor sit amet, <b>consectetur</b> adipiscing elit, sed do eiusmod tempor. " * 4
+    return tool.PdfInstructions(
+        header_text="Quarterly report",
+        footer_text="Confidential",
+        show_page_numbers=True,
+        show_total_pages=with_total,
+        paragraphs=[{"text": f"{body} [{p + 1}]"} for p in range(paragraphs)],
+    )
+
+
+def _two_pass(tool: Any, instr: Any) -> bytes:
+    """The textbook approach: lay the story out once to count pages, then again."""
+    pagesize, margins = tool._page_geometry(instr)
+    x, y = tool._page_label_position(instr)
+    onpage = tool._make_onpage(instr.header_text, instr.footer_text, False, instr.watermark_text)
+
+    def build(total: int) -> Tuple[bytes, int]:
+        def draw(canvas: Any, doc: Any) -> None:
+            onpage(canvas, doc)
+            canvas.setFont("Helvetica", 9)
+            canvas.setFillColor(colors.grey)
+            canvas.drawRightString(x, y, f"Page {doc.page} of {total}")
+
+        buf = io.BytesIO()
+        doc = SimpleDocTemplate(
+            buf,
+            pagesize=pagesize,
+            leftMargin=margins["left"],
+            rightMargin=margins["right"],
+            topMargin=margins["top"],
+            bottomMargin=margins["bottom"],
+        )
+        doc.build(tool._build_story(instr), onFirstPage=draw, onLaterPages=draw)
+        return buf.getvalue(), doc.page
+
+    _, total = build(0)
+    return build(total)[0]
+
+
+def _labels(data: bytes) -> List[str]:
+    return [
+        (re.findall(r"Page \d+(?: of \d+)?", page.extract_text()) or [""])[-1]
+        for page in PdfReader(io.BytesIO(data)).pages
+    ]
+
+
+def _measure(fn: Callable[[], bytes]) -> Tuple[bytes, float, int]:
+    started = time.perf_counter()
+    data = fn()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()  # a second, traced run: tracing would skew the timing
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return data, elapsed, peak
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--paragraphs", type=int, nargs="+", default=[1000, 3000])
+    args = parser.parse_args(argv)
+
+    tool = _load_tool("pdf_document_tool")
+    print(f"{'paras':>6} {'pages':>6} {'method':<9} {'seconds':>8} {'peak heap':>10} {'labels':>9}")
+    for paragraphs in args.paragraphs:
+        plain, total = _report(tool, paragraphs, False), _report(tool, paragraphs, True)
+        methods = [
+            ("plain", lambda: tool._render_serial(plain)),
+            ("deferred", lambda: tool._render_serial(total)),
+            ("two-pass", lambda: _two_pass(tool, total)),
+        ]
+        for name, fn in methods:
+            data, elapsed, peak = _measure(fn)
+            labels = _labels(data)
+            suffix = "" if name == "plain" else f" of {len(labels)}"
+            expected = [f"Page {i}{suffix}" for i in range(1, len(labels) + 1)]
+            check = "ok" if labels == expected else "MISMATCH"
+            print(
+                f"{paragraphs:>6} {len(labels):>6} {name:<9} {elapsed:>8.2f}"
+                f" {peak / 1e6:>8.1f}MB {check:>9}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Deck generation throughput in slides per second: _create_pptx (_DeckBuilder: layout
+and body placeholder resolved once, bullets written in one pass, identical chart data
+sharing one embedded workbook) against the per-slide python-pptx path it replaced
+(layout lookup per slide, paragraph-by-paragraph bullets, a fresh ChartData and
+workbook for every chart). Also reports the output size and embedded workbook count.
+
+    python benchmarks/bench_pptx_deck.py
+    python benchmarks/bench_pptx_deck.py --slides 50 200 500 --chart-every 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import sys
+import time
+import zipfile
+from typing import Any, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from bulk_runner import _load_tool  # noqa: E402
+
+from pptx import Presentation  # noqa: E402
+from pptx.chart.data import ChartData  # noqa: E402
+from pptx.enum.chart import XL_CHART_TYPE  # noqa: E402
+from pptx.util import Inches  # noqa: E402
+
+
+def _per_slide_pptx(instr: Any) -> bytes:
+    """The python-pptx path before _DeckBuilder (text and charts only)."""
+    prs = Presentation()
+    if instr.title:
+        slide = prs.slides.add_slide(prs.slide_layouts[0])
+        slide.shapes.title.text = instr.title
+    for spec in instr.slides:
+        slide = prs.slides.add_slide(prs.slide_layouts[1])
+        if spec.title:
+            slide.shapes.title.text = spec.title
+        if spec.bullets:
+            body = slide.placeholders[1].text_frame
+            body.clear()
+            for i, b in enumerate(spec.bullets):
+                if i == 0:
+                    body.text = b
+                else:
+                    p = body.add_paragraph()
+                    p.text = b
+                    p.level = 0
+        if spec.chart:
+            chart_data = ChartData()
+            chart_data.categories = spec.chart.get("categories") or []
+            for s in spec.chart.get("series") or []:
+                chart_data.add_series(s.get("name", "Series"), s.get("values", []))
+            slide.shapes.add_chart(
+                XL_CHART_TYPE.COLUMN_CLUSTERED, Inches(1), Inches(3), Inches(8), Inches(3), chart_data
+            )
+    out = io.BytesIO()
+    prs.save(out)
+    return out.getvalue()
+
+
+def _deck(tool: Any, slides: int, bullets: int, chart_every: int) -> Any:
+    specs = []
+    for i in range(slides):
+        spec = {"title": f"Slide {i + 1}", "bullets": [f"Point {j + 1} of slide {i + 1}" for j in range(bullets)]}
+        if chart_every and i % chart_every == 0:
+            spec["chart"] = {
+                "type": "bar",
+                "categories": ["Q1", "Q2", "Q3", "Q4"],
+                "series": [{"name": "Revenue", "values": [4, 5, 6, 7]}, {"name": "Cost", "values": [2, 2, 3, 3]}],
+            }
+        specs.append(spec)
+    return tool.PptInstructions(title="Training deck", slides=specs)
+
+
+def _embedded_workbooks(data: bytes) -> int:
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        return sum(1 for name in zf.namelist() if name.endswith(".xlsx"))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--slides", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--bullets", type=int, default=8, help="bullets per slide")
+    parser.add_argument("--chart-every", type=int, default=2, help="a chart on every Nth slide (0: none)")
+    args = parser.parse_args(argv)
+
+    tool = _load_tool("office_document_tool")
+    tool._create_pptx(_deck(tool, 2, 2, 1))  # warm the template registry
+
+    print(f"{'slides':>6} {'engine':<10} {'seconds':>8} {'slides/s':>9} {'size':>9} {'workbooks':>10}")
+    for count in args.slides:
+        instr = _deck(tool, count, args.bullets, args.chart_every)
+        for engine, render in (("per-slide", _per_slide_pptx), ("builder", tool._create_pptx)):
+            started = time.perf_counter()
+            data = render(instr)
+            elapsed = time.perf_counter() - started
+            print(
+                f"{count:>6} {engine:<10} {elapsed:>8.2f} {count / elapsed:>9.1f}"
+                f" {len(data) / 1e6:>7.2f}MB {_embedded_workbooks(data):>10}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Comparative benchmark of the xlsx writer backends (_XLSX_BACKENDS): render time, peak
+Python heap (tracemalloc, in a separate run) and output size for the same
+ExcelInstructions, a write-heavy export of numbers and strings with a few formulas,
+number formats and a conditional format.
+
+    python benchmarks/bench_xlsx_backends.py
+    python benchmarks/bench_xlsx_backends.py --rows 10000 100000 --cols 12
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from bulk_runner import _load_tool  # noqa: E402
+
+
+def _export(tool: Any, rows: int, cols: int) -> Any:
+    header = [f"col{c + 1}" for c in range(cols)]
+    data = [header] + [
+        [f"row {r}" if c == 0 else r * cols + c + 0.5 for c in range(cols)] for r in range(rows)
+    ]
+    return tool.ExcelInstructions(
+        sheets=[
+            {
+                "name": "Export",
+                "data": data,
+                "formulas": {f"{chr(65 + cols)}{r + 2}": f"=SUM(B{r + 2}:{chr(64 + cols)}{r + 2})" for r in range(100)},
+                "number_formats": {f"B{r + 2}": "#,##0.00" for r in range(100)},
+                "column_widths": {1: 18},
+                "conditional_formatting": [
+                    {"type": "cellIs", "range": f"B2:B{rows + 1}", "operator": "greaterThan", "formula": "1000"}
+                ],
+            }
+        ]
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--cols", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    tool = _load_tool("office_document_tool")
+    print(f"{'cells':>9} {'backend':<10} {'seconds':>8} {'cells/s':>10} {'peak heap':>10} {'size':>9}")
+    for rows in args.rows:
+        instr = _export(tool, rows, args.cols)
+        cells = tool._xlsx_cell_count(instr)
+        for name, backend in tool._XLSX_BACKENDS.items():
+            reason = backend.unsupported(instr, None)
+            if reason:
+                print(f"{cells:>9} {name:<10} skipped: {reason}")
+                continue
+            started = time.perf_counter()
+            data = backend.render(instr)
+            elapsed = time.perf_counter() - started
+            tracemalloc.start()  # a second, traced run: tracing would skew the timing
+            backend.render(instr)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(
+                f"{cells:>9} {name:<10} {elapsed:>8.2f} {cells / elapsed:>10,.0f}"
+                f" {peak / 1e6:>8.1f}MB {len(data) / 1e6:>7.2f}MB"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
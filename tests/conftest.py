@@ -0,0 +1,20 @@
+"""Load the tool modules the way bulk_runner does, so Open WebUI is not needed."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+
+from bulk_runner import _load_tool  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def office_tool():
+    return _load_tool("office_document_tool")
+
+
+@pytest.fixture(scope="session")
+def pdf_tool():
+    return _load_tool("pdf_document_tool")
@@ -0,0 +1,87 @@
+"""
+Concurrent tool calls against throttled Storage/Files/Users stand-ins (load_test.py):
+slow uploads and lookups must wait in worker threads, not on the event loop, and every
+upload must get its own file record.
+"""
+
+import asyncio
+import re
+
+import pytest
+from load_test import (
+    RecordingEmitter,
+    StubBackend,
+    _builtin_payloads,
+    _LagSampler,
+    _StubFileForm,
+    _tool_call,
+)
+
+STORAGE_LATENCY_S = 0.2
+DB_LATENCY_S = 0.05
+USERS = 6
+REQUESTS = 2
+
+
+class _RecordingBackend(StubBackend):
+    """StubBackend that also keeps every file record it was asked to insert."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.records = []
+
+    def insert_new_file(self, user_id, form):
+        record = super().insert_new_file(user_id, form)
+        with self._lock:
+            self.records.append((user_id, form.id, form.path))
+        return record
+
+
+@pytest.fixture
+def backend(office_tool, pdf_tool, monkeypatch):
+    stub = _RecordingBackend(STORAGE_LATENCY_S, DB_LATENCY_S)
+    for module in (office_tool, pdf_tool):
+        for name in ("Storage", "Files", "Users"):
+            monkeypatch.setattr(module, name, stub)
+        monkeypatch.setattr(module, "FileForm", _StubFileForm)
+        monkeypatch.setattr(module, "_USER_CACHE", module._TTLCache(maxsize=64, ttl=60))
+    return stub
+
+
+async def _run(tools, items):
+    sampler = _LagSampler(0.005)
+    replies = []
+
+    async def user(index):
+        for n in range(REQUESTS):
+            item = items[(index + n) % len(items)]
+            replies.append(await _tool_call(tools, item, f"user-{index}", RecordingEmitter()))
+
+    sampler.start()
+    await asyncio.gather(*(user(i) for i in range(USERS)))
+    await sampler.stop()
+    return replies, sampler.samples
+
+
+def test_concurrent_calls_keep_the_loop_free(office_tool, pdf_tool, backend):
+    payloads = _builtin_payloads()
+    items = [dict(payloads[name], id=name) for name in ("pdf-letter", "docx-memo", "pdf-letter", "pptx-deck")]
+    tools = {"pdf": pdf_tool.Tools(), "office": office_tool.Tools()}
+    # Warm imports, fonts and caches so the timed calls measure the steady state
+    for item in items[:2] + items[3:]:
+        asyncio.run(_tool_call(tools, item, "warmup", RecordingEmitter()))
+    backend.records.clear()
+
+    replies, lags = asyncio.run(_run(tools, items))
+
+    assert all("is ready:" in reply for reply in replies), replies
+    # Each call sleeps STORAGE_LATENCY_S + DB_LATENCY_S in the stubs; had any of that
+    # run on the loop, the sampler would have woken that much late at least once.
+    assert lags and max(lags) < STORAGE_LATENCY_S * 1000 / 2, max(lags)
+
+    calls = USERS * REQUESTS
+    ids = [file_id for _, file_id, _ in backend.records]
+    assert len(ids) == len(set(ids)) == calls
+    assert len({path for _, _, path in backend.records}) == calls
+    assert sorted(re.search(r"file_id `([^`]+)`", r).group(1) for r in replies) == sorted(ids)
+    assert {user for user, _, _ in backend.records} == {f"user-{i}" for i in range(USERS)}
@@ -0,0 +1,58 @@
+"""Merge records render in the shared worker pool; only pool failures fall back."""
+
+import base64
+import io
+
+import pytest
+from docx import Document
+from pypdf import PdfReader
+
+
+def _jobs(tool, name, n=4, image=None):
+    images = [{"b64": image, "width_inches": 1}] if image else []
+    if name == "pdf_tool":
+        return [tool.PdfInstructions(paragraphs=[{"text": f"Record {i}"}], images=images) for i in range(n)]
+    return [
+        ("docx", tool.WordInstructions(paragraphs=[{"text": f"Record {i}"}], images=images), "", None, 0)
+        for i in range(n)
+    ]
+
+
+def _text(name, data):
+    if name == "pdf_tool":
+        return PdfReader(io.BytesIO(data)).pages[0].extract_text()
+    return "\n".join(p.text for p in Document(io.BytesIO(data)).paragraphs)
+
+
+@pytest.fixture(params=["office_tool", "pdf_tool"])
+def tool(request):
+    return request.param, request.getfixturevalue(request.param)
+
+
+def test_records_render_in_workers(tool):
+    name, module = tool
+    parts = module._render_records(_jobs(module, name), workers=2)
+    assert all(f"Record {i}" in _text(name, part) for i, part in enumerate(parts))
+
+
+def test_render_errors_in_workers_propagate(tool):
+    name, module = tool
+    bad = base64.b64encode(b"not an image").decode()
+    with pytest.raises(Exception) as raised:
+        module._render_records(_jobs(module, name, image=bad), workers=2)
+    assert not isinstance(raised.value, module._POOL_ERRORS)
+
+
+def test_broken_pool_falls_back_to_serial(tool, monkeypatch):
+    name, module = tool
+
+    class _Broken:
+        def map(self, *args, **kwargs):
+            raise module.BrokenProcessPool("worker died")
+
+        def shutdown(self, wait=True):
+            pass
+
+    monkeypatch.setattr(module._WORKERS, "_get", lambda workers: _Broken())
+    parts = module._render_records(_jobs(module, name), workers=2)
+    assert all(f"Record {i}" in _text(name, part) for i, part in enumerate(parts))
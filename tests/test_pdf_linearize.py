@@ -0,0 +1,52 @@
+"""Linearized ("fast web view") output: the linearization dictionary is present and valid."""
+
+import io
+import shutil
+
+import pytest
+from pypdf import PdfReader
+
+
+@pytest.fixture
+def report(pdf_tool):
+    paras = [{"text": f"Section {n}. " + "Body text. " * 80} for n in range(40)]
+    return pdf_tool._create_pdf(pdf_tool.PdfInstructions(title="Report", paragraphs=paras))
+
+
+@pytest.fixture
+def linearizer(pdf_tool):
+    if pdf_tool.pikepdf is None and not shutil.which("qpdf"):
+        pytest.skip("neither pikepdf nor qpdf is available")
+
+
+def test_linearization_dictionary(pdf_tool, report, linearizer):
+    out, stats = pdf_tool._linearize(report)
+    info = pdf_tool._linearization_info(out)
+
+    assert info is not None
+    assert {"L", "E", "N", "O", "T"} <= info.keys()
+    assert info["L"] == len(out)
+    assert info["N"] == len(PdfReader(io.BytesIO(out)).pages)
+    assert 0 < info["E"] < len(out)
+    assert 0 < info["T"] < len(out)
+    assert stats["linearized"] is True
+    assert stats["first_page_end"] == info["E"]
+    assert stats["size_after"] - stats["size_before"] == stats["overhead_bytes"]
+
+
+def test_linearization_dictionary_is_first_object(pdf_tool, report, linearizer):
+    out, _ = pdf_tool._linearize(report)
+    header_end = out.index(b"obj")
+    assert b"/Linearized" in out[header_end : header_end + 200]
+
+
+def test_unlinearized_input_has_no_dictionary(pdf_tool, report):
+    assert pdf_tool._linearization_info(report) is None
+
+
+def test_without_linearizer_returns_input(pdf_tool, report, monkeypatch):
+    monkeypatch.setattr(pdf_tool, "pikepdf", None)
+    monkeypatch.setattr(pdf_tool.shutil, "which", lambda name: None)
+    out, stats = pdf_tool._linearize(report)
+    assert out is report
+    assert stats["linearized"] is False
@@ -0,0 +1,26 @@
+"""output_formats=['pdf', 'docx']: the Word twin renders in a worker, or serially after a pool failure."""
+
+import io
+
+from docx import Document
+
+
+def _instr(pdf_tool):
+    return pdf_tool.PdfInstructions(paragraphs=[{"text": "Quarterly summary", "style": "Heading 1"}])
+
+
+def test_docx_twin_renders_in_worker(pdf_tool):
+    out = pdf_tool._render_outputs(_instr(pdf_tool), ["pdf", "docx"], workers=2)
+    assert list(out) == ["pdf", "docx"]
+    assert out["pdf"].startswith(b"%PDF")
+    assert Document(io.BytesIO(out["docx"])).paragraphs[0].text == "Quarterly summary"
+
+
+def test_broken_pool_renders_docx_serially(pdf_tool, monkeypatch):
+    class _Broken:
+        def result(self):
+            raise pdf_tool.BrokenProcessPool("worker died")
+
+    monkeypatch.setattr(pdf_tool._WORKERS, "submit", lambda fn, item, workers: _Broken())
+    out = pdf_tool._render_outputs(_instr(pdf_tool), ["pdf", "docx"], workers=2)
+    assert Document(io.BytesIO(out["docx"])).paragraphs[0].text == "Quarterly summary"
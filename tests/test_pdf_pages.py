@@ -0,0 +1,174 @@
+"""Page operations: combine, extract and split through the streaming writer."""
+
+import base64
+import io
+import zipfile
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import NullObject
+
+
+def _raw_pdf(pages, link_to=None):
+    """
+    A hand-written PDF whose /Pages node carries /Resources, /MediaBox and /Rotate for
+    every page; page 1 has a link annotation to page `link_to` (1-based).
+    """
+    first_page = 5
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        2: b"<< /Type /Pages /Kids [%s] /Count %d /MediaBox [0 0 300 400] /Rotate 90"
+        b" /Resources << /Font << /F1 3 0 R >> >> >>"
+        % (b" ".join(b"%d 0 R" % (first_page + 2 * i) for i in range(pages)), pages),
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    if link_to:
+        objects[4] = b"<< /Type /Annot /Subtype /Link /Rect [0 0 50 50] /Dest [%d 0 R /Fit] >>" % (
+            first_page + 2 * (link_to - 1)
+        )
+    for i in range(pages):
+        num = first_page + 2 * i
+        annots = b" /Annots [4 0 R]" if link_to and i == 0 else b""
+        objects[num] = b"<< /Type /Page /Parent 2 0 R /Contents %d 0 R%s >>" % (num + 1, annots)
+        text = b"BT /F1 24 Tf 20 200 Td (Page %d) Tj ET" % (i + 1)
+        objects[num + 1] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(text), text)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.7\n")
+    size = max(objects) + 1
+    offsets = [0] * size
+    for num in sorted(objects):
+        offsets[num] = out.tell()
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (num, objects[num]))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+    for num in range(1, size):
+        out.write(b"%010d 00000 %s \n" % (offsets[num], b"n" if num in objects else b"f"))
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref))
+    return out.getvalue()
+
+
+def _texts(data):
+    return [page.extract_text().strip() for page in PdfReader(io.BytesIO(data)).pages]
+
+
+def _attached(name, data):
+    return {"name": name, "content": base64.b64encode(data).decode()}
+
+
+def test_combine_keeps_order_count_and_bookmarks_each_source(pdf_tool):
+    files = [_attached("a.pdf", _raw_pdf(2)), _attached("b.pdf", _raw_pdf(3)), _attached("c.pdf", _raw_pdf(1))]
+    data, count = pdf_tool._combine_pdfs(files)
+    assert count == 6
+    assert _texts(data) == ["Page 1", "Page 2", "Page 1", "Page 2", "Page 3", "Page 1"]
+
+    reader = PdfReader(io.BytesIO(data))
+    assert [(item.title, reader.get_destination_page_number(item)) for item in reader.outline] == [
+        ("a", 0),
+        ("b", 2),
+        ("c", 5),
+    ]
+
+
+def test_inherited_page_attributes_are_copied_onto_each_page(pdf_tool):
+    data, _ = pdf_tool._extract_pages(_raw_pdf(3), "2-3")
+    for page in PdfReader(io.BytesIO(data)).pages:
+        assert [float(v) for v in page["/MediaBox"]] == [0, 0, 300, 400]
+        assert page["/Rotate"] == 90
+        assert page["/Resources"]["/Font"]["/F1"]["/BaseFont"] == "/Helvetica"
+    assert _texts(data) == ["Page 2", "Page 3"]
+
+
+def test_extract_follows_spec_order(pdf_tool):
+    data, count = pdf_tool._extract_pages(_raw_pdf(5), "4-5, 1")
+    assert count == 3
+    assert _texts(data) == ["Page 4", "Page 5", "Page 1"]
+
+
+def _link_dest(data):
+    return PdfReader(io.BytesIO(data)).pages[0]["/Annots"][0].get_object()["/Dest"][0]
+
+
+def test_link_to_unselected_page_becomes_null(pdf_tool):
+    data, _ = pdf_tool._extract_pages(_raw_pdf(3, link_to=3), "1-2")
+    assert isinstance(_link_dest(data), NullObject)
+
+
+def test_link_to_selected_page_follows_it(pdf_tool):
+    data, _ = pdf_tool._extract_pages(_raw_pdf(3, link_to=3), "1, 3")
+    reader = PdfReader(io.BytesIO(data))
+    assert _link_dest(data).idnum == reader.pages[1].indirect_reference.idnum
+
+
+@pytest.mark.parametrize(
+    "spec, message",
+    [
+        ("0-2", "outside 1-5"),
+        ("3-2", "outside 1-5"),
+        ("4-9", "outside 1-5"),
+        ("6", "outside 1-5"),
+        ("", "names no pages"),
+        (" , ", "names no pages"),
+        ("1-2-3", "Invalid page range"),
+        ("two", "Invalid page range"),
+    ],
+)
+def test_page_range_errors(pdf_tool, spec, message):
+    with pytest.raises(ValueError, match=message):
+        pdf_tool._page_ranges(spec, 5)
+
+
+def test_page_ranges_open_end(pdf_tool):
+    assert pdf_tool._page_ranges("1-2, 4, 3-", 5) == [(0, 2), (3, 4), (2, 5)]
+
+
+def _parts(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        return {name: _texts(zf.read(name)) for name in zf.namelist()}
+
+
+def test_split_every_names_parts_by_page_range(pdf_tool):
+    data, parts = pdf_tool._split_pdf(_raw_pdf(5), None, 2, "report")
+    assert parts == 3
+    assert _parts(data) == {
+        "report-p1-2.pdf": ["Page 1", "Page 2"],
+        "report-p3-4.pdf": ["Page 3", "Page 4"],
+        "report-p5.pdf": ["Page 5"],
+    }
+
+
+def test_split_by_spec_makes_one_part_per_range(pdf_tool):
+    data, parts = pdf_tool._split_pdf(_raw_pdf(5), "2, 3-", None, "report")
+    assert parts == 2
+    assert _parts(data) == {
+        "report-p2.pdf": ["Page 2"],
+        "report-p3-5.pdf": ["Page 3", "Page 4", "Page 5"],
+    }
+
+
+def test_split_needs_every_or_pages(pdf_tool):
+    with pytest.raises(ValueError, match="split_every"):
+        pdf_tool._split_pdf(_raw_pdf(2), None, None, "report")
+
+
+def _encrypted(data, password):
+    writer = PdfWriter(clone_from=PdfReader(io.BytesIO(data)))
+    writer.encrypt(password)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def test_password_protected_input_is_refused(pdf_tool):
+    locked = _encrypted(_raw_pdf(2), "secret")
+    with pytest.raises(PermissionError, match="locked.pdf is password-protected"):
+        pdf_tool._combine_pdfs([_attached("locked.pdf", locked)])
+    with pytest.raises(PermissionError):
+        pdf_tool._extract_pages(locked, "1")
+
+
+def test_empty_user_password_is_opened(pdf_tool):
+    # Owner-password-only files open with the empty user password
+    data, count = pdf_tool._extract_pages(_encrypted(_raw_pdf(2), ""), "2")
+    assert count == 1
+    assert _texts(data) == ["Page 2"]
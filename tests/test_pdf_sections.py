@@ -0,0 +1,121 @@
+"""Sectioned PDF rendering: parallel output matches the serial render, errors surface."""
+
+import io
+import os
+import re
+import shutil
+
+import pytest
+import reportlab
+from PIL import Image
+from pypdf import PdfReader
+
+
+def _manual(pdf_tool, chapters=3):
+    paras = []
+    for c in range(chapters):
+        paras.append({"text": f"Chapter {c + 1}", "bold": True, "page_break_before": True})
+        paras += [{"text": f"Paragraph {c + 1}.{p + 1} " * 20} for p in range(12)]
+    return pdf_tool.PdfInstructions(paragraphs=paras, footer_text="Footer", show_page_numbers=True)
+
+
+def _pages(data):
+    """Text runs with their positions, per page (stamped numbers come last in the stream)."""
+    pages = []
+    for page in PdfReader(io.BytesIO(data)).pages:
+        runs = []
+        page.extract_text(
+            visitor_text=lambda text, cm, tm, *_: text.strip()
+            and runs.append((text, round(cm[4] + tm[4] * cm[0], 2), round(cm[5] + tm[5] * cm[3], 2)))
+        )
+        pages.append(sorted(runs))
+    return pages
+
+
+def test_parallel_sections_match_serial(pdf_tool):
+    instr = _manual(pdf_tool)
+    serial = _pages(pdf_tool._render_serial(instr))
+    assert _pages(pdf_tool._create_pdf(instr, workers=2)) == serial
+    assert any(text.strip() == "Page 5" for page in serial for text, _, _ in page)
+
+
+def test_stitching_errors_are_not_swallowed(pdf_tool, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("stamp failed")
+
+    monkeypatch.setattr(pdf_tool, "_stamp_pages", broken)
+    cache = pdf_tool._TTLCache(maxsize=8, ttl=60)
+    with pytest.raises(RuntimeError, match="stamp failed"):
+        pdf_tool._create_pdf(_manual(pdf_tool), workers=1, section_cache=cache)
+
+
+def test_broken_pool_falls_back_to_serial(pdf_tool, monkeypatch):
+    class _Broken:
+        def map(self, *args, **kwargs):
+            raise pdf_tool.BrokenProcessPool("worker died")
+
+        def shutdown(self, wait=True):
+            pass
+
+    monkeypatch.setattr(pdf_tool._WORKERS, "_get", lambda workers: _Broken())
+    instr = _manual(pdf_tool)
+    assert _pages(pdf_tool._create_pdf(instr, workers=2)) == _pages(pdf_tool._render_serial(instr))
+
+
+def _fonts(data):
+    return {
+        str(font["/BaseFont"])
+        for page in PdfReader(io.BytesIO(data)).pages
+        for font in page["/Resources"]["/Font"].values()
+    }
+
+
+def test_cached_sections_follow_font_dir(pdf_tool, monkeypatch, tmp_path):
+    vera = os.path.join(os.path.dirname(reportlab.__file__), "fonts", "Vera.ttf")
+    shutil.copy(vera, tmp_path / "Latoish-Regular.ttf")
+    monkeypatch.setattr(pdf_tool, "_FONT_DIR", pdf_tool._FontDirectory())
+    cache = pdf_tool._TTLCache(maxsize=8, ttl=60)
+    instr = _manual(pdf_tool)
+    for p in instr.paragraphs:
+        p.font_name = "Latoish"
+
+    before = pdf_tool._create_pdf(instr, workers=1, section_cache=cache)
+    pdf_tool._FONT_DIR.configure(str(tmp_path))
+    after = pdf_tool._create_pdf(instr, workers=1, section_cache=cache)
+
+    # Vera.ttf embeds as a subset named after its PostScript name
+    assert not any("Vera" in name for name in _fonts(before))
+    assert any("Vera" in name for name in _fonts(after))
+
+
+def test_section_key_follows_asset_file(pdf_tool, monkeypatch, tmp_path):
+    Image.new("RGB", (4, 4), "red").save(tmp_path / "logo.png")
+    monkeypatch.setattr(pdf_tool, "_ASSETS", pdf_tool._AssetStore())
+    pdf_tool._ASSETS.configure(str(tmp_path), 8)
+    section = pdf_tool.PdfInstructions(images=[{"asset_id": "logo", "width_inches": 1}])
+
+    key = pdf_tool._section_key(section)
+    assert pdf_tool._section_key(section) == key
+    os.utime(tmp_path / "logo.png", (1, 1))
+    assert pdf_tool._section_key(section) != key
+
+
+def _page_labels(data):
+    return [
+        re.findall(r"Page \d+(?: of \d+)?", page.extract_text())[-1]
+        for page in PdfReader(io.BytesIO(data)).pages
+    ]
+
+
+def test_total_pages_on_every_page(pdf_tool):
+    instr = _manual(pdf_tool).model_copy(update={"show_total_pages": True})
+    serial = pdf_tool._render_serial(instr)
+    sectioned = pdf_tool._create_pdf(instr, workers=1, section_cache=pdf_tool._TTLCache(maxsize=8, ttl=60))
+
+    total = len(PdfReader(io.BytesIO(serial)).pages)
+    assert total > 3
+    expected = [f"Page {i} of {total}" for i in range(1, total + 1)]
+    assert _page_labels(serial) == expected
+    assert _page_labels(sectioned) == expected
+    # The stitched render stamps the label where the deferred canvas draws it
+    assert _pages(sectioned) == _pages(serial)
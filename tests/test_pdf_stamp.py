@@ -0,0 +1,99 @@
+"""stamp_existing: foreign pages get the document's furniture without re-layout."""
+
+import io
+import re
+
+from pypdf import PdfReader
+from reportlab.lib.pagesizes import A4, LETTER, landscape
+from reportlab.pdfgen.canvas import Canvas
+
+SIZES = [LETTER, LETTER, landscape(A4)]
+
+
+def _foreign(sizes=SIZES):
+    """Pages as another producer would write them, leaving a graphics state dirty."""
+    buf = io.BytesIO()
+    canv = Canvas(buf)
+    for i, size in enumerate(sizes):
+        canv.setPageSize(size)
+        canv.setFont("Times-Roman", 14)
+        canv.drawString(72, 500, f"Existing {i + 1}")
+        canv._code.append("0 0 1 rg 3 0 0 3 0 0 cm")  # left in effect at the end of the page
+        canv.showPage()
+    canv.save()
+    return buf.getvalue()
+
+
+def _stamped(pdf_tool, **kwargs):
+    kwargs.setdefault("paragraphs", [{"text": "Appended section"}])
+    instr = pdf_tool.PdfInstructions(stamp_existing=True, **kwargs)
+    return PdfReader(io.BytesIO(pdf_tool._modify_pdf(_foreign(), instr)))
+
+
+def _label(page):
+    return re.findall(r"Page \d+(?: of \d+)?", page.extract_text())[-1]
+
+
+def test_existing_pages_get_furniture_and_continuous_numbers(pdf_tool):
+    reader = _stamped(
+        pdf_tool,
+        header_text="Acme header",
+        footer_text="Acme footer",
+        watermark_text="DRAFT",
+        show_total_pages=True,
+    )
+    total = len(reader.pages)
+    assert total == len(SIZES) + 1
+    for number, page in enumerate(reader.pages, start=1):
+        text = page.extract_text()
+        assert "Acme header" in text and "Acme footer" in text and "DRAFT" in text
+        assert _label(page) == f"Page {number} of {total}"
+    assert "Existing 2" in reader.pages[1].extract_text()
+    assert "Appended section" in reader.pages[-1].extract_text()
+
+
+def _forms(page):
+    xobjects = page["/Resources"].get("/XObject", {})
+    return {name: xobjects.raw_get(name).idnum for name in xobjects}
+
+
+def test_overlay_is_one_shared_form_per_page_size(pdf_tool):
+    reader = _stamped(pdf_tool, header_text="Acme header", watermark_text="DRAFT")
+    existing = [_forms(page) for page in reader.pages[: len(SIZES)]]
+    assert all(len(forms) == 1 for forms in existing)
+    assert existing[0] == existing[1]  # same size: the very same object
+    assert existing[0] != existing[2]
+    # Appended pages drew the furniture themselves
+    assert _forms(reader.pages[-1]) == {}
+    for page in reader.pages[: len(SIZES)]:
+        form = next(iter(page["/Resources"]["/XObject"].values())).get_object()
+        assert [float(v) for v in form["/BBox"]][2:] == [float(page.mediabox.width), float(page.mediabox.height)]
+
+
+def test_original_content_is_wrapped_in_q_Q(pdf_tool):
+    reader = _stamped(pdf_tool, header_text="Acme header")
+    for page in reader.pages[: len(SIZES)]:
+        parts = [ref.get_object().get_data() for ref in page.raw_get("/Contents")]
+        assert parts[0] == b"q"
+        assert b"Existing" in b"".join(parts[1:-1])
+        # The stamp first restores the page's state, then draws in a fresh one
+        assert parts[-1].startswith(b"Q q ")
+        assert re.search(rb"/DocStamp\d Do Q", parts[-1])
+    appended = reader.pages[-1].raw_get("/Contents")
+    assert not isinstance(appended, list) or appended[0].get_object().get_data() != b"q"
+
+
+def test_header_alone_adds_no_blank_page(pdf_tool):
+    reader = _stamped(pdf_tool, header_text="Acme header", paragraphs=[])
+    assert len(reader.pages) == len(SIZES)
+    for number, page in enumerate(reader.pages, start=1):
+        assert "Acme header" in page.extract_text()
+        assert _label(page) == f"Page {number}"
+
+
+def test_without_stamp_existing_pages_are_untouched(pdf_tool):
+    instr = pdf_tool.PdfInstructions(header_text="Acme header", paragraphs=[{"text": "Appended"}])
+    reader = PdfReader(io.BytesIO(pdf_tool._modify_pdf(_foreign(), instr)))
+    assert len(reader.pages) == len(SIZES) + 1
+    assert "Acme header" not in reader.pages[0].extract_text()
+    assert "Acme header" in reader.pages[-1].extract_text()
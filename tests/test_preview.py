@@ -0,0 +1,55 @@
+"""Previews stage a 'modify' whenever the commit would have a source document to edit."""
+
+import asyncio
+import base64
+import re
+
+import pytest
+
+
+def _source(tool, name):
+    if name == "pdf_tool":
+        return "pdf", ".pdf", tool._create_pdf(tool.PdfInstructions(paragraphs=[{"text": "Original"}]))
+    return "docx", ".docx", tool._create_docx(tool.WordInstructions(paragraphs=[{"text": "Original"}]))
+
+
+@pytest.fixture(params=["office_tool", "pdf_tool"])
+def tool(request):
+    module = request.getfixturevalue(request.param)
+    file_type, ext, data = _source(module, request.param)
+    entry = getattr(module.Tools(), "office_document_tool" if request.param == "office_tool" else "pdf_document_tool")
+
+    def preview(**kwargs):
+        kwargs.setdefault("instructions", {"paragraphs": [{"text": "Added"}]})
+        reply = asyncio.run(entry(file_type=file_type, operation="preview", __user__={"id": "u1"}, **kwargs))
+        found = re.search(r"preview_id='(\w+)'", reply)
+        return module._PREVIEWS.get(found.group(1)) if found else reply
+
+    return module, ext, data, preview
+
+
+def test_attachment_without_hint_previews_a_modify(tool):
+    module, ext, data, preview = tool
+    staged = preview(__files__=[{"name": f"report{ext}", "content": base64.b64encode(data).decode()}])
+    assert staged["params"].operation == "modify"
+    assert module._SOURCES.data(*staged["source"]) == data
+
+
+def test_no_source_previews_a_create(tool):
+    module, ext, data, preview = tool
+    staged = preview(__files__=[{"name": "notes.txt", "content": base64.b64encode(b"x").decode()}])
+    assert staged["params"].operation == "create"
+    assert staged["source"] is None
+
+
+def test_preview_honours_base_file_id(tool):
+    module, ext, data, preview = tool
+    module._SOURCES.add("u1:", data, "earlier")
+    staged = preview(base_file_id="earlier")
+    assert staged["params"].operation == "modify"
+    assert module._SOURCES.data(*staged["source"]) == data
+
+
+def test_unknown_base_file_id_is_reported(tool):
+    module, ext, data, preview = tool
+    assert "base_file_id" in preview(base_file_id="missing")
@@ -0,0 +1,103 @@
+"""
+Helpers both single-file tools carry a copy of. Open WebUI installs each tool as one
+file, so they cannot import a common module; these tests keep the copies identical
+and cover their behaviour once.
+"""
+
+import inspect
+
+import pytest
+
+SHARED = [
+    "_TTLCache",
+    "_request_profile",
+    "_lookup_user_profile",
+    "_invalidate_user_profile",
+    "_run_blocking",
+    "_AssetStore",
+    "_apply_json_patch",
+    "_read_own_source",
+    "_WorkerPool",
+    "_attachment_bytes",
+    "_pick_attached_file",
+    "_find_attached_file",
+]
+
+
+@pytest.mark.parametrize("name", SHARED)
+def test_copies_are_identical(office_tool, pdf_tool, name):
+    assert inspect.getsource(getattr(office_tool, name)) == inspect.getsource(getattr(pdf_tool, name))
+
+
+def test_worker_bootstrap_is_identical(office_tool, pdf_tool):
+    assert office_tool._WORKER_BOOTSTRAP == pdf_tool._WORKER_BOOTSTRAP
+    assert office_tool._POOL_ERRORS == pdf_tool._POOL_ERRORS
+
+
+class _User:
+    def __init__(self, email, name):
+        self.email, self.name = email, name
+
+
+class _Users:
+    def __init__(self):
+        self.profiles = {"u1": _User("a@example.com", "Ann")}
+        self.calls = 0
+
+    def get_user_by_id(self, user_id):
+        self.calls += 1
+        return self.profiles.get(user_id)
+
+
+@pytest.fixture(params=["office_tool", "pdf_tool"])
+def tool(request, monkeypatch):
+    module = request.getfixturevalue(request.param)
+    monkeypatch.setattr(module, "Users", _Users())
+    monkeypatch.setattr(module, "_USER_CACHE", module._TTLCache(maxsize=8, ttl=60))
+    return module
+
+
+def test_profile_is_cached(tool):
+    assert tool._lookup_user_profile("u1") == (("a@example.com", "Ann"), False)
+    assert tool._lookup_user_profile("u1") == (("a@example.com", "Ann"), True)
+    assert tool.Users.calls == 1
+
+
+def test_request_profile_is_used_without_db(tool):
+    current = tool._request_profile({"id": "u1", "email": "a@example.com", "name": "Ann"})
+    assert tool._lookup_user_profile("u1", current) == (("a@example.com", "Ann"), True)
+    assert tool.Users.calls == 0
+
+
+def test_renamed_user_refreshes_cached_profile(tool):
+    tool._lookup_user_profile("u1")
+    current = tool._request_profile({"id": "u1", "email": "a@example.com", "name": "Ann Lee"})
+    assert tool._lookup_user_profile("u1", current) == (("a@example.com", "Ann Lee"), True)
+    # A later request without profile fields gets the new name from the cache
+    assert tool._lookup_user_profile("u1") == (("a@example.com", "Ann Lee"), True)
+    assert tool.Users.calls == 1
+
+
+def test_request_without_profile_keeps_cache(tool):
+    tool._lookup_user_profile("u1")
+    assert tool._request_profile({"id": "u1", "role": "user"}) is None
+    assert tool._lookup_user_profile("u1", None)[1] is True
+
+
+def test_explicit_invalidation(tool):
+    tool._lookup_user_profile("u1")
+    tool._invalidate_user_profile("u1")
+    assert tool._lookup_user_profile("u1")[1] is False
+    tool._invalidate_user_profile()
+    assert tool._lookup_user_profile("u1")[1] is False
+    assert tool.Users.calls == 3
+
+
+def test_ttl_cache_size_and_expiry(office_tool):
+    cache = office_tool._TTLCache(maxsize=2, ttl=60)
+    for key in "abc":
+        cache.put(key, key.upper())
+    assert cache.get("a") is None
+    assert cache.get("c") == "C"
+    cache.configure(2, 0)
+    assert cache.get("c") is None
@@ -0,0 +1,58 @@
+"""Source documents of repeated 'modify' calls: file-id index and attachment picking."""
+
+import base64
+
+import pytest
+
+
+@pytest.fixture(params=["office_tool", "pdf_tool"])
+def tool(request, monkeypatch):
+    module = request.getfixturevalue(request.param)
+    monkeypatch.setattr(module, "_SOURCES", module._SourceCache())
+    ext = ".pdf" if request.param == "pdf_tool" else ".docx"
+
+    def source(files, hint=None):
+        args = (files,) if ext == ".pdf" else (ext, files)
+        return module._source_document("u1:c1", *args, hint, None, False)
+
+    return module, ext, source
+
+
+def _file(file_id, name, data=None):
+    entry = {"id": file_id, "name": name}
+    if data is not None:
+        entry["content"] = base64.b64encode(data).decode()
+    return entry
+
+
+def test_eviction_drops_file_ids(tool):
+    module, _, _ = tool
+    cache = module._SourceCache(max_bytes=10)
+    cache.add("s", b"a" * 8, "f1")
+    cache.add("s", b"b" * 8, "f2")
+    assert cache.lookup("s", "f2") is not None
+    assert ("s", "f1") not in cache._file_ids
+
+
+def test_unreadable_attachment_is_skipped_for_id_and_data(tool):
+    module, ext, source = tool
+    files = [_file("empty", f"a{ext}"), _file("full", f"b{ext}", b"payload")]
+    assert module._pick_attached_file(ext, files) == ("full", f"b{ext}", b"payload")
+    digest, data = source(files)
+    assert data == b"payload"
+    assert module._SOURCES.lookup("u1:c1", "full") == (digest, data)
+    assert module._SOURCES.lookup("u1:c1", "empty") is None
+
+
+def test_hint_wins_over_order(tool):
+    module, ext, source = tool
+    files = [_file("one", f"a{ext}", b"first"), _file("two", f"b{ext}", b"second")]
+    assert source(files, hint=f"B{ext}")[1] == b"second"
+    assert module._SOURCES.lookup("u1:c1", "two") is not None
+
+
+def test_known_attachment_is_not_decoded_again(tool):
+    module, ext, source = tool
+    digest = module._SOURCES.add("u1:c1", b"payload", "seen")
+    files = [{"id": "seen", "name": f"a{ext}", "content": "not base64"}]
+    assert source(files) == (digest, b"payload")
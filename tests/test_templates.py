@@ -0,0 +1,117 @@
+"""Template registries: parsed once per mtime, independent checkouts, clear errors."""
+
+import io
+import os
+
+import pytest
+from openpyxl import Workbook
+from pptx import Presentation
+from pypdf import PdfReader
+
+
+def _save(path, document):
+    document.save(str(path))
+    return path
+
+
+def _templates(office_tool, tmp_path):
+    doc = office_tool.DocxDocument()
+    doc.add_paragraph("Letterhead")
+    _save(tmp_path / "letter.docx", doc)
+    prs = Presentation()
+    prs.slides.add_slide(prs.slide_layouts[6])
+    _save(tmp_path / "deck.pptx", prs)
+    wb = Workbook()
+    wb.active["A1"] = "Header"
+    _save(tmp_path / "book.xlsx", wb)
+
+
+@pytest.fixture
+def registry(office_tool, tmp_path):
+    _templates(office_tool, tmp_path)
+    return office_tool._TemplateRegistry()
+
+
+def test_checkouts_are_independent(registry, tmp_path):
+    first = registry.checkout(str(tmp_path), "letter", "docx")
+    first.add_paragraph("Only in the first checkout")
+    assert [p.text for p in registry.checkout(str(tmp_path), "letter", "docx").paragraphs] == ["Letterhead"]
+
+    deck = registry.checkout(str(tmp_path), "deck", "pptx")
+    deck.slides.add_slide(deck.slide_layouts[6])
+    assert len(registry.checkout(str(tmp_path), "deck", "pptx").slides) == 1
+
+    book = registry.checkout(str(tmp_path), "book", "xlsx")
+    book.active["A1"] = "Changed"
+    assert registry.checkout(str(tmp_path), "book", "xlsx").active["A1"].value == "Header"
+
+
+def test_parsed_once_until_mtime_changes(office_tool, registry, tmp_path, monkeypatch):
+    calls = []
+    parse = office_tool.DocxDocument
+    monkeypatch.setattr(office_tool, "DocxDocument", lambda *a: calls.append(1) or parse(*a))
+
+    registry.checkout(str(tmp_path), "letter", "docx")
+    registry.checkout(str(tmp_path), "letter", "docx")
+    assert len(calls) == 1
+
+    doc = parse()
+    doc.add_paragraph("New letterhead")
+    doc.save(str(tmp_path / "letter.docx"))
+    os.utime(tmp_path / "letter.docx", (1, 1))
+    fresh = registry.checkout(str(tmp_path), "letter", "docx")
+    assert len(calls) == 2
+    assert fresh.paragraphs[0].text == "New letterhead"
+
+
+@pytest.mark.parametrize(
+    "template_dir, template_id, error",
+    [
+        ("", "letter", PermissionError),
+        (None, "missing", FileNotFoundError),
+        (None, "../letter", ValueError),
+        (None, ".hidden", ValueError),
+    ],
+)
+def test_office_errors(registry, tmp_path, template_dir, template_id, error):
+    with pytest.raises(error):
+        registry.checkout(str(tmp_path) if template_dir is None else template_dir, template_id, "docx")
+
+
+def test_wrong_extension_is_unknown(registry, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        registry.checkout(str(tmp_path), "letter", "pptx")
+
+
+def _letterhead(pdf_tool, path, text):
+    path.write_bytes(pdf_tool._create_pdf(pdf_tool.PdfInstructions(paragraphs=[{"text": text}])))
+
+
+def test_pdf_letterhead_reread_on_mtime(pdf_tool, tmp_path):
+    registry = pdf_tool._TemplateRegistry()
+    _letterhead(pdf_tool, tmp_path / "head.pdf", "Acme letterhead")
+    first = registry.get(str(tmp_path), "head")
+    assert "Acme" in first.pages[0].extract_text()
+    # Each get has its own reader, so concurrent letterhead passes never share one
+    assert registry.get(str(tmp_path), "head") is not first
+
+    _letterhead(pdf_tool, tmp_path / "head.pdf", "Globex letterhead")
+    os.utime(tmp_path / "head.pdf", (1, 1))
+    assert "Globex" in registry.get(str(tmp_path), "head").pages[0].extract_text()
+
+
+def test_pdf_letterhead_is_merged_beneath(pdf_tool, tmp_path):
+    _letterhead(pdf_tool, tmp_path / "head.pdf", "Acme letterhead")
+    body = pdf_tool._create_pdf(pdf_tool.PdfInstructions(paragraphs=[{"text": "Dear reader"}]))
+    out = pdf_tool._apply_letterhead(body, pdf_tool._TemplateRegistry().get(str(tmp_path), "head"))
+    text = PdfReader(io.BytesIO(out)).pages[0].extract_text()
+    assert "Acme letterhead" in text and "Dear reader" in text
+
+
+@pytest.mark.parametrize(
+    "template_dir, template_id, error",
+    [("", "head", PermissionError), (None, "missing", FileNotFoundError), (None, "a/b", ValueError)],
+)
+def test_pdf_errors(pdf_tool, tmp_path, template_dir, template_id, error):
+    with pytest.raises(error):
+        pdf_tool._TemplateRegistry().get(str(tmp_path) if template_dir is None else template_dir, template_id)
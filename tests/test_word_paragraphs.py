@@ -0,0 +1,95 @@
+"""Bulk Word paragraphs (_append_word_paragraphs) write what the object API would."""
+
+import io
+import zipfile
+
+import pytest
+from docx.enum.style import WD_STYLE_TYPE
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+PARAGRAPHS = [
+    {"text": "Annual report", "style": "Title"},
+    {"text": "Plain body text."},
+    {"text": "Bold body", "bold": True},
+    {"text": "Bold italic Arial", "bold": True, "italic": True, "font_name": "Arial"},
+    {"text": "Another plain paragraph."},
+    {"text": "Underlined 13.5pt", "underline": True, "font_size_pt": 13.5},
+    {"text": "Centred by its style", "style": "Centered"},
+    {"text": "Second bold body", "bold": True},
+    {"text": "Second centred", "style": "Centered"},
+    {"text": "Courier 9pt", "font_name": "Courier New", "font_size_pt": 9},
+    {"text": "Item\twith a tab", "bold": True},
+    {"text": "Two\nlines"},
+    {"text": "Carriage\rreturn", "style": "Centered"},
+    {"text": "   indented quote", "italic": True},
+    {"text": "trailing space ", "italic": True},
+    {"text": "", "style": "Centered"},
+    {"text": "Last of the Arial ones", "bold": True, "italic": True, "font_name": "Arial"},
+]
+
+
+@pytest.fixture
+def base(office_tool):
+    """A template with a custom centred paragraph style, saved so each path gets its own copy."""
+    doc = office_tool.DocxDocument()
+    style = doc.styles.add_style("Centered", WD_STYLE_TYPE.PARAGRAPH)
+    style.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    out = io.BytesIO()
+    doc.save(out)
+    return lambda: office_tool.DocxDocument(io.BytesIO(out.getvalue()))
+
+
+def _document_xml(doc):
+    out = io.BytesIO()
+    doc.save(out)
+    with zipfile.ZipFile(out) as zf:
+        return zf.read("word/document.xml")
+
+
+def _both(office_tool, base, paragraphs):
+    specs = [office_tool.ParagraphSpec(**p) for p in paragraphs]
+    reference, bulk = base(), base()
+    for spec in specs:
+        office_tool._add_word_paragraph(reference, spec)
+    office_tool._append_word_paragraphs(bulk, specs)
+    return reference, bulk
+
+
+def test_bulk_matches_object_api(office_tool, base):
+    reference, bulk = _both(office_tool, base, PARAGRAPHS)
+    assert _document_xml(bulk) == _document_xml(reference)
+
+
+def test_formatting_reads_back(office_tool, base):
+    _, bulk = _both(office_tool, base, PARAGRAPHS)
+    paras = bulk.paragraphs
+    assert [p.text for p in paras] == [p["text"].replace("\r", "\n") for p in PARAGRAPHS]
+    arial = paras[-1].runs[0]
+    assert (arial.bold, arial.italic, arial.font.name) == (True, True, "Arial")
+    assert paras[5].runs[0].font.size.pt == 13.5
+    assert paras[8].style.name == "Centered"
+    assert paras[8].style.paragraph_format.alignment == WD_ALIGN_PARAGRAPH.CENTER
+
+
+def test_special_characters_take_the_object_api(office_tool, base):
+    _, bulk = _both(office_tool, base, PARAGRAPHS)
+    body = _document_xml(bulk)
+    assert b"<w:tab/>" in body and b"<w:br/>" in body
+    assert b"\t" not in body
+    # A fallback paragraph still gets its formatting, cached or not
+    tab = bulk.paragraphs[10].runs[0]
+    assert tab.bold is True
+
+
+def test_edge_whitespace_is_preserved(office_tool, base):
+    _, bulk = _both(office_tool, base, PARAGRAPHS)
+    assert b'<w:t xml:space="preserve">   indented quote</w:t>' in _document_xml(bulk)
+    assert b'<w:t xml:space="preserve">trailing space </w:t>' in _document_xml(bulk)
+    assert [p.text for p in bulk.paragraphs[13:15]] == ["   indented quote", "trailing space "]
+
+
+def test_paragraphs_land_before_section_properties(office_tool, base):
+    _, bulk = _both(office_tool, base, PARAGRAPHS)
+    body = bulk.element.body
+    assert body[-1].tag == office_tool.qn("w:sectPr")
+    assert len(body.findall(office_tool.qn("w:p"))) == len(PARAGRAPHS)
@@ -0,0 +1,132 @@
+"""
+Conformance suite for the xlsx writer backends: every backend must render the same
+SheetSpec to a workbook that reads back identically (values, formulas, number
+formats, column widths, conditional formatting, chart ranges).
+"""
+
+import io
+
+import pytest
+from openpyxl import load_workbook
+
+BACKENDS = ["openpyxl", "streaming"]
+
+
+@pytest.fixture(params=BACKENDS)
+def render(request, office_tool):
+    backend = office_tool._XLSX_BACKENDS[request.param]
+    reason = backend.unsupported(office_tool.ExcelInstructions(), None)
+    if reason:
+        pytest.skip(reason)
+
+    def _render(**payload):
+        instr = office_tool.ExcelInstructions(**payload)
+        return load_workbook(io.BytesIO(backend.render(instr)))
+
+    return _render
+
+
+def _values(ws):
+    return [[cell.value for cell in row] for row in ws.iter_rows()]
+
+
+def test_grid_values(render):
+    data = [["Name", "Qty", "Price"], ["apple", 3, 1.25], ["pear", None, 0.5], ["", 7, -2]]
+    ws = render(sheets=[{"name": "Stock", "data": data}])["Stock"]
+    assert _values(ws) == [["Name", "Qty", "Price"], ["apple", 3, 1.25], ["pear", None, 0.5], [None, 7, -2]]
+
+
+def test_formulas_and_number_formats_inside_and_outside_grid(render):
+    ws = render(
+        sheets=[
+            {
+                "name": "Calc",
+                "data": [[1, 2], [3, 4]],
+                "formulas": {"C1": "=A1+B1", "B2": "=A2*2", "E5": "=SUM(A1:B2)"},
+                "number_formats": {"A1": "0.00%", "C1": "#,##0.00", "F7": "0.0"},
+            }
+        ]
+    )["Calc"]
+    assert ws["C1"].value == "=A1+B1"
+    assert ws["B2"].value == "=A2*2"
+    assert ws["E5"].value == "=SUM(A1:B2)"
+    assert ws["A2"].value == 3
+    assert ws["A1"].number_format == "0.00%"
+    assert ws["C1"].number_format == "#,##0.00"
+    assert ws["F7"].number_format == "0.0"
+
+
+def test_column_widths(render):
+    # xlsxwriter stores widths in whole pixels; Excel displays them in pixels anyway.
+    one_pixel = 1 / 7
+    ws = render(sheets=[{"name": "W", "data": [["a", "b"]], "column_widths": {1: 30, 3: 12.5}}])["W"]
+    assert ws.column_dimensions["A"].width == pytest.approx(30, abs=one_pixel)
+    assert ws.column_dimensions["C"].width == pytest.approx(12.5, abs=one_pixel)
+    assert ws.column_dimensions["B"].width in (None, 13)  # default
+
+
+def test_conditional_formatting(render):
+    ws = render(
+        sheets=[
+            {
+                "name": "CF",
+                "data": [[v] for v in range(10)],
+                "conditional_formatting": [
+                    {"type": "cellIs", "range": "A1:A10", "operator": "greaterThan", "formula": "5"},
+                    {"type": "colorScale", "range": "B1:B10"},
+                ],
+            }
+        ]
+    )["CF"]
+    rules = {str(cf.sqref): [r.type for r in cf.rules] for cf in ws.conditional_formatting}
+    assert rules == {"A1:A10": ["cellIs"], "B1:B10": ["colorScale"]}
+    (cell_is,) = [r for cf in ws.conditional_formatting for r in cf.rules if r.type == "cellIs"]
+    assert cell_is.operator == "greaterThan"
+    assert cell_is.formula == ["5"]
+
+
+@pytest.mark.parametrize(
+    "data_range, series",
+    [("A1:C3", ["$A$2:$A$3", "$B$2:$B$3", "$C$2:$C$3"]), ("AA1:AB3", ["$AA$2:$AA$3", "$AB$2:$AB$3"])],
+)
+def test_chart_data_range(render, data_range, series):
+    row = ["h1", "h2", "h3"]
+    data = [row, [1, 2, 3], [4, 5, 6]]
+    if data_range.startswith("AA"):
+        data = [[None] * 26 + r for r in data]
+    wb = render(sheets=[{"name": "Chart", "data": data}], chart={"type": "bar", "data_range": data_range})
+    (chart,) = wb["Chart"]._charts
+    refs = [s.val.numRef.f.split("!")[1] for s in chart.series]
+    assert refs == series
+
+
+def test_sheet_names_and_order(render):
+    long_name = "Quarterly revenue by region and product"
+    wb = render(sheets=[{"name": "First", "data": [[1]]}, {"name": long_name, "data": [[2]]}])
+    assert wb.sheetnames == ["First", long_name[:31]]
+
+
+def test_no_sheets(render):
+    wb = render()
+    assert len(wb.sheetnames) == 1
+    assert _values(wb.active) == []
+
+
+def test_backend_base_is_abstract(office_tool):
+    with pytest.raises(TypeError):
+        office_tool._XlsxBackend()
+
+
+def test_auto_selection(office_tool):
+    instr = office_tool.ExcelInstructions(sheets=[{"name": "S", "data": [[1, 2]] * 10}])
+    streaming = office_tool._XLSX_BACKENDS["streaming"]
+    expected = "openpyxl" if streaming.unsupported(instr, None) else "streaming"
+    assert office_tool._pick_xlsx_backend(instr, None, 20).name == expected
+    assert office_tool._pick_xlsx_backend(instr, None, 21).name == "openpyxl"
+    assert office_tool._pick_xlsx_backend(instr, None, 0).name == "openpyxl"
+    assert office_tool._pick_xlsx_backend(instr, object(), 1).name == "openpyxl"
+
+
+def test_streaming_rejects_templates(office_tool):
+    with pytest.raises(ValueError):
+        office_tool._XLSX_BACKENDS["streaming"].render(office_tool.ExcelInstructions(), object())
@@ -0,0 +1,207 @@
+"""
+xlsx patch mode (_patch_xlsx): the streamed rewrite must read back exactly like the
+full openpyxl modify path, and anything it cannot do must fall back to that path.
+"""
+
+import io
+import re
+import zipfile
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+SHARED_FORMULA = b'<c r="D2"><f t="shared" ref="D2:D4" si="0">B2*2</f></c>'
+CALC_CHAIN = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<calcChain xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    b'<c r="A5" i="1"/></calcChain>'
+)
+
+
+def _rewrite(data, edit):
+    """Copy an xlsx package, passing {name: bytes} through edit(members)."""
+    with zipfile.ZipFile(io.BytesIO(data)) as src:
+        members = {info.filename: src.read(info) for info in src.infolist()}
+    edit(members)
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as dst:
+        for name, raw in members.items():
+            dst.writestr(name, raw)
+    return out.getvalue()
+
+
+def _add_calc_chain(members):
+    members["xl/calcChain.xml"] = CALC_CHAIN
+    members["xl/_rels/workbook.xml.rels"] = members["xl/_rels/workbook.xml.rels"].replace(
+        b"</Relationships>",
+        b'<Relationship Id="rIdCalc" Target="calcChain.xml" Type="http://schemas.openxmlformats.org/'
+        b'officeDocument/2006/relationships/calcChain"/></Relationships>',
+    )
+    members["[Content_Types].xml"] = members["[Content_Types].xml"].replace(
+        b"</Types>",
+        b'<Override PartName="/xl/calcChain.xml" ContentType="application/vnd.openxmlformats-'
+        b'officedocument.spreadsheetml.calcChain+xml"/></Types>',
+    )
+
+
+def _add_shared_formula(members):
+    sheet = members["xl/worksheets/sheet1.xml"]
+    members["xl/worksheets/sheet1.xml"] = re.sub(
+        rb'(<c r="C2"[^>]*>.*?</c>)', lambda m: m.group(1) + SHARED_FORMULA, sheet, count=1
+    )
+
+
+@pytest.fixture
+def source():
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Data"
+    ws.append(["Name", "Amount", "Note"])
+    ws.append(["x", 10, "keep"])
+    ws["A4"], ws["B4"], ws["E4"] = "y", 20, "far"
+    ws["A5"] = "=SUM(B2:B4)"
+    ws["C2"].number_format = "0.0"
+    ws.column_dimensions["B"].width = 20
+    ws.column_dimensions["C"].width = 11
+    plain = wb.create_sheet("Plain")
+    plain["A1"] = 1
+    out = io.BytesIO()
+    wb.save(out)
+    return _rewrite(out.getvalue(), _add_calc_chain)
+
+
+def _instr(office_tool, sheets, **kwargs):
+    return office_tool.ExcelInstructions(sheets=sheets, patch_mode=True, **kwargs)
+
+
+EDITS = [
+    {
+        "name": "Data",
+        "data": [["Name", "Amount"], ["x", 11], ["z", 30]],
+        "formulas": {"B7": "=SUM(B1:B4)", "C2": "=B2*3"},
+        "number_formats": {"B2": "0.00%", "B3": "#,##0.000", "C7": "0.0000"},
+        "column_widths": {2: 18, 6: 9},
+    },
+    {"name": "Plain", "data": [[2, "two"]], "column_widths": {1: 30}},
+]
+
+
+def _full(office_tool, data, instr):
+    return office_tool._modify_xlsx(data, instr.model_copy(update={"patch_mode": False}))
+
+
+def _cells(data):
+    wb = load_workbook(io.BytesIO(data))
+    return {
+        ws.title: {
+            cell.coordinate: (cell.value, cell.number_format)
+            for row in ws.iter_rows()
+            for cell in row
+            if cell.value is not None or cell.number_format != "General"
+        }
+        for ws in wb.worksheets
+    }
+
+
+def _widths(data):
+    wb = load_workbook(io.BytesIO(data))
+    return {
+        ws.title: {key: dim.width for key, dim in ws.column_dimensions.items() if dim.customWidth}
+        for ws in wb.worksheets
+    }
+
+
+def _sheet_xml(data, member="xl/worksheets/sheet1.xml"):
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        return zf.read(member)
+
+
+def test_patch_reads_back_like_full_path(office_tool, source):
+    instr = _instr(office_tool, EDITS)
+    patched = office_tool._patch_xlsx(source, instr)
+    full = _full(office_tool, source, instr)
+
+    assert _cells(patched) == _cells(full)
+    assert _cells(patched)["Data"]["E4"] == ("far", "General")  # untouched cells survive
+    assert _cells(patched)["Data"]["B2"] == (11, "0.00%")
+    assert _widths(patched) == _widths(full)
+    assert _widths(patched)["Data"] == {"B": 18, "C": 11, "F": 9}
+    assert _widths(patched)["Plain"] == {"A": 30}
+
+
+def test_new_number_formats_are_registered(office_tool, source):
+    patched = office_tool._patch_xlsx(source, _instr(office_tool, EDITS))
+    with zipfile.ZipFile(io.BytesIO(patched)) as zf:
+        styles = zf.read("xl/styles.xml")
+    with zipfile.ZipFile(io.BytesIO(source)) as zf:
+        before = zf.read("xl/styles.xml")
+    custom = re.findall(rb'<numFmt numFmtId="(\d+)" formatCode="([^"]+)"', styles)
+    assert {code for _, code in custom} >= {b"#,##0.000", b"0.0000"}
+    assert all(int(fid) >= 164 for fid, _ in custom)
+    count = lambda xml: int(re.search(rb'<cellXfs count="(\d+)"', xml).group(1))  # noqa: E731
+    assert count(styles) == count(before) + 3  # 0.00% is built in but still needs its own xf
+
+
+def test_rows_are_inserted_in_order(office_tool, source):
+    patched = office_tool._patch_xlsx(source, _instr(office_tool, EDITS))
+    rows = [int(r) for r in re.findall(rb'<row r="(\d+)"', _sheet_xml(patched))]
+    assert rows == [1, 2, 3, 4, 5, 7]
+    cells = re.findall(rb'<c r="([A-Z]+)3"', _sheet_xml(patched))
+    assert cells == [b"A", b"B"]
+
+
+def test_dimension_covers_old_and_new_cells(office_tool, source):
+    patched = office_tool._patch_xlsx(source, _instr(office_tool, EDITS))
+    assert re.search(rb'<dimension ref="([^"]+)"', _sheet_xml(patched)).group(1) == b"A1:E7"
+
+
+def test_calc_chain_is_dropped_and_recalc_requested(office_tool, source):
+    patched = office_tool._patch_xlsx(source, _instr(office_tool, EDITS))
+    with zipfile.ZipFile(io.BytesIO(patched)) as zf:
+        assert "xl/calcChain.xml" not in zf.namelist()
+        assert b"calcChain" not in zf.read("xl/_rels/workbook.xml.rels")
+        assert b"calcChain" not in zf.read("[Content_Types].xml")
+        assert b'fullCalcOnLoad="1"' in zf.read("xl/workbook.xml")
+        with zipfile.ZipFile(io.BytesIO(source)) as src:
+            # Parts no edit touches are copied unchanged
+            assert zf.read("docProps/app.xml") == src.read("docProps/app.xml")
+    load_workbook(io.BytesIO(patched))
+
+
+def test_merge_cols_splits_ranges(office_tool):
+    from lxml import etree
+
+    cols = etree.fromstring(
+        f'<cols xmlns="{office_tool._SML_NS}"><col min="2" max="4" width="9" customWidth="1"/></cols>'
+    )
+    merged = office_tool._merge_cols(cols, {3: 15.0})
+    assert [(c.get("min"), c.get("max"), c.get("width")) for c in merged] == [
+        ("2", "2", "9"),
+        ("3", "3", "15.0"),
+        ("4", "4", "9"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "case",
+    ["shared_formula_anchor", "new_sheet", "chart", "conditional_formatting"],
+)
+def test_unsupported_edits_fall_back_to_full_path(office_tool, source, case):
+    sheets = [{"name": "Data", "data": [["Name", "Amount"]]}]
+    extra = {}
+    if case == "shared_formula_anchor":
+        source = _rewrite(source, _add_shared_formula)
+        sheets = [{"name": "Data", "formulas": {"D2": "=B2*4"}}]
+    elif case == "new_sheet":
+        sheets.append({"name": "Added", "data": [[1]]})
+    elif case == "chart":
+        extra["chart"] = {"type": "bar", "data_range": "B1:B4", "title": "Amounts"}
+    else:
+        sheets[0]["conditional_formatting"] = [
+            {"type": "cellIs", "range": "B2:B4", "operator": "greaterThan", "formula": "15"}
+        ]
+    instr = _instr(office_tool, sheets, **extra)
+
+    with pytest.raises(office_tool._XlsxPatchUnsupported):
+        office_tool._patch_xlsx(source, instr)
+    assert _cells(office_tool._modify_xlsx(source, instr)) == _cells(_full(office_tool, source, instr))
@@ -0,0 +1,276 @@
+"""
+Headless bulk document generation with the pdf/office document tools (not an Open
+WebUI tool itself). Reads instruction payloads from JSONL, renders them in a process
+pool with the tools' own engines and writes the files to a directory or a custom
+sink. Open WebUI does not need to be installed.
+
+Input: one JSON object per line.
+
+    {"id": "stmt-00001", "file_type": "pdf", "instructions": {...}}
+    {"id": "deck-7", "file_type": "pptx", "markdown": "# Title\\n## Slide\\n- point"}
+    {"id": "q3", "file_type": "xlsx", "source_path": "q3.xlsx", "instructions": {...}}
+
+"instructions" (or "raw_instructions") has the same shape as in the chat tools;
+"markdown" is the compact format. With "source_path" the file is modified instead of
+created. "output_basename" names the output (default: the id).
+
+    python tools/bulk_runner.py statements.jsonl --out out/ --workers 8 --report report.jsonl
+
+Each rendered item produces one report line (id, output, bytes, render_ms, ok/error);
+a summary with throughput and latency percentiles goes to stderr.
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib
+import importlib.util
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, TextIO
+
+_TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+_EXTENSIONS = {"pdf": ".pdf", "docx": ".docx", "pptx": ".pptx", "xlsx": ".xlsx"}
+_MODULE_FOR = {
+    "pdf": "pdf_document_tool",
+    "docx": "office_document_tool",
+    "pptx": "office_document_tool",
+    "xlsx": "office_document_tool",
+}
+
+# Per-process tool modules and render options, set by _init_worker.
+_TOOLS: Dict[str, Any] = {}
+_OPTIONS: Dict[str, Any] = {}
+
+
+# ----------------------------
+# Sinks
+# ----------------------------
+
+
+class DirectorySink:
+    """Writes each document to out_dir/<name>. Any object with write(name, data) -> str works."""
+
+    def __init__(self, out_dir: str) -> None:
+        self.out_dir = out_dir
+        os.makedirs(out_dir, exist_ok=True)
+
+    def write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.out_dir, name)
+        tmp = f"{path}.part"
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+        return path
+
+
+def _load_sink(spec: str, out_dir: str) -> Any:
+    """'package.module:factory' -> factory(out_dir)."""
+    module_name, _, attr = spec.partition(":")
+    factory = getattr(importlib.import_module(module_name), attr or "Sink")
+    return factory(out_dir)
+
+
+# ----------------------------
+# Workers
+# ----------------------------
+
+
+def _load_tool(module_name: str) -> Any:
+    module = sys.modules.get(module_name)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(
+            module_name, os.path.join(_TOOLS_DIR, f"{module_name}.py")
+        )
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+def _init_worker(options: Dict[str, Any]) -> None:
+    """Import the tool modules once per process and point them at the shared font/asset dirs."""
+    _OPTIONS.update(options)
+    for module_name in set(_MODULE_FOR.values()):
+        _TOOLS[module_name] = module = _load_tool(module_name)
+        module._ASSETS.configure(options.get("asset_dir") or "", options.get("asset_cache_size", 64))
+    _TOOLS["pdf_document_tool"]._FONT_DIR.configure(options.get("font_dir") or "")
+
+
+def _output_name(item: Dict[str, Any], file_type: str) -> str:
+    base = str(item.get("output_basename") or item.get("id") or "document")
+    base = re.sub(r"[^\w\- ]+", "_", base).strip() or "document"
+    return f"{base}{_EXTENSIONS[file_type]}"
+
+
+def _render_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Render one JSONL item. Never raises: failures are reported per item."""
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"id": item.get("id")}
+    try:
+        if item.get("_error"):
+            raise ValueError(f"invalid input line: {item['_error']}")
+        file_type = str(item.get("file_type") or "").lower()
+        if file_type not in _MODULE_FOR:
+            raise ValueError(f"file_type must be one of {sorted(_MODULE_FOR)}, got {file_type!r}")
+        payload = item.get("markdown") or item.get("instructions") or item.get("raw_instructions") or {}
+        existing = None
+        if item.get("source_path"):
+            with open(item["source_path"], "rb") as fh:
+                existing = fh.read()
+        tool = _TOOLS[_MODULE_FOR[file_type]]
+        if file_type == "pdf":
+            data = tool._render_document(file_type, payload, existing)
+        else:
+            data = tool._render_document(
+                file_type, payload, existing, _OPTIONS.get("xlsx_streaming_min_cells", 50000)
+            )
+        result.update(ok=True, name=_output_name(item, file_type), data=data)
+    except Exception as exc:
+        result.update(ok=False, error=f"{type(exc).__name__}: {exc}")
+    result["render_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+# ----------------------------
+# Runner
+# ----------------------------
+
+
+def read_jsonl(stream: TextIO) -> Iterator[Dict[str, Any]]:
+    """Items from a JSONL stream, lazily; a malformed line becomes a failing item."""
+    for lineno, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as exc:
+            item = {"id": f"line-{lineno}", "file_type": None, "_error": str(exc)}
+        if not isinstance(item, dict):
+            item = {"id": f"line-{lineno}", "file_type": None, "_error": "not a JSON object"}
+        item.setdefault("id", f"line-{lineno}")
+        yield item
+
+
+def run(
+    items: Iterable[Dict[str, Any]],
+    sink: Any,
+    workers: int = os.cpu_count() or 1,
+    font_dir: str = "",
+    asset_dir: str = "",
+    xlsx_streaming_min_cells: int = 50000,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Render items in a process pool and hand each document to sink.write(name, data).
+    Yields one result per item (id, ok, output | error, bytes, render_ms, write_ms) as
+    they complete. At most 2 x workers items are in flight, so memory stays flat for
+    arbitrarily long inputs.
+    """
+    options = {
+        "font_dir": font_dir,
+        "asset_dir": asset_dir,
+        "xlsx_streaming_min_cells": xlsx_streaming_min_cells,
+    }
+    pending: Set[Future] = set()
+    source = iter(items)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(options,)) as pool:
+        while True:
+            while len(pending) < 2 * workers:
+                item = next(source, None)
+                if item is None:
+                    break
+                pending.add(pool.submit(_render_item, item))
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                data = result.pop("data", None)
+                if result["ok"]:
+                    started = time.perf_counter()
+                    try:
+                        result["output"] = sink.write(result.pop("name"), data)
+                        result["bytes"] = len(data)
+                    except Exception as exc:
+                        result.update(ok=False, error=f"sink: {type(exc).__name__}: {exc}")
+                    result["write_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                yield result
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarize(results: List[Dict[str, Any]], wall_s: float) -> Dict[str, Any]:
+    render = [r["render_ms"] for r in results if r["ok"]]
+    return {
+        "items": len(results),
+        "ok": len(render),
+        "failed": len(results) - len(render),
+        "wall_s": round(wall_s, 2),
+        "items_per_s": round(len(results) / wall_s, 1) if wall_s else 0.0,
+        "mb_written": round(sum(r.get("bytes", 0) for r in results) / 1e6, 2),
+        "render_ms_p50": _percentile(render, 0.50),
+        "render_ms_p95": _percentile(render, 0.95),
+        "render_ms_max": max(render, default=0.0),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Render document instruction payloads from JSONL without Open WebUI."
+    )
+    parser.add_argument("input", help="JSONL file of instruction payloads ('-' for stdin)")
+    parser.add_argument("--out", default="out", help="output directory (default: out)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--report", help="write per-item results as JSONL here ('-' for stdout)")
+    parser.add_argument("--sink", help="custom sink 'module:factory', called with the --out value")
+    parser.add_argument("--font-dir", default="", help="TTF/OTF directory (as the font_dir valve)")
+    parser.add_argument("--asset-dir", default="", help="image library (as the asset_dir valve)")
+    parser.add_argument("--xlsx-streaming-min-cells", type=int, default=50000)
+    args = parser.parse_args(argv)
+
+    sink = _load_sink(args.sink, args.out) if args.sink else DirectorySink(args.out)
+    report: Optional[TextIO] = None
+    if args.report == "-":
+        report = sys.stdout
+    elif args.report:
+        report = open(args.report, "w", encoding="utf-8")
+
+    stream = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    results: List[Dict[str, Any]] = []
+    started = time.perf_counter()
+    try:
+        for result in run(
+            read_jsonl(stream),
+            sink,
+            workers=max(1, args.workers),
+            font_dir=args.font_dir,
+            asset_dir=args.asset_dir,
+            xlsx_streaming_min_cells=args.xlsx_streaming_min_cells,
+        ):
+            results.append(result)
+            if report:
+                report.write(json.dumps(result) + "\n")
+            if not result["ok"]:
+                print(f"{result['id']}: {result['error']}", file=sys.stderr)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if report and report is not sys.stdout:
+            report.close()
+
+    print(json.dumps(summarize(results, time.perf_counter() - started)), file=sys.stderr)
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
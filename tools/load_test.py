@@ -0,0 +1,419 @@
+"""
+Concurrent load test for the pdf/office document tools (not an Open WebUI tool
+itself). Runs many tool coroutines at once on one event loop, as Open WebUI does when
+several users generate documents together, against in-memory Storage, Files and Users
+stand-ins and a recording __event_emitter__. While a phase runs, a sampler measures
+how late the event loop wakes up (loop lag): time the loop spends in synchronous code
+that every other chat on the same worker has to wait for.
+
+Each payload class runs as its own phase and reports:
+  - request latency p50/p95/p99/max and throughput,
+  - loop-lag percentiles, the share of wall time the loop was stalled, and a
+    histogram of stalls by size (count and total stalled time per bucket).
+
+    python tools/load_test.py --users 50 --requests 4
+    python tools/load_test.py --classes pdf-report --users 20 --valve render_workers=4
+    python tools/load_test.py --payloads statements.jsonl --json load.json
+
+--payloads takes the bulk_runner JSONL format; items are grouped by their "class"
+key (default: file_type). --valve applies a valve override to both tools, so
+executor or queue changes can be compared run against run.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from bulk_runner import _load_tool, _percentile, read_jsonl
+
+_LAG_BUCKETS_MS = (1, 5, 20, 100, 500)
+
+
+# ----------------------------
+# Open WebUI stand-ins
+# ----------------------------
+
+
+class _StubFileForm:
+    def __init__(self, **fields: Any) -> None:
+        self.__dict__.update(fields)
+
+
+class _StubFileRecord:
+    def __init__(self, file_id: str) -> None:
+        self.id = file_id
+
+
+class _StubUser:
+    def __init__(self, user_id: str) -> None:
+        self.id = user_id
+        self.email = f"{user_id}@load.test"
+        self.name = user_id
+
+
+class StubBackend:
+    """
+    In-memory Storage, Files and Users with an optional per-call latency (seconds),
+    standing in for disk/S3 and the database. Counts calls and stored bytes.
+    """
+
+    def __init__(self, storage_latency_s: float = 0.0, db_latency_s: float = 0.0) -> None:
+        self.storage_latency_s = storage_latency_s
+        self.db_latency_s = db_latency_s
+        self.uploads = 0
+        self.bytes_stored = 0
+        self.user_lookups = 0
+        self._lock = threading.Lock()
+
+    # Storage
+    def upload_file(self, stream: Any, filename: str, tags: Dict[str, str]) -> Tuple[bytes, str]:
+        data = stream.read()
+        if self.storage_latency_s:
+            time.sleep(self.storage_latency_s)
+        with self._lock:
+            self.uploads += 1
+            self.bytes_stored += len(data)
+        return data, f"memory://{filename}"
+
+    # Files
+    def insert_new_file(self, user_id: str, form: Any) -> _StubFileRecord:
+        if self.db_latency_s:
+            time.sleep(self.db_latency_s)
+        return _StubFileRecord(form.id)
+
+    # Users
+    def get_user_by_id(self, user_id: str) -> _StubUser:
+        if self.db_latency_s:
+            time.sleep(self.db_latency_s)
+        with self._lock:
+            self.user_lookups += 1
+        return _StubUser(user_id)
+
+    def install(self, module: Any) -> None:
+        module.Storage = module.Files = module.Users = self
+        module.FileForm = _StubFileForm
+
+
+class RecordingEmitter:
+    """An __event_emitter__ that records (seconds since start, event type, payload)."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.events: List[Tuple[float, str, Dict[str, Any]]] = []
+
+    async def __call__(self, event: Dict[str, Any]) -> None:
+        self.events.append((time.perf_counter() - self.started, event.get("type", ""), event))
+
+    def errors(self) -> List[str]:
+        return [
+            e["data"].get("content", "")
+            for _, kind, e in self.events
+            if kind == "notification" and e.get("data", {}).get("type") == "error"
+        ]
+
+
+# ----------------------------
+# Payload classes
+# ----------------------------
+
+
+def _builtin_payloads() -> Dict[str, Dict[str, Any]]:
+    """Representative requests, from a one-page letter up to a multi-chapter report."""
+    lorem = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor. " * 4
+    chapters: List[Dict[str, Any]] = []
+    for c in range(12):
+        chapters.append({"text": f"Chapter {c + 1}", "bold": True, "font_size_pt": 18, "page_break_before": c > 0})
+        chapters.extend({"text": lorem, "align": "justify"} for _ in range(8))
+    table = [["Region", "Q1", "Q2", "Q3", "Q4"]] + [
+        [f"Region {i}"] + [str(i * q) for q in (10, 11, 12, 13)] for i in range(50)
+    ]
+    slides = "\n".join(
+        f"## Slide {i + 1}\n- First point about topic {i}\n- Second point\n- Third point"
+        for i in range(10)
+    )
+    return {
+        "pdf-letter": {
+            "file_type": "pdf",
+            "instructions": {
+                "paragraphs": [
+                    {"text": "Dear customer,"},
+                    {"text": lorem},
+                    {"text": "Kind regards, Support"},
+                ]
+            },
+        },
+        "pdf-report": {
+            "file_type": "pdf",
+            "instructions": {
+                "header_text": "Annual report",
+                "footer_text": "Confidential",
+                "paragraphs": chapters,
+                "tables": [{"rows": table, "header": True}],
+            },
+        },
+        "docx-memo": {
+            "file_type": "docx",
+            "instructions": {
+                "paragraphs": [{"text": lorem} for _ in range(20)],
+                "tables": [{"rows": table[:21], "header": True}],
+            },
+        },
+        "pptx-deck": {"file_type": "pptx", "markdown": f"# Quarterly review\n{slides}\n"},
+        "xlsx-table": {
+            "file_type": "xlsx",
+            "instructions": {
+                "sheets": [
+                    {
+                        "name": "Data",
+                        "data": [[f"c{j}" for j in range(8)]]
+                        + [[i * 8 + j for j in range(8)] for i in range(2000)],
+                    }
+                ]
+            },
+        },
+    }
+
+
+def _load_payloads(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    classes: Dict[str, List[Dict[str, Any]]] = {}
+    with open(path, encoding="utf-8") as fh:
+        for item in read_jsonl(fh):
+            if item.get("_error"):
+                raise ValueError(f"{item['id']}: {item['_error']}")
+            name = str(item.get("class") or item.get("file_type"))
+            classes.setdefault(name, []).append(item)
+    return classes
+
+
+# ----------------------------
+# Driver
+# ----------------------------
+
+
+class _LagSampler:
+    """Sleeps interval_s in a loop and records how late each wake-up was (ms)."""
+
+    def __init__(self, interval_s: float) -> None:
+        self.interval_s = interval_s
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval_s)
+            self.samples.append(max(0.0, (time.perf_counter() - started - self.interval_s) * 1000))
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def _lag_histogram(samples: List[float]) -> Dict[str, Dict[str, float]]:
+    """
+    Samples per lag bucket, with the total lag (ms) they account for. One 2 s stall is
+    a single sample, so the ms column is what shows where the loop's time went.
+    """
+    labels = [f"<{_LAG_BUCKETS_MS[0]}ms"]
+    labels += [f"{lo}-{hi}ms" for lo, hi in zip(_LAG_BUCKETS_MS, _LAG_BUCKETS_MS[1:])]
+    labels.append(f">={_LAG_BUCKETS_MS[-1]}ms")
+    buckets = {label: {"count": 0, "ms": 0.0} for label in labels}
+    for lag in samples:
+        index = next((i for i, edge in enumerate(_LAG_BUCKETS_MS) if lag < edge), len(_LAG_BUCKETS_MS))
+        buckets[labels[index]]["count"] += 1
+        buckets[labels[index]]["ms"] += lag
+    for bucket in buckets.values():
+        bucket["ms"] = round(bucket["ms"], 1)
+    return buckets
+
+
+def _tool_call(tools: Dict[str, Any], item: Dict[str, Any], user_id: str, emitter: RecordingEmitter):
+    file_type = str(item.get("file_type") or "").lower()
+    if file_type == "pdf":
+        method = tools["pdf"].pdf_document_tool
+    else:
+        method = tools["office"].office_document_tool
+    return method(
+        file_type=file_type,
+        operation="create",
+        raw_instructions=item.get("instructions") or item.get("raw_instructions"),
+        markdown=item.get("markdown"),
+        output_basename=str(item.get("id") or "load-test"),
+        __event_emitter__=emitter,
+        __user__={"id": user_id, "role": "user"},
+    )
+
+
+async def run_phase(
+    tools: Dict[str, Any],
+    name: str,
+    items: List[Dict[str, Any]],
+    users: int,
+    requests: int,
+    think_s: float = 0.0,
+    lag_interval_s: float = 0.005,
+) -> Dict[str, Any]:
+    """
+    `users` concurrent virtual users each send `requests` tool calls, cycling through
+    `items`. Returns latency, throughput and loop-lag statistics.
+    """
+    latencies: List[float] = []
+    failures: List[str] = []
+    events = 0
+    sampler = _LagSampler(lag_interval_s)
+
+    async def user(index: int) -> None:
+        nonlocal events
+        cycle = itertools.islice(itertools.cycle(items), index, None)
+        for _ in range(requests):
+            emitter = RecordingEmitter()
+            result = await _tool_call(tools, next(cycle), f"load-user-{index}", emitter)
+            latencies.append((time.perf_counter() - emitter.started) * 1000)
+            events += len(emitter.events)
+            if "is ready:" not in result:
+                errors = emitter.errors()
+                failures.append(errors[0] if errors else (result.splitlines() or ["empty result"])[0])
+            if think_s:
+                await asyncio.sleep(think_s)
+
+    sampler.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(users)))
+    wall_s = time.perf_counter() - started
+    await sampler.stop()
+
+    lags = sampler.samples
+    return {
+        "class": name,
+        "users": users,
+        "requests": len(latencies),
+        "failed": len(failures),
+        "errors": sorted(set(failures))[:5],
+        "wall_s": round(wall_s, 2),
+        "throughput_per_s": round(len(latencies) / wall_s, 2) if wall_s else 0.0,
+        "latency_ms": {
+            q: round(_percentile(latencies, p), 1)
+            for q, p in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))
+        },
+        "events_per_request": round(events / len(latencies), 1) if latencies else 0.0,
+        "loop_lag_ms": {
+            "p50": round(_percentile(lags, 0.50), 1),
+            "p99": round(_percentile(lags, 0.99), 1),
+            "max": round(max(lags, default=0.0), 1),
+            "stalled_pct": round(100 * sum(lags) / (wall_s * 1000), 1) if wall_s else 0.0,
+            "samples": len(lags),
+            "histogram": _lag_histogram(lags),
+        },
+    }
+
+
+def _parse_valve(spec: str) -> Tuple[str, Any]:
+    key, _, raw = spec.partition("=")
+    try:
+        return key, json.loads(raw)
+    except json.JSONDecodeError:
+        return key, raw
+
+
+def _make_tools(valves: Dict[str, Any], backend: StubBackend) -> Dict[str, Any]:
+    tools: Dict[str, Any] = {}
+    for key, module_name in (("pdf", "pdf_document_tool"), ("office", "office_document_tool")):
+        module = _load_tool(module_name)
+        backend.install(module)
+        tool = module.Tools()
+        for valve, value in valves.items():
+            if valve in type(tool.valves).model_fields:
+                setattr(tool.valves, valve, value)
+        tools[key] = tool
+    return tools
+
+
+def _format_phase(result: Dict[str, Any]) -> str:
+    lat, lag = result["latency_ms"], result["loop_lag_ms"]
+    histogram = "  ".join(
+        f"{k} {v['count']}x/{v['ms'] / 1000:.2f}s" for k, v in lag["histogram"].items() if v["count"]
+    )
+    return (
+        f"{result['class']:<14} users={result['users']:<4} reqs={result['requests']:<5} "
+        f"failed={result['failed']:<3} {result['throughput_per_s']:>7.2f}/s  "
+        f"latency p50={lat['p50']:.0f} p95={lat['p95']:.0f} p99={lat['p99']:.0f} max={lat['max']:.0f} ms\n"
+        f"{'':<14} loop lag p50={lag['p50']:.1f} p99={lag['p99']:.1f} max={lag['max']:.1f} ms "
+        f"stalled={lag['stalled_pct']:.0f}%  "
+        f"[{histogram}]"
+    )
+
+
+async def _main_async(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    backend = StubBackend(args.storage_latency_ms / 1000.0, args.db_latency_ms / 1000.0)
+    tools = _make_tools(dict(_parse_valve(v) for v in args.valve), backend)
+    if args.payloads:
+        classes = _load_payloads(args.payloads)
+    else:
+        classes = {name: [dict(item, id=name)] for name, item in _builtin_payloads().items()}
+    if args.classes:
+        unknown = set(args.classes) - set(classes)
+        if unknown:
+            raise SystemExit(f"unknown payload classes {sorted(unknown)}; have {sorted(classes)}")
+        classes = {name: classes[name] for name in args.classes}
+
+    # One untimed call per class so imports, font registration and caches are warm.
+    for items in classes.values():
+        await _tool_call(tools, items[0], "load-warmup", RecordingEmitter())
+
+    results = []
+    for name, items in classes.items():
+        result = await run_phase(
+            tools, name, items, args.users, args.requests, args.think_ms / 1000.0, args.lag_interval_ms / 1000.0
+        )
+        print(_format_phase(result), flush=True)
+        results.append(result)
+    if args.mixed and len(classes) > 1:
+        mixed = [item for items in classes.values() for item in items]
+        result = await run_phase(
+            tools, "mixed", mixed, args.users, args.requests, args.think_ms / 1000.0, args.lag_interval_ms / 1000.0
+        )
+        print(_format_phase(result), flush=True)
+        results.append(result)
+    print(f"uploads={backend.uploads} stored={backend.bytes_stored / 1e6:.2f} MB", file=sys.stderr)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Drive concurrent document tool calls and report latency and event-loop lag."
+    )
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users (default: 50)")
+    parser.add_argument("--requests", type=int, default=2, help="requests per user and phase (default: 2)")
+    parser.add_argument("--classes", nargs="*", help="payload classes to run (default: all)")
+    parser.add_argument("--payloads", help="JSONL in the bulk_runner format; grouped by 'class'")
+    parser.add_argument("--mixed", action="store_true", help="also run all classes together")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="pause between a user's requests")
+    parser.add_argument("--storage-latency-ms", type=float, default=0.0, help="simulated upload latency")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="simulated Files/Users latency")
+    parser.add_argument("--lag-interval-ms", type=float, default=5.0, help="loop-lag sampling interval")
+    parser.add_argument("--valve", action="append", default=[], help="valve override, e.g. render_workers=4")
+    parser.add_argument("--json", help="write the full results here")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(_main_async(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+    return 0 if all(not r["failed"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
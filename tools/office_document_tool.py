@@ -4,38 +4,80 @@ author: sketch
 version: 2.2.0
 license: MIT
 description: Create or modify Office documents (.docx, .pptx, .xlsx) and return them as downloadable attachments in Open WebUI chat.
-requirements: python-docx,python-pptx,openpyxl,pydantic
+requirements: python-docx,python-pptx,openpyxl,xlsxwriter,lxml,pydantic
 """
 
 from __future__ import annotations
 
 import asyncio
 import base64
+import copy
+import csv
+import functools
+import hashlib
+import html
 import io
+import json
+import multiprocessing
 import os
+import pickle
+import posixpath
+import re
+import struct
+import threading
+import time
 import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import zipfile
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from typing import Any, Dict, List, Literal, Optional, Tuple, Union, cast
+from typing import Any, Callable, Dict, Iterator, List, Literal, Optional, Set, Tuple, Union, cast
 
 from pydantic import BaseModel, Field, ValidationError, field_validator
 
 # Open WebUI internals - UPDATED IMPORTS for 0.5.x+
-from open_webui.models.users import Users
-from open_webui.models.files import Files, FileForm
-from open_webui.storage.provider import Storage
+try:
+    from open_webui.models.users import Users
+    from open_webui.models.files import Files, FileForm
+    from open_webui.storage.provider import Storage
+except ImportError:  # headless use (bulk_runner.py); only uploading needs Open WebUI
+    Users = Files = FileForm = Storage = None
 
 # Office libs
 from docx import Document as DocxDocument
 from docx.shared import Inches, Pt
+from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from pptx import Presentation
 from pptx.util import Inches as PptInches
 from pptx.chart.data import ChartData
 from pptx.enum.chart import XL_CHART_TYPE
+from pptx.opc.packuri import PackURI
 from openpyxl import Workbook, load_workbook
 from openpyxl.styles import PatternFill
 from openpyxl.chart import BarChart, Reference
 from openpyxl.formatting.rule import CellIsRule, ColorScaleRule
+from openpyxl.styles.numbers import BUILTIN_FORMATS_REVERSE
+from openpyxl.utils.cell import (
+    column_index_from_string,
+    coordinate_from_string,
+    get_column_letter,
+    range_boundaries,
+)
+from lxml import etree
+
+try:
+    import xlsxwriter
+except ImportError:  # the streaming xlsx backend is optional
+    xlsxwriter = None
+
+try:
+    from PIL import Image as PILImage
+except ImportError:  # asset variants are then served at their original size
+    PILImage = None
 
 
 # ----------------------------
@@ -43,7 +85,7 @@ from openpyxl.formatting.rule import CellIsRule, ColorScaleRule
 # ----------------------------
 
 FileType = Literal["docx", "pptx", "xlsx"]
-OperationType = Literal["create", "modify"]
+OperationType = Literal["create", "modify", "preview", "commit", "revise", "merge", "inspect"]
 
 
 class ImageSpec(BaseModel):
@@ -55,6 +97,10 @@ class ImageSpec(BaseModel):
     b64: Optional[str] = Field(
         default=None, description="Base64-encoded binary of the image."
     )
+    asset_id: Optional[str] = Field(
+        default=None,
+        description="ID of an image in the admin asset library (file name without extension), e.g. 'logo'.",
+    )
     width_inches: float = Field(
         default=2.0, ge=0.1, le=20.0, description="Image display width in inches."
     )
@@ -155,6 +201,20 @@ class ExcelInstructions(BaseModel):
         default=None,
         description="Workbook-level chart example on first sheet (bar) from a data range.",
     )
+    writer_backend: Literal["auto", "openpyxl", "streaming"] = Field(
+        default="auto",
+        description=(
+            "Create only: 'openpyxl' (full-featured), 'streaming' (constant-memory writer for large "
+            "exports) or 'auto' (streaming for large workbooks when every feature used is supported)."
+        ),
+    )
+    patch_mode: bool = Field(
+        default=False,
+        description=(
+            "Modify only: rewrite just the named existing sheets (data, formulas, number_formats, "
+            "column_widths) and copy every other part unchanged. Falls back to a full load otherwise."
+        ),
+    )
 
 
 class OfficeToolParams(BaseModel):
@@ -163,7 +223,16 @@ class OfficeToolParams(BaseModel):
     """
 
     file_type: FileType = Field(..., description="Office file type to create/modify.")
-    operation: OperationType = Field(..., description="'create' or 'modify'.")
+    operation: OperationType = Field(
+        ...,
+        description=(
+            "'create' or 'modify'; 'preview' validates and stages the instructions and shows a "
+            "draft; 'commit' renders a staged preview by preview_id; 'revise' applies a patch "
+            "to an earlier result by base_file_id; 'merge' renders the instructions once per "
+            "record, filling {{field}} placeholders; 'inspect' summarizes an attached file "
+            "(headings, slides, sheets) without changing it."
+        ),
+    )
     instructions: Optional[
         Union[WordInstructions, PptInstructions, ExcelInstructions]
     ] = Field(
@@ -174,9 +243,44 @@ class OfficeToolParams(BaseModel):
     source_path: Optional[str] = Field(
         default=None, description="Existing file path for modify operations."
     )
+    template_id: Optional[str] = Field(
+        default=None,
+        description="ID of an admin-provided template to start 'create' from (file name without extension).",
+    )
     output_basename: Optional[str] = Field(
         default=None, description="Base name for the generated file (no extension)."
     )
+    preview_id: Optional[str] = Field(
+        default=None, description="ID returned by a 'preview' call; required for 'commit'."
+    )
+    base_file_id: Optional[str] = Field(
+        default=None,
+        description=(
+            "file_id of an earlier result of this tool; required for 'revise'. With 'modify' "
+            "it selects that result (from this chat) as the source instead of an attachment."
+        ),
+    )
+    patch: Optional[List[Dict[str, Any]]] = Field(
+        default=None,
+        description="JSON-Patch ops (add/remove/replace/test) against the instructions of base_file_id.",
+    )
+    records: Optional[List[Dict[str, Any]]] = Field(
+        default=None, description="Inline merge records (field -> value); else an attached CSV/JSONL."
+    )
+    records_filename_hint: Optional[str] = Field(
+        default=None, description="Name of the attached .csv/.jsonl/.json file with the merge records."
+    )
+    merge_output: Literal["combined", "zip"] = Field(
+        default="combined",
+        description=(
+            "'combined': one file with every record (docx pages, pptx slides, xlsx sheets); "
+            "'zip': one file per record."
+        ),
+    )
+    merge_filename: Optional[str] = Field(
+        default=None,
+        description="File name pattern for 'zip' entries, e.g. 'offer-{{name}}' (default: basename-0001).",
+    )
 
     @field_validator("output_basename")
     @classmethod
@@ -214,6 +318,46 @@ def _get_content_type(ext: str) -> str:
     }.get(ext, "application/octet-stream")
 
 
+def _attachment_bytes(f: Dict[str, Any]) -> Optional[bytes]:
+    """Content of one __files__ entry: 'content' or 'b64' (base64), else 'path'."""
+    if "content" in f and isinstance(f["content"], str):
+        return base64.b64decode(f["content"])
+    if "b64" in f and isinstance(f["b64"], str):
+        return base64.b64decode(f["b64"])
+    if "path" in f and isinstance(f["path"], str) and os.path.isfile(f["path"]):
+        with open(f["path"], "rb") as fh:
+            return fh.read()
+    return None
+
+
+def _pick_attached_file(
+    expected_ext: str,
+    files: Optional[List[Dict[str, Any]]] = None,
+    hint: Optional[str] = None,
+    cached: Optional[Callable[[str], Optional[bytes]]] = None,
+) -> Optional[Tuple[Optional[str], str, bytes]]:
+    """
+    (Open WebUI file id, name, bytes) of the attachment to use: the file named by the
+    hint, else the first with the extension, skipping entries without readable content.
+    `cached(file_id)` may supply the bytes of a file seen before, saving the decode.
+    """
+    matches = [
+        f for f in files or [] if (f.get("name") or f.get("filename") or "").lower().endswith(expected_ext)
+    ]
+    if hint:
+        matches = [
+            f for f in matches if (f.get("name") or f.get("filename") or "").lower() == hint.lower()
+        ] + matches
+    for f in matches:
+        file_id = f.get("id") or (f.get("file") or {}).get("id")
+        data = cached(file_id) if cached is not None and file_id else None
+        if data is None:
+            data = _attachment_bytes(f)
+        if data:
+            return file_id, f.get("name") or f.get("filename"), data
+    return None
+
+
 def _find_attached_file(
     expected_ext: str,
     files: Optional[List[Dict[str, Any]]] = None,
@@ -223,51 +367,250 @@ def _find_attached_file(
     Pick a file from __files__ by extension (and optional name hint).
     Accepts content either in 'content' (base64) or 'b64' keys or 'path' (not recommended).
     """
-    if not files:
-        return None
+    pick = _pick_attached_file(expected_ext, files, hint)
+    return (pick[1], pick[2]) if pick else None
 
-    # Try hint first
-    if hint:
-        for f in files:
-            name = f.get("name") or f.get("filename") or ""
-            if (
-                name
-                and name.lower() == hint.lower()
-                and name.lower().endswith(expected_ext)
+
+# ----------------------------
+# Template registry
+# ----------------------------
+
+
+class _TemplateRegistry:
+    """
+    Admin-provided base documents (valves.template_dir), parsed once per process.
+
+    Templates are addressed by file name without extension. Each checkout returns an
+    independent copy of the parsed document: a deep copy for .docx/.pptx and an
+    unpickled snapshot for .xlsx (faster than deep-copying an openpyxl Workbook).
+    A template is re-parsed only when its file's mtime changes.
+    """
+
+    def __init__(self) -> None:
+        self._dir: Optional[str] = None
+        self._parsed: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _path_for(self, template_dir: str, template_id: str, file_type: str) -> str:
+        if os.path.basename(template_id) != template_id or template_id.startswith("."):
+            raise ValueError(f"Invalid template_id: {template_id!r}")
+        path = os.path.join(template_dir, f"{template_id}.{file_type}")
+        if not os.path.isfile(path):
+            raise FileNotFoundError(
+                f"Template '{template_id}' (.{file_type}) was not found in the template directory."
+            )
+        return path
+
+    def checkout(self, template_dir: str, template_id: str, file_type: str) -> Any:
+        if not template_dir:
+            raise PermissionError(
+                "Templates are not configured. Ask an admin to set the template_dir valve."
+            )
+        path = self._path_for(template_dir, template_id, file_type)
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            if template_dir != self._dir:
+                self._dir = template_dir
+                self._parsed.clear()
+            cached = self._parsed.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, "rb") as fh:
+                data = fh.read()
+            if file_type == "docx":
+                parsed: Any = DocxDocument(io.BytesIO(data))
+            elif file_type == "pptx":
+                parsed = Presentation(io.BytesIO(data))
+            else:
+                parsed = pickle.dumps(
+                    load_workbook(io.BytesIO(data)), protocol=pickle.HIGHEST_PROTOCOL
+                )
+            cached = (mtime, parsed)
+            with self._lock:
+                self._parsed[path] = cached
+
+        if file_type == "xlsx":
+            return pickle.loads(cached[1])
+        return copy.deepcopy(cached[1])
+
+
+_TEMPLATES = _TemplateRegistry()
+
+
+# ----------------------------
+# ZIP passthrough (modify)
+# ----------------------------
+
+_ZIP_COPY_CHUNK = 1024 * 1024
+# Binary members at least this large are hollowed out before parsing. Smaller ones
+# (logos, icons) stay so python-docx/pptx can still de-duplicate re-added images.
+_ZIP_HOLLOW_MIN_BYTES = 256 * 1024
+_ZIP_XML_SUFFIXES = (".xml", ".rels", ".vml")
+
+
+def _zip_copy_raw(src: zipfile.ZipFile, info: zipfile.ZipInfo, dst: zipfile.ZipFile) -> None:
+    """Copy one entry's compressed bytes from src into dst without inflating them."""
+    fp = src.fp
+    fp.seek(info.header_offset)
+    name_len, extra_len = struct.unpack("<HH", fp.read(30)[26:30])
+    fp.seek(info.header_offset + 30 + name_len + extra_len)
+
+    out = copy.copy(info)
+    out.extra = b""
+    out.flag_bits &= ~0x08  # sizes go in the local header, not a data descriptor
+    out.header_offset = dst.fp.tell()
+    dst.fp.write(out.FileHeader())
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = fp.read(min(_ZIP_COPY_CHUNK, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated entry in source package: {info.filename}")
+        dst.fp.write(chunk)
+        remaining -= len(chunk)
+
+    dst.filelist.append(out)
+    dst.NameToInfo[out.filename] = out
+    dst.start_dir = dst.fp.tell()
+    dst._didModify = True
+
+
+def _zip_skeleton(existing: bytes) -> Tuple[bytes, set]:
+    """
+    Return a copy of the package with large binary (non-XML) entries emptied, plus the
+    names of those entries. The Office libraries parse the skeleton, so media is never
+    inflated; _write_passthrough later copies the original entries back in raw.
+    """
+    hollow: set = set()
+    out = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(existing)) as src, zipfile.ZipFile(
+        out, "w", zipfile.ZIP_STORED
+    ) as dst:
+        for info in src.infolist():
+            if info.file_size >= _ZIP_HOLLOW_MIN_BYTES and not info.filename.lower().endswith(
+                _ZIP_XML_SUFFIXES
             ):
-                data = None
-                if "content" in f and isinstance(f["content"], str):
-                    data = base64.b64decode(f["content"])
-                elif "b64" in f and isinstance(f["b64"], str):
-                    data = base64.b64decode(f["b64"])
-                elif (
-                    "path" in f
-                    and isinstance(f["path"], str)
-                    and os.path.isfile(f["path"])
-                ):
-                    with open(f["path"], "rb") as fh:
-                        data = fh.read()
-                if data:
-                    return (name, data)
-
-    # Otherwise first matching extension
-    for f in files:
-        name = f.get("name") or f.get("filename") or ""
-        if name and name.lower().endswith(expected_ext):
-            data = None
-            if "content" in f and isinstance(f["content"], str):
-                data = base64.b64decode(f["content"])
-            elif "b64" in f and isinstance(f["b64"], str):
-                data = base64.b64decode(f["b64"])
-            elif (
-                "path" in f and isinstance(f["path"], str) and os.path.isfile(f["path"])
+                dst.writestr(info.filename, b"")
+                hollow.add(info.filename)
+            else:
+                _zip_copy_raw(src, info, dst)
+    return out.getvalue(), hollow
+
+
+class _HollowBlob:
+    """
+    Mixin for parts whose member _zip_skeleton emptied. The original bytes are read from
+    the source package only when python-docx/pptx asks for them: the SHA1 used to
+    de-duplicate a re-added image or video is streamed from the entry, and the blob is
+    inflated only when such a part is reused (e.g. to read its pixel size).
+    """
+
+    @property
+    def _blob(self) -> bytes:
+        source = self.__dict__.get("_hollow_source")
+        if source is not None:
+            with zipfile.ZipFile(io.BytesIO(source[0])) as zf:
+                self.__dict__["_blob"] = zf.read(source[1])
+            self.__dict__["_hollow_source"] = None
+        return self.__dict__.get("_blob") or b""
+
+    @_blob.setter
+    def _blob(self, value: bytes) -> None:
+        self.__dict__.update(_blob=value, _hollow_source=None, _hollow_sha1=None)
+
+    @property
+    def sha1(self) -> str:
+        digest = self.__dict__.get("_hollow_sha1")
+        if digest is None:
+            sha1 = hashlib.sha1()
+            source = self.__dict__.get("_hollow_source")
+            if source is None:
+                sha1.update(self._blob)
+            else:
+                with zipfile.ZipFile(io.BytesIO(source[0])) as zf, zf.open(source[1]) as fh:
+                    for chunk in iter(lambda: fh.read(_ZIP_COPY_CHUNK), b""):
+                        sha1.update(chunk)
+            self.__dict__["_hollow_sha1"] = digest = sha1.hexdigest()
+        return digest
+
+
+_HOLLOW_CLASSES: Dict[type, type] = {}
+
+
+def _open_skeleton(existing: bytes, opener: Any) -> Tuple[Any, set]:
+    """
+    Parse the _zip_skeleton of existing with DocxDocument/Presentation and point its
+    hollow parts back at the original entries. Returns (document, hollow names).
+    """
+    skeleton, hollow = _zip_skeleton(existing)
+    document = opener(io.BytesIO(skeleton))
+    for part in document.part.package.iter_parts():
+        name = part.partname.membername
+        if name in hollow:
+            cls = type(part)
+            if cls not in _HOLLOW_CLASSES:
+                _HOLLOW_CLASSES[cls] = type(f"_Hollow{cls.__name__}", (_HollowBlob, cls), {})
+            part.__class__ = _HOLLOW_CLASSES[cls]
+            part.__dict__["_hollow_source"] = (existing, name)
+    return document, hollow
+
+
+def _write_passthrough(
+    existing: bytes, entries: List[Tuple[str, bytes]], hollow: Optional[set] = None
+) -> bytes:
+    """
+    Write a package from (member name, bytes) entries, copying the original compressed
+    entry byte-for-byte whenever a member is unchanged (same size and CRC, or still a
+    hollow skeleton placeholder). Only changed members are deflated.
+    """
+    hollow = hollow or set()
+    out = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(existing)) as src, zipfile.ZipFile(
+        out, "w", zipfile.ZIP_DEFLATED
+    ) as dst:
+        originals = {info.filename: info for info in src.infolist()}
+        for name, blob in entries:
+            info = originals.get(name)
+            if info is not None and (
+                (name in hollow and not blob)
+                or (info.file_size == len(blob) and info.CRC == zlib.crc32(blob))
             ):
-                with open(f["path"], "rb") as fh:
-                    data = fh.read()
-            if data:
-                return (name, data)
+                _zip_copy_raw(src, info, dst)
+            else:
+                dst.writestr(name, blob)
+    return out.getvalue()
 
-    return None
+
+def _opc_entries(package: Any) -> List[Tuple[str, bytes]]:
+    """Serialize a python-docx/python-pptx package into (member name, bytes) entries."""
+    parts = list(package.iter_parts())
+    pkg_rels = package.rels if hasattr(type(package), "rels") else package._rels
+
+    overrides = "".join(
+        f'<Override PartName="{part.partname}" ContentType="{part.content_type}"/>'
+        for part in parts
+    )
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        f"{overrides}</Types>"
+    ).encode("utf-8")
+
+    entries: List[Tuple[str, bytes]] = [
+        ("[Content_Types].xml", content_types),
+        ("_rels/.rels", _as_bytes(pkg_rels.xml)),
+    ]
+    for part in parts:
+        # Hollow parts nobody needed stay empty; _write_passthrough copies them raw.
+        hollow = part.__dict__.get("_hollow_source") is not None
+        entries.append((part.partname.membername, b"" if hollow else part.blob))
+        if len(part.rels):
+            entries.append((part.partname.rels_uri.membername, _as_bytes(part.rels.xml)))
+    return entries
+
+
+def _as_bytes(xml: Union[str, bytes]) -> bytes:
+    return xml.encode("utf-8") if isinstance(xml, str) else xml
 
 
 # ----------------------------
@@ -275,6 +618,73 @@ def _find_attached_file(
 # ----------------------------
 
 
+# Characters python-docx maps to run-level elements (w:tab, w:br) rather than w:t text.
+_WORD_RUN_SPECIAL_CHARS = ("\t", "\n", "\r")
+
+
+def _word_format_key(p: ParagraphSpec) -> Tuple[Any, ...]:
+    return (p.bold, p.italic, p.underline, p.font_name, p.font_size_pt, p.style)
+
+
+def _add_word_paragraph(doc: DocxDocument, p: ParagraphSpec):
+    """Add a single paragraph through the python-docx object API."""
+    para = doc.add_paragraph()
+    run = para.add_run(p.text)
+    run.bold = p.bold
+    run.italic = p.italic
+    run.underline = p.underline
+    if p.font_name:
+        run.font.name = p.font_name
+        run._element.rPr.rFonts.set(qn("w:eastAsia"), p.font_name)
+    if p.font_size_pt:
+        run.font.size = Pt(p.font_size_pt)
+    if p.style:
+        para.style = p.style
+    return para
+
+
+def _append_word_paragraphs(doc: DocxDocument, paragraphs: List[ParagraphSpec]) -> None:
+    """
+    Bulk-append paragraphs by writing w:p/w:r/w:t elements straight into the body.
+
+    The first paragraph of each distinct formatting goes through the object API; its
+    pPr/rPr fragments are cached and deep-copied for every later paragraph with the
+    same formatting. Text containing tabs or line breaks always uses the object API.
+    """
+    body = doc.element.body
+    sect_pr = body.find(qn("w:sectPr"))
+    fragments: Dict[Tuple[Any, ...], Tuple[Any, Any]] = {}
+
+    for p in paragraphs:
+        key = _word_format_key(p)
+        cached = fragments.get(key)
+        if cached is None or any(ch in p.text for ch in _WORD_RUN_SPECIAL_CHARS):
+            para = _add_word_paragraph(doc, p)
+            if cached is None:
+                fragments[key] = (para._p.pPr, para.runs[0]._r.rPr)
+            continue
+
+        ppr, rpr = cached
+        p_el = OxmlElement("w:p")
+        if ppr is not None:
+            p_el.append(copy.deepcopy(ppr))
+        r_el = OxmlElement("w:r")
+        p_el.append(r_el)
+        if rpr is not None:
+            r_el.append(copy.deepcopy(rpr))
+        if p.text:
+            t_el = OxmlElement("w:t")
+            t_el.text = p.text
+            if len(p.text.strip()) < len(p.text):
+                t_el.set(qn("xml:space"), "preserve")
+            r_el.append(t_el)
+
+        if sect_pr is not None:
+            sect_pr.addprevious(p_el)
+        else:
+            body.append(p_el)
+
+
 def _apply_word_instructions(doc: DocxDocument, instr: WordInstructions) -> None:
     """Apply Word operations (paragraphs, tables, images, header/footer, find/replace)."""
     if instr.default_style:
@@ -283,19 +693,7 @@ def _apply_word_instructions(doc: DocxDocument, instr: WordInstructions) -> None
         except Exception:
             pass
 
-    for p in instr.paragraphs:
-        para = doc.add_paragraph()
-        run = para.add_run(p.text)
-        run.bold = p.bold
-        run.italic = p.italic
-        run.underline = p.underline
-        if p.font_name:
-            run.font.name = p.font_name
-            run._element.rPr.rFonts.set(qn("w:eastAsia"), p.font_name)
-        if p.font_size_pt:
-            run.font.size = Pt(p.font_size_pt)
-        if p.style:
-            para.style = p.style
+    _append_word_paragraphs(doc, instr.paragraphs)
 
     for t in instr.tables:
         rows = len(t.rows)
@@ -311,8 +709,8 @@ def _apply_word_instructions(doc: DocxDocument, instr: WordInstructions) -> None
                 table.cell(i, j).text = str(cell_text)
 
     for im in instr.images:
-        if im.b64:
-            data = base64.b64decode(im.b64)
+        if im.b64 or im.asset_id:
+            data = _image_bytes(im)
             doc.add_picture(io.BytesIO(data), width=Inches(im.width_inches))
 
     if instr.header_text:
@@ -332,21 +730,23 @@ def _apply_word_instructions(doc: DocxDocument, instr: WordInstructions) -> None
                 para.text = para.text.replace(fr.find, fr.replace)
 
 
-def _create_docx(instr: WordInstructions) -> bytes:
-    doc = DocxDocument()
+def _create_docx(instr: WordInstructions, base: Optional[Any] = None) -> bytes:
+    doc = base if base is not None else DocxDocument()
     _apply_word_instructions(doc, instr)
     bio = io.BytesIO()
     doc.save(bio)
     return bio.getvalue()
 
 
-def _modify_docx(existing: bytes, instr: WordInstructions) -> bytes:
-    bio = io.BytesIO(existing)
-    doc = DocxDocument(bio)
+def _modify_docx(
+    existing: bytes, instr: WordInstructions, source: Optional[Tuple[Any, set]] = None
+) -> bytes:
+    """`source` may be an already parsed (skeleton document, hollow names) of `existing`."""
+    if source is None:
+        source = _open_skeleton(existing, DocxDocument)
+    doc, hollow = source
     _apply_word_instructions(doc, instr)
-    out = io.BytesIO()
-    doc.save(out)
-    return out.getvalue()
+    return _write_passthrough(existing, _opc_entries(doc.part.package), hollow)
 
 
 # ----------------------------
@@ -354,73 +754,178 @@ def _modify_docx(existing: bytes, instr: WordInstructions) -> bytes:
 # ----------------------------
 
 
-def _add_ppt_slide(prs: Presentation, slide_spec: SlideSpec) -> None:
-    layout = prs.slide_layouts[1]  # Title + Content
-    slide = prs.slides.add_slide(layout)
+# Control characters: python-pptx turns line breaks into a:br and escapes the rest
+# (e.g. form feed as "_x000C_"), so bullets containing any of them take its text path.
+_PPT_CONTROL_CHARS = re.compile(r"[\x00-\x1f]")
 
-    if slide_spec.title:
-        slide.shapes.title.text = slide_spec.title
 
-    if slide_spec.bullets:
-        body = slide.placeholders[1].text_frame
-        body.clear()
-        for i, b in enumerate(slide_spec.bullets):
-            if i == 0:
-                body.text = b
-            else:
-                p = body.add_paragraph()
-                p.text = b
-                p.level = 0
-
-    for im in slide_spec.images:
-        if im.b64:
-            data = base64.b64decode(im.b64)
-            slide.shapes.add_picture(
-                io.BytesIO(data),
-                PptInches(im.width_inches),
-                PptInches(1.0),
-                width=PptInches(im.width_inches),
-            )
+class _SharedWorkbookChartData(ChartData):
+    """ChartData that reuses an already generated embedded-workbook blob."""
+
+    def __init__(self, xlsx_blob: bytes) -> None:
+        super().__init__()
+        self._shared_xlsx_blob = xlsx_blob
+
+    @property
+    def xlsx_blob(self) -> bytes:
+        return self._shared_xlsx_blob
+
+
+class _DeckBuilder:
+    """
+    Per-presentation state for adding many slides quickly.
+
+    The content layout and its body placeholder are resolved once; bullets are written
+    as a:p elements in one pass; charts with identical data share one embedded
+    workbook part. While active, the package's next_partname lookup is memoized per
+    template, since python-pptx otherwise walks every part for each new chart.
+    """
+
+    def __init__(self, prs: Presentation) -> None:
+        self.prs = prs
+        self.layout = prs.slide_layouts[1]  # Title + Content
+        body_ids = [
+            ph.placeholder_format.idx
+            for ph in self.layout.placeholders
+            if ph.placeholder_format.idx != 0
+        ]
+        self.body_idx = 1 if 1 in body_ids or not body_ids else body_ids[0]
+        self._charts: Dict[Tuple[Any, ...], Tuple[bytes, Any]] = {}
+        self._partnames: Dict[str, List[Any]] = {}
+        self._package = prs.part.package
+
+    def __enter__(self) -> "_DeckBuilder":
+        self._package.next_partname = self._next_partname
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        del self._package.next_partname
+
+    def _next_partname(self, tmpl: str) -> Any:
+        state = self._partnames.get(tmpl)
+        if state is None:
+            prefix = tmpl[: (tmpl % 42).find("42")]
+            used = {
+                str(p.partname)
+                for p in self._package.iter_parts()
+                if p.partname.startswith(prefix)
+            }
+            state = self._partnames[tmpl] = [used, 1]
+        used, n = state
+        while tmpl % n in used:
+            n += 1
+        used.add(tmpl % n)
+        state[1] = n + 1
+        return PackURI(tmpl % n)
+
+    def _fill_bullets(self, slide: Any, bullets: List[str]) -> None:
+        body = slide.placeholders[self.body_idx].text_frame
+        if any(_PPT_CONTROL_CHARS.search(b) for b in bullets):
+            body.clear()
+            for i, b in enumerate(bullets):
+                if i == 0:
+                    body.text = b
+                else:
+                    p = body.add_paragraph()
+                    p.text = b
+                    p.level = 0
+            return
+
+        tx_body = body._txBody
+        for p in tx_body.findall(qn("a:p")):
+            tx_body.remove(p)
+        for i, b in enumerate(bullets):
+            p_el = etree.SubElement(tx_body, qn("a:p"))
+            if i:
+                etree.SubElement(p_el, qn("a:pPr"))
+            r_el = etree.SubElement(p_el, qn("a:r"))
+            etree.SubElement(r_el, qn("a:t")).text = b
+
+    def _add_bar_chart(self, slide: Any, spec: Dict[str, Any]) -> None:
+        categories = spec.get("categories") or []
+        series_list = spec.get("series") or []
+        key = (
+            tuple(categories),
+            tuple(
+                (s.get("name", "Series"), tuple(s.get("values", [])))
+                for s in series_list
+            ),
+        )
+        shared = self._charts.get(key)
+        chart_data = ChartData() if shared is None else _SharedWorkbookChartData(shared[0])
+        chart_data.categories = categories
+        for s in series_list:
+            chart_data.add_series(s.get("name", "Series"), s.get("values", []))
+        x, y, cx, cy = PptInches(1), PptInches(3), PptInches(8), PptInches(3)
+        frame = slide.shapes.add_chart(
+            XL_CHART_TYPE.COLUMN_CLUSTERED, x, y, cx, cy, chart_data
+        )
+
+        workbook = frame.chart.part.chart_workbook
+        if shared is None:
+            self._charts[key] = (workbook.xlsx_part.blob, workbook.xlsx_part)
+            return
+        chart_part = frame.chart.part
+        own_rid = chart_part._element.xlsx_part_rId
+        workbook.xlsx_part = shared[1]
+        chart_part.drop_rel(own_rid)
+
+    def add_slide(self, slide_spec: SlideSpec) -> None:
+        slide = self.prs.slides.add_slide(self.layout)
+
+        if slide_spec.title:
+            slide.shapes.title.text = slide_spec.title
+
+        if slide_spec.bullets:
+            self._fill_bullets(slide, slide_spec.bullets)
+
+        for im in slide_spec.images:
+            if im.b64 or im.asset_id:
+                data = _image_bytes(im)
+                slide.shapes.add_picture(
+                    io.BytesIO(data),
+                    PptInches(im.width_inches),
+                    PptInches(1.0),
+                    width=PptInches(im.width_inches),
+                )
+
+        # Simple bar chart example
+        if slide_spec.chart:
+            if (slide_spec.chart.get("type") or "bar").lower() == "bar":
+                self._add_bar_chart(slide, slide_spec.chart)
 
-    # Simple bar chart example
-    if slide_spec.chart:
-        spec = slide_spec.chart
-        ctype = (spec.get("type") or "bar").lower()
-        if ctype == "bar":
-            categories = spec.get("categories") or []
-            series_list = spec.get("series") or []
-            chart_data = ChartData()
-            chart_data.categories = categories
-            for s in series_list:
-                chart_data.add_series(s.get("name", "Series"), s.get("values", []))
-            x, y, cx, cy = PptInches(1), PptInches(3), PptInches(8), PptInches(3)
-            slide.shapes.add_chart(
-                XL_CHART_TYPE.COLUMN_CLUSTERED, x, y, cx, cy, chart_data
-            )
 
+def _add_ppt_title_slide(prs: Presentation, title: str) -> None:
+    title_slide_layout = prs.slide_layouts[0]
+    slide = prs.slides.add_slide(title_slide_layout)
+    slide.shapes.title.text = title
+    if slide.placeholders and len(slide.placeholders) > 1:
+        slide.placeholders[1].text = ""
 
-def _create_pptx(instr: PptInstructions) -> bytes:
-    prs = Presentation()
+
+def _create_pptx(instr: PptInstructions, base: Optional[Any] = None) -> bytes:
+    prs = base if base is not None else Presentation()
     if instr.title:
-        title_slide_layout = prs.slide_layouts[0]
-        slide = prs.slides.add_slide(title_slide_layout)
-        slide.shapes.title.text = instr.title
-        if slide.placeholders and len(slide.placeholders) > 1:
-            slide.placeholders[1].text = ""
-    for s in instr.slides:
-        _add_ppt_slide(prs, s)
+        _add_ppt_title_slide(prs, instr.title)
+    with _DeckBuilder(prs) as deck:
+        for s in instr.slides:
+            deck.add_slide(s)
     bio = io.BytesIO()
     prs.save(bio)
     return bio.getvalue()
 
 
-def _modify_pptx(existing: bytes, instr: PptInstructions) -> bytes:
-    prs = Presentation(io.BytesIO(existing))
-    for s in instr.slides:
-        _add_ppt_slide(prs, s)
-    out = io.BytesIO()
-    prs.save(out)
-    return out.getvalue()
+def _modify_pptx(
+    existing: bytes, instr: PptInstructions, source: Optional[Tuple[Any, set]] = None
+) -> bytes:
+    """`source` may be an already parsed (skeleton presentation, hollow names) of `existing`."""
+    if source is None:
+        source = _open_skeleton(existing, Presentation)
+    prs, hollow = source
+    with _DeckBuilder(prs) as deck:
+        for s in instr.slides:
+            deck.add_slide(s)
+    return _write_passthrough(existing, _opc_entries(prs.part.package), hollow)
 
 
 # ----------------------------
@@ -444,7 +949,7 @@ def _apply_sheet(ws, spec: SheetSpec) -> None:
 
     # Column widths (A=1, B=2, ...)
     for col_idx, width in spec.column_widths.items():
-        ws.column_dimensions[chr(64 + col_idx)].width = float(width)
+        ws.column_dimensions[get_column_letter(col_idx)].width = float(width)
 
     # Conditional formatting
     for rule in spec.conditional_formatting:
@@ -476,42 +981,269 @@ def _apply_sheet(ws, spec: SheetSpec) -> None:
             )
 
 
-def _create_xlsx(instr: ExcelInstructions) -> bytes:
-    wb = Workbook()
-    if instr.sheets:
-        wb.remove(wb.active)
-    for s in instr.sheets:
-        ws = wb.create_sheet(title=s.name[:31] or "Sheet")
-        _apply_sheet(ws, s)
+class _XlsxBackend(ABC):
+    """Renders ExcelInstructions to .xlsx bytes with the same SheetSpec semantics."""
+
+    name = ""
+
+    def unsupported(self, instr: ExcelInstructions, base: Optional[Any]) -> Optional[str]:
+        """Reason this backend cannot render `instr`, or None."""
+        return None
+
+    @abstractmethod
+    def render(self, instr: ExcelInstructions, base: Optional[Any] = None) -> bytes:
+        """Workbook bytes; raises ValueError if unsupported() would give a reason."""
+
+
+class _OpenpyxlBackend(_XlsxBackend):
+    """In-memory openpyxl workbook; supports everything, including templates."""
+
+    name = "openpyxl"
+
+    def render(self, instr: ExcelInstructions, base: Optional[Any] = None) -> bytes:
+        if base is not None:
+            # Templates keep their own sheets; named sheets are filled in like a modify.
+            wb = base
+            for s in instr.sheets:
+                title = s.name[:31] or "Sheet"
+                ws = wb[title] if title in wb.sheetnames else wb.create_sheet(title=title)
+                _apply_sheet(ws, s)
+        else:
+            wb = Workbook()
+            if instr.sheets:
+                wb.remove(wb.active)
+            for s in instr.sheets:
+                ws = wb.create_sheet(title=s.name[:31] or "Sheet")
+                _apply_sheet(ws, s)
+
+        # Simple chart on first sheet if requested
+        if instr.chart and instr.sheets:
+            ws = wb[instr.sheets[0].name[:31]]
+            spec = instr.chart
+            if (spec.get("type") or "bar").lower() == "bar":
+                data_range = spec.get("data_range")  # e.g., "A1:D5"
+                if data_range:
+                    min_col, min_row, max_col, max_row = range_boundaries(data_range.upper())
+                    data = Reference(
+                        ws,
+                        min_col=min_col,
+                        min_row=min_row,
+                        max_col=max_col,
+                        max_row=max_row,
+                    )
+                    chart = BarChart()
+                    chart.add_data(data, titles_from_data=True)
+                    ws.add_chart(chart, "G2")
+
+        bio = io.BytesIO()
+        wb.save(bio)
+        return bio.getvalue()
+
+
+# openpyxl CellIsRule operators -> xlsxwriter 'cell' criteria
+_XLSXWRITER_CRITERIA = {
+    "greaterThan": ">",
+    "lessThan": "<",
+    "greaterThanOrEqual": ">=",
+    "lessThanOrEqual": "<=",
+    "equal": "==",
+    "notEqual": "!=",
+    ">": ">",
+    "<": "<",
+    ">=": ">=",
+    "<=": "<=",
+    "==": "==",
+    "=": "==",
+    "!=": "!=",
+}
+
+# xlsxwriter pads column widths the way Excel's UI does; openpyxl writes them raw.
+_XLSXWRITER_WIDTH_PADDING = 5 / 7
+
+
+class _StreamingXlsxBackend(_XlsxBackend):
+    """
+    xlsxwriter in constant_memory mode: each row is flushed to disk as soon as the
+    next one starts, so memory stays flat regardless of sheet size. Cells can only be
+    written in row order and nothing can be read back, hence no templates.
+    """
+
+    name = "streaming"
+
+    def unsupported(self, instr: ExcelInstructions, base: Optional[Any]) -> Optional[str]:
+        if xlsxwriter is None:
+            return "xlsxwriter is not installed"
+        if base is not None:
+            return "templates need the openpyxl backend"
+        titles = [s.name[:31] or "Sheet" for s in instr.sheets]
+        if len({t.lower() for t in titles}) != len(titles):
+            return "duplicate sheet names"
+        for s in instr.sheets:
+            for rule in s.conditional_formatting:
+                rtype = (rule.get("type") or "").lower()
+                if rtype == "cellis" and rule.get("operator", "greaterThan") not in _XLSXWRITER_CRITERIA:
+                    return f"conditional formatting operator {rule.get('operator')!r}"
+        return None
+
+    @staticmethod
+    def _row_overlays(spec: SheetSpec) -> Dict[int, Dict[int, List[Any]]]:
+        # Out-of-grid formulas/formats, keyed by 0-based row then col: [value, fmt code]
+        rows: Dict[int, Dict[int, List[Any]]] = {}
+        for addr, formula in spec.formulas.items():
+            col, row = coordinate_from_string(addr)
+            cell = rows.setdefault(row - 1, {}).setdefault(
+                column_index_from_string(col) - 1, [None, None]
+            )
+            cell[0] = formula
+        for addr, fmt in spec.number_formats.items():
+            col, row = coordinate_from_string(addr)
+            rows.setdefault(row - 1, {}).setdefault(
+                column_index_from_string(col) - 1, [None, None]
+            )[1] = fmt
+        return rows
+
+    def _write_sheet(self, wb: Any, ws: Any, spec: SheetSpec, formats: Dict[str, Any]) -> None:
+        def fmt_for(code: Optional[str]) -> Any:
+            if code is None:
+                return None
+            if code not in formats:
+                formats[code] = wb.add_format({"num_format": code})
+            return formats[code]
+
+        for col_idx, width in spec.column_widths.items():
+            ws.set_column(
+                col_idx - 1, col_idx - 1, max(float(width) - _XLSXWRITER_WIDTH_PADDING, 0)
+            )
+
+        overlays = self._row_overlays(spec)
+        data = spec.data
+        for r in sorted(set(range(len(data))) | overlays.keys()):
+            extra = overlays.get(r)
+            row = data[r] if r < len(data) else []
+            if not extra:
+                ws.write_row(r, 0, row)
+                continue
+            for c in sorted(set(range(len(row))) | extra.keys()):
+                value = row[c] if c < len(row) else None
+                code = None
+                if c in extra:
+                    formula, code = extra[c]
+                    if formula is not None:
+                        value = formula
+                fmt = fmt_for(code)
+                if value is None or value == "":
+                    if fmt is not None:
+                        ws.write_blank(r, c, None, fmt)
+                else:
+                    ws.write(r, c, value, fmt)
+
+        for rule in spec.conditional_formatting:
+            rtype = (rule.get("type") or "").lower()
+            rng = rule.get("range") or ""
+            if rtype == "cellis":
+                color = rule.get("color", "FFC7CE")
+                ws.conditional_format(
+                    rng,
+                    {
+                        "type": "cell",
+                        "criteria": _XLSXWRITER_CRITERIA[rule.get("operator", "greaterThan")],
+                        "value": rule.get("formula", "0"),
+                        "format": wb.add_format({"bg_color": "#" + color[-6:], "pattern": 1}),
+                    },
+                )
+            elif rtype == "colorscale":
+                ws.conditional_format(
+                    rng,
+                    {
+                        "type": "3_color_scale",
+                        "min_color": "#" + rule.get("start_color", "63BE7B")[-6:],
+                        "mid_color": "#" + rule.get("mid_color", "FFEB84")[-6:],
+                        "max_color": "#" + rule.get("end_color", "F8696B")[-6:],
+                    },
+                )
+
+    def render(self, instr: ExcelInstructions, base: Optional[Any] = None) -> bytes:
+        reason = self.unsupported(instr, base)
+        if reason:
+            raise ValueError(f"Streaming xlsx backend unavailable: {reason}.")
+
+        bio = io.BytesIO()
+        wb = xlsxwriter.Workbook(
+            bio,
+            {
+                "constant_memory": True,
+                "in_memory": False,
+                "strings_to_urls": False,
+                "strings_to_numbers": False,
+            },
+        )
+        formats: Dict[str, Any] = {}
+        sheets = instr.sheets or [SheetSpec(name="Sheet")]
+        first = None
+        for s in sheets:
+            ws = wb.add_worksheet(s.name[:31] or "Sheet")
+            first = first or ws
+            self._write_sheet(wb, ws, s, formats)
 
-    # Simple chart on first sheet if requested
-    if instr.chart and instr.sheets:
-        ws = wb[instr.sheets[0].name[:31]]
         spec = instr.chart
-        if (spec.get("type") or "bar").lower() == "bar":
-            data_range = spec.get("data_range")  # e.g., "A1:D5"
+        if spec and instr.sheets and (spec.get("type") or "bar").lower() == "bar":
+            data_range = spec.get("data_range")
             if data_range:
-                min_col = ord(data_range.split(":")[0][0].upper()) - 64
-                min_row = int(data_range.split(":")[0][1:])
-                max_col = ord(data_range.split(":")[1][0].upper()) - 64
-                max_row = int(data_range.split(":")[1][1:])
-                data = Reference(
-                    ws,
-                    min_col=min_col,
-                    min_row=min_row,
-                    max_col=max_col,
-                    max_row=max_row,
-                )
-                chart = BarChart()
-                chart.add_data(data, titles_from_data=True)
-                ws.add_chart(chart, "G2")
+                min_col, min_row, max_col, max_row = range_boundaries(data_range.upper())
+                chart = wb.add_chart({"type": "column"})
+                for c in range(min_col - 1, max_col):
+                    chart.add_series(
+                        {
+                            "name": [first.name, min_row - 1, c],
+                            "values": [first.name, min_row, c, max_row - 1, c],
+                        }
+                    )
+                first.insert_chart("G2", chart)
+
+        wb.close()
+        return bio.getvalue()
+
+
+_XLSX_BACKENDS: Dict[str, _XlsxBackend] = {
+    b.name: b for b in (_OpenpyxlBackend(), _StreamingXlsxBackend())
+}
+
+
+def _xlsx_cell_count(instr: ExcelInstructions) -> int:
+    return sum(len(row) for s in instr.sheets for row in s.data)
 
-    bio = io.BytesIO()
-    wb.save(bio)
-    return bio.getvalue()
+
+def _pick_xlsx_backend(
+    instr: ExcelInstructions, base: Optional[Any], streaming_min_cells: int
+) -> _XlsxBackend:
+    if instr.writer_backend != "auto":
+        return _XLSX_BACKENDS[instr.writer_backend]
+    streaming = _XLSX_BACKENDS["streaming"]
+    if (
+        streaming_min_cells > 0
+        and _xlsx_cell_count(instr) >= streaming_min_cells
+        and streaming.unsupported(instr, base) is None
+    ):
+        return streaming
+    return _XLSX_BACKENDS["openpyxl"]
+
+
+def _create_xlsx(
+    instr: ExcelInstructions,
+    base: Optional[Any] = None,
+    streaming_min_cells: int = 0,
+) -> bytes:
+    backend = _pick_xlsx_backend(instr, base, streaming_min_cells)
+    return backend.render(instr, base)
 
 
 def _modify_xlsx(existing: bytes, instr: ExcelInstructions) -> bytes:
+    if instr.patch_mode:
+        try:
+            return _patch_xlsx(existing, instr)
+        except _XlsxPatchUnsupported:
+            pass
+
     wb = load_workbook(io.BytesIO(existing))
     for s in instr.sheets:
         ws = (
@@ -525,6 +1257,1939 @@ def _modify_xlsx(existing: bytes, instr: ExcelInstructions) -> bytes:
     return bio.getvalue()
 
 
+# ----------------------------
+# Excel (.xlsx) patch mode
+# ----------------------------
+
+_SML_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_OFFICE_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_CT_NS = "http://schemas.openxmlformats.org/package/2006/content-types"
+_REL_OFFICE_DOCUMENT = _OFFICE_REL_NS + "/officeDocument"
+_REL_STYLES = _OFFICE_REL_NS + "/styles"
+_REL_CALC_CHAIN = _OFFICE_REL_NS + "/calcChain"
+
+# CT_Workbook children that may precede calcPr, in schema order.
+_WORKBOOK_BEFORE_CALCPR = (
+    "fileVersion",
+    "fileSharing",
+    "workbookPr",
+    "workbookProtection",
+    "bookViews",
+    "sheets",
+    "functionGroups",
+    "externalReferences",
+    "definedNames",
+)
+
+_UNSET = object()
+
+
+class _XlsxPatchUnsupported(Exception):
+    """Raised when a patch needs something only the full openpyxl path can do."""
+
+
+def _sml(tag: str) -> str:
+    return f"{{{_SML_NS}}}{tag}"
+
+
+def _rel_targets(zf: zipfile.ZipFile, source: str) -> Dict[str, Tuple[str, str]]:
+    """Return {rId: (type, member name)} for the part at `source` ('' = package)."""
+    folder, base = posixpath.split(source)
+    rels_name = posixpath.join(folder, "_rels", f"{base}.rels")
+    out: Dict[str, Tuple[str, str]] = {}
+    if rels_name not in zf.NameToInfo:
+        return out
+    for rel in etree.fromstring(zf.read(rels_name)):
+        if rel.get("TargetMode") == "External":
+            continue
+        target = rel.get("Target", "")
+        if target.startswith("/"):
+            member = target.lstrip("/")
+        else:
+            member = posixpath.normpath(posixpath.join(folder, target))
+        out[rel.get("Id", "")] = (rel.get("Type", ""), member)
+    return out
+
+
+class _XlsxStylePatcher:
+    """Adds number formats to styles.xml by cloning cellXfs entries on demand."""
+
+    def __init__(self, xml: bytes) -> None:
+        self.root = etree.fromstring(xml)
+        self.changed = False
+        self._fmt_ids: Dict[str, int] = {}
+        self._xf_cache: Dict[Tuple[int, str], int] = {}
+        self._num_fmts = self.root.find(_sml("numFmts"))
+        if self._num_fmts is not None:
+            for nf in self._num_fmts:
+                self._fmt_ids.setdefault(nf.get("formatCode", ""), int(nf.get("numFmtId", "0")))
+        self._cell_xfs = self.root.find(_sml("cellXfs"))
+        if self._cell_xfs is None or not len(self._cell_xfs):
+            raise _XlsxPatchUnsupported("styles.xml has no cellXfs")
+
+    def _num_fmt_id(self, code: str) -> int:
+        if code in BUILTIN_FORMATS_REVERSE:
+            return BUILTIN_FORMATS_REVERSE[code]
+        if code not in self._fmt_ids:
+            if self._num_fmts is None:
+                self._num_fmts = etree.Element(_sml("numFmts"))
+                self.root.insert(0, self._num_fmts)
+            new_id = max([163, *self._fmt_ids.values()]) + 1
+            etree.SubElement(
+                self._num_fmts, _sml("numFmt"), numFmtId=str(new_id), formatCode=code
+            )
+            self._num_fmts.set("count", str(len(self._num_fmts)))
+            self._fmt_ids[code] = new_id
+        return self._fmt_ids[code]
+
+    def xf_with_format(self, base: int, code: str) -> int:
+        key = (base, code)
+        if key not in self._xf_cache:
+            if base >= len(self._cell_xfs):
+                base = 0
+            xf = copy.deepcopy(self._cell_xfs[base])
+            xf.set("numFmtId", str(self._num_fmt_id(code)))
+            xf.set("applyNumberFormat", "1")
+            self._cell_xfs.append(xf)
+            self._cell_xfs.set("count", str(len(self._cell_xfs)))
+            self._xf_cache[key] = len(self._cell_xfs) - 1
+            self.changed = True
+        return self._xf_cache[key]
+
+    def tobytes(self) -> bytes:
+        return etree.tostring(
+            self.root, xml_declaration=True, encoding="UTF-8", standalone=True
+        )
+
+
+def _sheet_edits(spec: SheetSpec) -> Dict[int, Dict[int, List[Any]]]:
+    """Flatten a SheetSpec into {row: {col: [value-or-_UNSET, number_format-or-None]}}."""
+    edits: Dict[int, Dict[int, List[Any]]] = {}
+
+    def slot(addr_row: int, addr_col: int) -> List[Any]:
+        return edits.setdefault(addr_row, {}).setdefault(addr_col, [_UNSET, None])
+
+    for r_idx, row in enumerate(spec.data, start=1):
+        for c_idx, value in enumerate(row, start=1):
+            slot(r_idx, c_idx)[0] = value
+    for addr, formula in spec.formulas.items():
+        col, row_no = coordinate_from_string(addr)
+        slot(row_no, column_index_from_string(col))[0] = formula
+    for addr, fmt in spec.number_formats.items():
+        col, row_no = coordinate_from_string(addr)
+        slot(row_no, column_index_from_string(col))[1] = fmt
+    return edits
+
+
+def _set_cell_value(cell: Any, value: Any) -> None:
+    for child in list(cell):
+        if child.tag in (_sml("f"), _sml("v"), _sml("is")):
+            cell.remove(child)
+    cell.attrib.pop("t", None)
+    if value is None:
+        return
+    if isinstance(value, str) and value.startswith("="):
+        etree.SubElement(cell, _sml("f")).text = value[1:]
+    elif isinstance(value, bool):
+        cell.set("t", "b")
+        etree.SubElement(cell, _sml("v")).text = "1" if value else "0"
+    elif isinstance(value, (int, float)):
+        etree.SubElement(cell, _sml("v")).text = repr(value)
+    else:
+        text = str(value)
+        cell.set("t", "inlineStr")
+        t = etree.SubElement(etree.SubElement(cell, _sml("is")), _sml("t"))
+        t.text = text
+        if text != text.strip():
+            t.set("{http://www.w3.org/XML/1998/namespace}space", "preserve")
+
+
+def _patch_row(
+    row: Any,
+    row_no: int,
+    edits: Dict[int, List[Any]],
+    styles: Optional[_XlsxStylePatcher],
+) -> Any:
+    cells: Dict[int, Any] = {}
+    next_col = 1
+    for cell in row.findall(_sml("c")):
+        ref = cell.get("r")
+        col = column_index_from_string(coordinate_from_string(ref)[0]) if ref else next_col
+        cells[col] = cell
+        next_col = col + 1
+
+    for col, (value, fmt) in edits.items():
+        cell = cells.get(col)
+        if cell is None:
+            cell = etree.Element(
+                _sml("c"), r=f"{get_column_letter(col)}{row_no}", nsmap={None: _SML_NS}
+            )
+            cells[col] = cell
+        formula = cell.find(_sml("f"))
+        if formula is not None and formula.get("t") in ("shared", "array") and formula.get("ref"):
+            raise _XlsxPatchUnsupported("edit touches a shared/array formula anchor")
+        if value is not _UNSET:
+            _set_cell_value(cell, value)
+        if fmt is not None and styles is not None:
+            cell.set("s", str(styles.xf_with_format(int(cell.get("s", "0")), fmt)))
+
+    trailing = [child for child in row if child.tag != _sml("c")]  # e.g. extLst
+    out = etree.Element(row.tag, dict(row.attrib), nsmap=row.nsmap or {None: _SML_NS})
+    out.set("r", str(row_no))
+    out.attrib.pop("spans", None)
+    for col in sorted(cells):
+        out.append(cells[col])
+    out.extend(trailing)
+    return out
+
+
+def _merge_cols(cols: Optional[Any], widths: Dict[int, float]) -> Any:
+    """Return a <cols> element with `widths` applied, splitting existing ranges as needed."""
+    ranges: List[Tuple[int, int, Dict[str, str]]] = []
+    if cols is not None:
+        for col in cols:
+            ranges.append((int(col.get("min")), int(col.get("max")), dict(col.attrib)))
+    for idx, width in widths.items():
+        updated: List[Tuple[int, int, Dict[str, str]]] = []
+        attrs: Dict[str, str] = {}
+        for lo, hi, a in ranges:
+            if lo <= idx <= hi:
+                attrs = dict(a)
+                if lo < idx:
+                    updated.append((lo, idx - 1, a))
+                if idx < hi:
+                    updated.append((idx + 1, hi, a))
+            else:
+                updated.append((lo, hi, a))
+        attrs.update(width=repr(float(width)), customWidth="1")
+        updated.append((idx, idx, attrs))
+        ranges = sorted(updated, key=lambda r: r[0])
+
+    out = etree.Element(_sml("cols"), nsmap={None: _SML_NS})
+    for lo, hi, a in ranges:
+        a = dict(a, min=str(lo), max=str(hi))
+        etree.SubElement(out, _sml("col"), a)
+    return out
+
+
+_XMLNS_DECL_RE = re.compile(rb'\sxmlns(?::[\w.\-]+)?="[^"]*"')
+
+
+def _split_tags(elem: Any) -> Tuple[bytes, bytes]:
+    """Return the serialized start and end tags of `elem` (without its children)."""
+    shell = etree.Element(elem.tag, dict(elem.attrib), nsmap=elem.nsmap)
+    shell.text = ""
+    raw = etree.tostring(shell)
+    cut = raw.rindex(b"</")
+    return raw[:cut], raw[cut:]
+
+
+def _patch_sheet_xml(
+    source: Any,
+    spec: SheetSpec,
+    styles: Optional[_XlsxStylePatcher],
+) -> bytes:
+    """Stream a worksheet part, applying `spec`; rows are parsed and written one at a time."""
+    edits = _sheet_edits(spec)
+    pending = sorted(edits)
+    out = io.BytesIO()
+    out.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n')
+    depth = 0
+    root = None
+    root_decls: set = set()
+    closers: List[bytes] = []
+    cols_written = False
+
+    def write(elem: Any) -> None:
+        # Children are serialized on their own, so drop the namespace declarations
+        # the root start tag already carries.
+        raw = etree.tostring(elem, with_tail=False)
+        head_end = raw.index(b">")
+        head = _XMLNS_DECL_RE.sub(
+            lambda m: b"" if m.group(0).strip() in root_decls else m.group(0),
+            raw[:head_end],
+        )
+        out.write(head + raw[head_end:])
+
+    def extent() -> Tuple[int, int, int, int]:
+        cols_used = [c for r in edits.values() for c in r]
+        return (min(cols_used), min(edits), max(cols_used), max(edits))
+
+    def flush_new_rows(before: Optional[int]) -> None:
+        while pending and (before is None or pending[0] < before):
+            row_no = pending.pop(0)
+            empty = etree.Element(_sml("row"), r=str(row_no), nsmap={None: _SML_NS})
+            write(_patch_row(empty, row_no, edits[row_no], styles))
+
+    for event, elem in etree.iterparse(source, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 1:
+                root = elem
+                opener, closer = _split_tags(elem)
+                root_decls = {m.group(0).strip() for m in _XMLNS_DECL_RE.finditer(opener)}
+                out.write(opener)
+                closers.append(closer)
+            elif depth == 2 and elem.tag == _sml("sheetData"):
+                if spec.column_widths and not cols_written:
+                    write(_merge_cols(None, spec.column_widths))
+                    cols_written = True
+                opener, closer = _split_tags(elem)
+                out.write(_XMLNS_DECL_RE.sub(b"", opener))
+                closers.append(_XMLNS_DECL_RE.sub(b"", closer))
+            continue
+
+        depth -= 1
+        if depth == 2 and elem.tag == _sml("row"):
+            row_no = int(elem.get("r", "0"))
+            flush_new_rows(row_no)
+            if row_no in edits:
+                if pending and pending[0] == row_no:
+                    pending.pop(0)
+                write(_patch_row(elem, row_no, edits[row_no], styles))
+            else:
+                write(elem)
+            elem.clear()
+            parent = elem.getparent()
+            while elem.getprevious() is not None:
+                del parent[0]
+        elif depth == 1:
+            if elem.tag == _sml("sheetData"):
+                flush_new_rows(None)
+                out.write(closers.pop())
+            elif elem.tag == _sml("dimension") and edits:
+                lo_c, lo_r, hi_c, hi_r = extent()
+                try:
+                    c1, r1, c2, r2 = range_boundaries(elem.get("ref", "A1"))
+                    lo_c, lo_r = min(lo_c, c1 or lo_c), min(lo_r, r1 or lo_r)
+                    hi_c, hi_r = max(hi_c, c2 or hi_c), max(hi_r, r2 or hi_r)
+                except ValueError:
+                    pass
+                elem.set(
+                    "ref",
+                    f"{get_column_letter(lo_c)}{lo_r}:{get_column_letter(hi_c)}{hi_r}",
+                )
+                write(elem)
+            elif elem.tag == _sml("cols") and spec.column_widths:
+                write(_merge_cols(elem, spec.column_widths))
+                cols_written = True
+            else:
+                write(elem)
+            elem.clear()
+            while elem.getprevious() is not None:
+                del root[0]
+        elif depth == 0:
+            out.write(closers.pop())
+    return out.getvalue()
+
+
+def _patch_workbook_xml(xml: bytes) -> bytes:
+    """Force a full recalculation on open, since cached formula results may be stale."""
+    root = etree.fromstring(xml)
+    calc = root.find(_sml("calcPr"))
+    if calc is None:
+        calc = etree.Element(_sml("calcPr"))
+        anchor = 0
+        for i, child in enumerate(root):
+            if etree.QName(child).localname in _WORKBOOK_BEFORE_CALCPR:
+                anchor = i + 1
+        root.insert(anchor, calc)
+    calc.set("fullCalcOnLoad", "1")
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+
+def _drop_part_references(rels_xml: bytes, ct_xml: bytes, member: str, rel_id: str) -> Tuple[bytes, bytes]:
+    rels = etree.fromstring(rels_xml)
+    for rel in list(rels):
+        if rel.get("Id") == rel_id:
+            rels.remove(rel)
+    types = etree.fromstring(ct_xml)
+    for override in list(types):
+        if override.get("PartName") == f"/{member}":
+            types.remove(override)
+    return (
+        etree.tostring(rels, xml_declaration=True, encoding="UTF-8", standalone=True),
+        etree.tostring(types, xml_declaration=True, encoding="UTF-8", standalone=True),
+    )
+
+
+def _patch_xlsx(existing: bytes, instr: ExcelInstructions) -> bytes:
+    """
+    Apply SheetSpec edits to the named existing sheets only. Edited sheets are
+    streamed row by row; every other member is copied raw. The calc chain is dropped
+    and a full recalculation is requested, as openpyxl does on save.
+    """
+    if instr.chart or any(s.conditional_formatting for s in instr.sheets):
+        raise _XlsxPatchUnsupported("charts/conditional formatting need the full path")
+
+    replaced: Dict[str, bytes] = {}
+    dropped: set = set()
+    with zipfile.ZipFile(io.BytesIO(existing)) as src:
+        workbook = next(
+            (m for t, m in _rel_targets(src, "").values() if t == _REL_OFFICE_DOCUMENT),
+            None,
+        )
+        if not workbook:
+            raise _XlsxPatchUnsupported("no workbook part")
+        wb_rels = _rel_targets(src, workbook)
+        wb_xml = src.read(workbook)
+        sheets_el = etree.fromstring(wb_xml).find(_sml("sheets"))
+        sheet_members = {
+            sh.get("name"): wb_rels.get(sh.get(f"{{{_OFFICE_REL_NS}}}id"), ("", ""))[1]
+            for sh in (sheets_el if sheets_el is not None else [])
+        }
+        names = [s.name for s in instr.sheets]
+        if len(set(names)) != len(names) or any(not sheet_members.get(n) for n in names):
+            raise _XlsxPatchUnsupported("new or repeated sheets need the full path")
+
+        styles: Optional[_XlsxStylePatcher] = None
+        styles_member = next((m for t, m in wb_rels.values() if t == _REL_STYLES), None)
+        if any(s.number_formats for s in instr.sheets):
+            if not styles_member:
+                raise _XlsxPatchUnsupported("number formats need a styles part")
+            styles = _XlsxStylePatcher(src.read(styles_member))
+
+        for spec in instr.sheets:
+            member = sheet_members[spec.name]
+            with src.open(member) as fh:
+                replaced[member] = _patch_sheet_xml(fh, spec, styles)
+
+        if styles is not None and styles.changed:
+            replaced[styles_member] = styles.tobytes()
+        replaced[workbook] = _patch_workbook_xml(wb_xml)
+
+        for rel_id, (rel_type, member) in wb_rels.items():
+            if rel_type == _REL_CALC_CHAIN and member in src.NameToInfo:
+                folder, base = posixpath.split(workbook)
+                rels_name = posixpath.join(folder, "_rels", f"{base}.rels")
+                replaced[rels_name], replaced["[Content_Types].xml"] = _drop_part_references(
+                    src.read(rels_name), src.read("[Content_Types].xml"), member, rel_id
+                )
+                dropped.add(member)
+
+        out = io.BytesIO()
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as dst:
+            for info in src.infolist():
+                if info.filename in dropped:
+                    continue
+                if info.filename in replaced:
+                    dst.writestr(info.filename, replaced[info.filename])
+                else:
+                    _zip_copy_raw(src, info, dst)
+    return out.getvalue()
+
+
+# ----------------------------
+# User profile cache (upload tags)
+# ----------------------------
+
+
+# Open WebUI installs every tool as a single file, so the two document tools each carry
+# this class (and the other shared helpers); tests/test_shared_helpers.py keeps the
+# copies identical.
+class _TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize: int, ttl: float) -> None:
+        with self._lock:
+            self.maxsize, self.ttl = maxsize, ttl
+            if ttl <= 0:
+                self._data.clear()
+            while len(self._data) > max(maxsize, 0):
+                self._data.popitem(last=False)
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Any, value: Any) -> None:
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Any = None) -> None:
+        """Drop one entry, or everything when key is None."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+
+_USER_CACHE = _TTLCache()
+
+
+def _request_profile(user: Optional[Dict[str, Any]]) -> Optional[Tuple[str, str]]:
+    """(email, name) as Open WebUI passed them in __user__ for this request, if present."""
+    if not isinstance(user, dict) or "email" not in user or "name" not in user:
+        return None
+    return user.get("email") or "", user.get("name") or ""
+
+
+def _lookup_user_profile(
+    user_id: str, current: Optional[Tuple[str, str]] = None
+) -> Tuple[Optional[Tuple[str, str]], bool]:
+    """
+    (email, name) for the storage tags, and whether it was had without a database read.
+    `current` is the profile from this request's __user__: it is already up to date
+    (a renamed user's next request carries the new name), so it is used as is and
+    refreshes the cache. Only requests without one fall back to the cache, then the DB.
+    """
+    if current is not None:
+        _USER_CACHE.put(user_id, current)
+        return current, True
+    profile = _USER_CACHE.get(user_id)
+    if profile is not None:
+        return profile, True
+    user_obj = Users.get_user_by_id(user_id)
+    if not user_obj:
+        return None, False
+    profile = (user_obj.email or "", user_obj.name or "")
+    _USER_CACHE.put(user_id, profile)
+    return profile, False
+
+
+def _invalidate_user_profile(user_id: Optional[str] = None) -> None:
+    """Forget a cached profile (e.g. after a rename), or all of them."""
+    _USER_CACHE.invalidate(user_id)
+
+
+# ----------------------------
+# Asset library
+# ----------------------------
+
+_ASSET_EXTS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif", ".tiff", ".webp")
+
+# Standard variant widths (px). A placement of width_inches gets the smallest variant
+# that still has _ASSET_DPI pixels per inch; larger originals are never embedded whole.
+_ASSET_WIDTHS = (256, 512, 1024, 2048)
+_ASSET_DPI = 200
+
+
+def _downscale(raw: bytes, width_px: int) -> bytes:
+    """Resize to width_px (aspect kept), same format; unchanged if already narrower."""
+    if PILImage is None:
+        return raw
+    with PILImage.open(io.BytesIO(raw)) as img:
+        if img.width <= width_px:
+            return raw
+        fmt = img.format if img.format in ("PNG", "JPEG") else "PNG"
+        height = max(1, round(img.height * width_px / img.width))
+        resized = img.resize((width_px, height), PILImage.LANCZOS)
+        out = io.BytesIO()
+        resized.save(out, fmt, **({"quality": 90} if fmt == "JPEG" else {"optimize": True}))
+    return out.getvalue()
+
+
+class _AssetStore:
+    """
+    Admin image library (valves.asset_dir): logos, signatures, letterhead art,
+    referenced by ImageSpec.asset_id (file name without extension).
+
+    A file is read and hashed once per mtime. Originals and resized variants sit in an
+    LRU keyed by (content hash, width), so identical files under different IDs share
+    entries and each variant is decoded and resized once per process.
+    """
+
+    def __init__(self) -> None:
+        self._root = ""
+        self._hashes: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+        self._variants = _TTLCache(maxsize=64, ttl=float("inf"))
+
+    def configure(self, root: str, cache_size: int) -> None:
+        self._root = root
+        self._variants.configure(cache_size, float("inf"))
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    @property
+    def cache_size(self) -> int:
+        return self._variants.maxsize
+
+    def _path(self, asset_id: str) -> str:
+        if not self._root:
+            raise PermissionError(
+                "The asset library is not configured. Ask an admin to set the asset_dir valve."
+            )
+        if os.path.basename(asset_id) != asset_id or asset_id.startswith("."):
+            raise ValueError(f"Invalid asset_id: {asset_id!r}")
+        for ext in _ASSET_EXTS + tuple(e.upper() for e in _ASSET_EXTS):
+            path = os.path.join(self._root, asset_id + ext)
+            if os.path.isfile(path):
+                return path
+        raise FileNotFoundError(f"Asset '{asset_id}' was not found in the asset library.")
+
+    def version(self, asset_id: str) -> Tuple[str, float]:
+        """(path, modification time) of the file behind asset_id."""
+        path = self._path(asset_id)
+        return path, os.path.getmtime(path)
+
+    def _original(self, path: str) -> Tuple[str, bytes]:
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            known = self._hashes.get(path)
+        if known is not None and known[0] == mtime:
+            raw = self._variants.get((known[1], 0))
+            if raw is not None:
+                return known[1], raw
+        with open(path, "rb") as fh:
+            raw = fh.read()
+        digest = hashlib.sha256(raw).hexdigest()
+        with self._lock:
+            self._hashes[path] = (mtime, digest)
+        self._variants.put((digest, 0), raw)
+        return digest, raw
+
+    def get(self, asset_id: str, width_inches: float) -> bytes:
+        """Image bytes for asset_id, sized for a placement width_inches wide."""
+        digest, raw = self._original(self._path(asset_id))
+        width = next((w for w in _ASSET_WIDTHS if w >= width_inches * _ASSET_DPI), 0)
+        if not width:
+            return raw
+        data = self._variants.get((digest, width))
+        if data is None:
+            data = _downscale(raw, width)
+            self._variants.put((digest, width), data)
+        return data
+
+
+_ASSETS = _AssetStore()
+
+
+def _image_bytes(im: ImageSpec) -> bytes:
+    if im.b64:
+        return base64.b64decode(im.b64)
+    return _ASSETS.get(im.asset_id or "", im.width_inches)
+
+
+# ----------------------------
+# Compact Markdown instructions
+# ----------------------------
+
+# `markdown` is a terse alternative to the JSON instructions: optional front matter
+# (`key: value` lines between `---` fences, using the instruction field names) followed
+# by Markdown blocks. It is read in one pass and mapped onto the same instruction model.
+
+_MD_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)(?:\s+#+)?\s*$")
+_MD_BREAK_RE = re.compile(r"^\s*(?:\*\s*){3,}$|^\s*(?:-\s*){3,}$|^\s*(?:_\s*){3,}$")
+_MD_ITEM_RE = re.compile(r"^\s*([-*+]|\d+[.)])\s+(.*)$")
+_MD_IMAGE_RE = re.compile(r"^!\[([^\]]*)\]\(([^)\s]+)\)\s*(?:\{([^{}]*)\})?\s*$")
+_MD_TABLE_SEP_RE = re.compile(r"^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$")
+_MD_ATTRS_RE = re.compile(r"\s*\{([^{}]*)\}\s*$")
+_MD_NUMBER_RE = re.compile(r"^-?\d+(\.\d+)?$")
+
+
+def _md_scalar(value: str) -> Any:
+    v = value.strip()
+    if len(v) >= 2 and v[0] == v[-1] and v[0] in "\"'":
+        return v[1:-1]
+    low = v.lower()
+    if low in ("true", "yes", "on"):
+        return True
+    if low in ("false", "no", "off"):
+        return False
+    if low in ("null", "none", "~", ""):
+        return None
+    if _MD_NUMBER_RE.match(v):
+        return float(v) if "." in v else int(v)
+    return v
+
+
+def _md_attrs(text: str) -> Tuple[str, Dict[str, Any]]:
+    """Split a trailing `{center size=14 font=Inter}` attribute block off a line."""
+    m = _MD_ATTRS_RE.search(text)
+    if not m:
+        return text, {}
+    attrs: Dict[str, Any] = {}
+    for token in m.group(1).split():
+        key, sep, value = token.partition("=")
+        attrs[key] = _md_scalar(value) if sep else True
+    return text[: m.start()], attrs
+
+
+def _md_cells(line: str) -> List[str]:
+    inner = line.strip()
+    if inner.startswith("|"):
+        inner = inner[1:]
+    if inner.endswith("|") and not inner.endswith("\\|"):
+        inner = inner[:-1]
+    return [c.strip().replace("\\|", "|") for c in re.split(r"(?<!\\)\|", inner)]
+
+
+class _MarkdownBlocks:
+    """
+    Single-pass block reader. feed() accepts text in arbitrary chunks and returns the
+    blocks completed so far; close() flushes the rest. Blocks are (kind, data) tuples:
+    ("meta", dict), ("heading", (level, text, attrs)), ("para", (text, attrs)),
+    ("item", (ordered, text, attrs)), ("code", (info, text)), ("table", (rows, header)),
+    ("image", (name, attrs)) and ("break", None).
+    """
+
+    def __init__(self) -> None:
+        self._tail = ""
+        self._state = "start"
+        self._meta: Dict[str, Any] = {}
+        self._para: List[str] = []
+        self._rows: List[List[str]] = []
+        self._header = False
+        self._code: Optional[Tuple[str, List[str]]] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        out: List[Tuple[str, Any]] = []
+        *lines, self._tail = (self._tail + chunk).split("\n")
+        for line in lines:
+            self._line(line.rstrip("\r"), out)
+        return out
+
+    def close(self) -> List[Tuple[str, Any]]:
+        out: List[Tuple[str, Any]] = []
+        if self._tail:
+            self._line(self._tail.rstrip("\r"), out)
+            self._tail = ""
+        if self._state == "meta":
+            raise ValueError("Markdown front matter is not closed with a '---' line.")
+        if self._code is not None:
+            out.append(("code", (self._code[0], "\n".join(self._code[1]))))
+            self._code = None
+        self._flush(out)
+        return out
+
+    def _flush(self, out: List[Tuple[str, Any]]) -> None:
+        if self._para:
+            text, attrs = _md_attrs(" ".join(self._para))
+            out.append(("para", (text, attrs)))
+            self._para = []
+        if self._rows:
+            out.append(("table", (self._rows, self._header)))
+            self._rows, self._header = [], False
+
+    def _line(self, line: str, out: List[Tuple[str, Any]]) -> None:
+        stripped = line.strip()
+        if self._state == "start":
+            if not stripped:
+                return
+            self._state = "body"
+            if stripped == "---":
+                self._state = "meta"
+                return
+        if self._state == "meta":
+            if stripped == "---":
+                self._state = "body"
+                out.append(("meta", self._meta))
+            elif stripped and not stripped.startswith("#"):
+                key, sep, value = stripped.partition(":")
+                if not sep:
+                    raise ValueError(f"Front matter line {stripped!r} is not 'key: value'.")
+                self._meta[key.strip()] = _md_scalar(value)
+            return
+        if self._code is not None:
+            if stripped.startswith("```"):
+                out.append(("code", (self._code[0], "\n".join(self._code[1]))))
+                self._code = None
+            else:
+                self._code[1].append(line)
+            return
+        if stripped.startswith("```"):
+            self._flush(out)
+            self._code = (stripped[3:].strip(), [])
+            return
+        if stripped.startswith("|"):
+            if self._para:
+                self._flush(out)
+            if self._rows and len(self._rows) == 1 and _MD_TABLE_SEP_RE.match(stripped):
+                self._header = True
+            else:
+                self._rows.append(_md_cells(stripped))
+            return
+        if self._rows or not stripped:
+            self._flush(out)
+            if not stripped:
+                return
+        m = _MD_HEADING_RE.match(stripped)
+        if m:
+            self._flush(out)
+            text, attrs = _md_attrs(m.group(2))
+            out.append(("heading", (len(m.group(1)), text, attrs)))
+            return
+        if _MD_BREAK_RE.match(stripped):
+            self._flush(out)
+            out.append(("break", None))
+            return
+        m = _MD_IMAGE_RE.match(stripped)
+        if m:
+            self._flush(out)
+            _, attrs = _md_attrs("{" + (m.group(3) or "") + "}")
+            attrs.setdefault("alt", m.group(1))
+            out.append(("image", (m.group(2), attrs)))
+            return
+        m = _MD_ITEM_RE.match(line)
+        if m:
+            self._flush(out)
+            text, attrs = _md_attrs(m.group(2))
+            out.append(("item", (m.group(1)[0].isdigit(), text, attrs)))
+            return
+        self._para.append(stripped)
+
+
+def _md_blocks(text: str) -> Iterator[Tuple[str, Any]]:
+    reader = _MarkdownBlocks()
+    yield from reader.feed(text)
+    yield from reader.close()
+
+
+_MD_EMPHASIS_RE = re.compile(r"\*\*(.+?)\*\*|(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])|`([^`]+)`")
+
+
+def _md_plain(text: str) -> Dict[str, Any]:
+    """Paragraph fields for Markdown text: markers are dropped; a paragraph that is
+    wholly **bold** or *italic* sets the flag (runs are paragraph-wide here)."""
+    fields: Dict[str, Any] = {}
+    whole = _MD_EMPHASIS_RE.fullmatch(text)
+    if whole and whole.group(1):
+        fields["bold"] = True
+    elif whole and whole.group(2):
+        fields["italic"] = True
+    fields["text"] = _MD_EMPHASIS_RE.sub(lambda m: next(g for g in m.groups() if g), text)
+    return fields
+
+
+def _md_paragraph_fields(attrs: Dict[str, Any]) -> Dict[str, Any]:
+    aliases = {"size": "font_size_pt", "font": "font_name"}
+    return {aliases.get(key, key): value for key, value in attrs.items()}
+
+
+def _md_cell(value: str) -> Union[str, int, float, None]:
+    if value == "":
+        return None
+    return _md_scalar(value) if _MD_NUMBER_RE.match(value) else value
+
+
+def _md_chart(body: str) -> Dict[str, Any]:
+    """```chart block: `type:`, `categories:` / `data_range:`, then `Series: 1, 2, 3`."""
+    chart: Dict[str, Any] = {"type": "bar"}
+    series: List[Dict[str, Any]] = []
+    for line in body.splitlines():
+        key, sep, value = line.partition(":")
+        key = key.strip()
+        if not sep or not key:
+            continue
+        if key in ("type", "data_range"):
+            chart[key] = value.strip()
+        elif key == "categories":
+            chart["categories"] = [c.strip() for c in value.split(",")]
+        else:
+            series.append({"name": key, "values": [_md_scalar(v) for v in value.split(",")]})
+    if series:
+        chart["series"] = series
+    return chart
+
+
+def _md_image(target: str, attrs: Dict[str, Any]) -> Dict[str, Any]:
+    """`![alt](logo.png)` names an attachment; `![alt](asset:logo)` a library asset."""
+    image: Dict[str, Any] = (
+        {"asset_id": target[6:]} if target.startswith("asset:") else {"name": target}
+    )
+    if "width" in attrs:
+        image["width_inches"] = attrs["width"]
+    return image
+
+
+def _md_word_payload(blocks: Iterator[Tuple[str, Any]]) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {}
+    paragraphs: List[Dict[str, Any]] = []
+    tables: List[Dict[str, Any]] = []
+    images: List[Dict[str, Any]] = []
+    for kind, data in blocks:
+        if kind == "meta":
+            payload.update(data)
+        elif kind == "heading":
+            level, body, attrs = data
+            paragraphs.append({**_md_plain(body), "style": f"Heading {level}", **_md_paragraph_fields(attrs)})
+        elif kind == "item":
+            ordered, body, attrs = data
+            style = "List Number" if ordered else "List Bullet"
+            paragraphs.append({**_md_plain(body), "style": style, **_md_paragraph_fields(attrs)})
+        elif kind == "para":
+            body, attrs = data
+            paragraphs.append({**_md_plain(body), **_md_paragraph_fields(attrs)})
+        elif kind == "code":
+            paragraphs.append({"text": data[1], "font_name": "Courier New"})
+        elif kind == "table":
+            tables.append({"rows": data[0]})
+        elif kind == "image":
+            images.append(_md_image(*data))
+    for key, items in (("paragraphs", paragraphs), ("tables", tables), ("images", images)):
+        if items:
+            payload[key] = items
+    return payload
+
+
+def _md_ppt_payload(blocks: Iterator[Tuple[str, Any]]) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {}
+    slides: List[Dict[str, Any]] = []
+
+    def current() -> Dict[str, Any]:
+        if not slides:
+            slides.append({})
+        return slides[-1]
+
+    for kind, data in blocks:
+        if kind == "meta":
+            payload.update(data)
+        elif kind == "heading":
+            level, body, _ = data
+            if level == 1 and not slides and "title" not in payload:
+                payload["title"] = _md_plain(body)["text"]
+            elif slides and not slides[-1]:
+                slides[-1]["title"] = _md_plain(body)["text"]  # right after a `---`
+            else:
+                slides.append({"title": _md_plain(body)["text"]})
+        elif kind == "break":
+            if slides and slides[-1]:
+                slides.append({})
+        elif kind in ("item", "para"):
+            current().setdefault("bullets", []).append(_md_plain(data[-2])["text"])
+        elif kind == "table":
+            current().setdefault("bullets", []).extend(
+                " | ".join(row) for row in data[0]
+            )
+        elif kind == "code" and data[0] == "chart":
+            current()["chart"] = _md_chart(data[1])
+        elif kind == "code":
+            current().setdefault("bullets", []).extend(data[1].splitlines())
+        elif kind == "image":
+            current().setdefault("images", []).append(_md_image(*data))
+    if any(slides):
+        payload["slides"] = [slide for slide in slides if slide]
+    return payload
+
+
+def _md_excel_payload(blocks: Iterator[Tuple[str, Any]]) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {}
+    sheets: List[Dict[str, Any]] = []
+
+    def current() -> Dict[str, Any]:
+        if not sheets:
+            sheets.append({"name": "Sheet1", "data": []})
+        return sheets[-1]
+
+    for kind, data in blocks:
+        if kind == "meta":
+            payload.update(data)
+        elif kind == "heading":
+            sheets.append({"name": _md_plain(data[1])["text"], "data": []})
+        elif kind == "table":
+            rows = current()["data"]
+            if rows:
+                rows.append([])
+            rows.extend([_md_cell(c) for c in row] for row in data[0])
+        elif kind in ("item", "para"):
+            current()["data"].append([_md_plain(data[-2])["text"]])
+        elif kind == "code" and data[0] == "chart":
+            payload["chart"] = _md_chart(data[1])
+    if sheets:
+        payload["sheets"] = sheets
+    return payload
+
+
+_MD_BUILDERS = {"docx": _md_word_payload, "pptx": _md_ppt_payload, "xlsx": _md_excel_payload}
+
+
+def _markdown_to_payload(file_type: str, text: str) -> Dict[str, Any]:
+    """
+    Map the compact Markdown format onto the instruction fields for file_type.
+    docx: headings -> 'Heading N' styles, list items -> 'List Bullet'/'List Number',
+    pipe tables and `![alt](name){width=2}` images. pptx: `# Title` (first) is the deck
+    title, each `##` heading or `---` line starts a slide, paragraphs and items are
+    bullets, a ```chart block is the slide chart. xlsx: each heading starts a sheet,
+    pipe tables are its rows (numbers and `=formulas` kept), a ```chart block sets the
+    workbook chart.
+    """
+    builder = _MD_BUILDERS.get(file_type)
+    if builder is None:
+        raise ValueError(f"Markdown instructions are not supported for {file_type!r}.")
+    return builder(_md_blocks(text))
+
+
+# ----------------------------
+# Draft previews (preview -> commit)
+# ----------------------------
+
+# operation='preview' stages the validated instruction tree (and, for modify, the
+# _SOURCES key of the source) here; operation='commit' renders it from the ID alone, so
+# the model never has to emit the full payload twice.
+_PREVIEWS = _TTLCache(maxsize=64, ttl=3600)
+
+_PREVIEW_CELL = 'style="border:1px solid #ccc; padding:4px 6px;"'
+
+
+def _preview_table(rows: List[List[Any]], limit: int) -> str:
+    out = ['<table style="border-collapse:collapse; margin:.5em 0;">']
+    for row in rows[:limit]:
+        cells = "".join(
+            f"<td {_PREVIEW_CELL}>{html.escape('' if v is None else str(v))}</td>" for v in row
+        )
+        out.append(f"<tr>{cells}</tr>")
+    out.append("</table>")
+    if len(rows) > limit:
+        out.append(f"<p><em>… {len(rows) - limit} more rows</em></p>")
+    return "".join(out)
+
+
+def _preview_more(total: int, limit: int, what: str) -> str:
+    return f"<p><em>… {total - limit} more {what}</em></p>" if total > limit else ""
+
+
+def _preview_html(file_type: str, instr: Any, limit: int) -> str:
+    """Lightweight HTML draft straight from the validated instructions (no rendering)."""
+    esc = html.escape
+    if file_type == "docx":
+        parts = ['<section data-doc="word" style="font-family: Calibri, Arial, sans-serif; line-height:1.5;">']
+        if instr.header_text:
+            parts.append(f'<header style="color:#777;">{esc(instr.header_text)}</header>')
+        for p in instr.paragraphs[:limit]:
+            text = esc(p.text)
+            if p.bold:
+                text = f"<b>{text}</b>"
+            if p.italic:
+                text = f"<i>{text}</i>"
+            heading = re.match(r"Heading (\d)$", p.style or "")
+            if heading:
+                parts.append(f"<h{heading.group(1)}>{text}</h{heading.group(1)}>")
+            elif p.style == "Title":
+                parts.append(f"<h1>{text}</h1>")
+            else:
+                size = f' style="font-size:{p.font_size_pt}pt;"' if p.font_size_pt else ""
+                parts.append(f"<p{size}>{text}</p>")
+        parts.append(_preview_more(len(instr.paragraphs), limit, "paragraphs"))
+        parts.extend(_preview_table(t.rows, limit) for t in instr.tables)
+        parts.extend(f"<figure>[Image: {esc(im.name or im.asset_id or 'embedded')}]</figure>" for im in instr.images)
+        if instr.footer_text:
+            parts.append(f'<footer style="color:#777;">{esc(instr.footer_text)}</footer>')
+    elif file_type == "pptx":
+        parts = ['<section data-doc="pptx" style="font-family: Segoe UI, Arial, sans-serif;">']
+        if instr.title:
+            parts.append(f"<h1>{esc(instr.title)}</h1>")
+        for n, slide in enumerate(instr.slides[:limit], start=1):
+            parts.append(
+                '<div style="border:1px solid #ddd; margin:.75em 0; padding:16px;">'
+                f"<small>Slide {n}</small><h2>{esc(slide.title or '')}</h2>"
+            )
+            if slide.bullets:
+                parts.append("<ul>" + "".join(f"<li>{esc(b)}</li>" for b in slide.bullets) + "</ul>")
+            if slide.chart:
+                names = ", ".join(str(s.get("name", "")) for s in slide.chart.get("series", []))
+                parts.append(f"<div>[Bar chart: {esc(names)}]</div>")
+            parts.extend(f"<div>[Image: {esc(im.name or im.asset_id or 'embedded')}]</div>" for im in slide.images)
+            parts.append("</div>")
+        parts.append(_preview_more(len(instr.slides), limit, "slides"))
+    else:
+        parts = ['<section data-doc="xlsx" style="font-family: Segoe UI, Arial, sans-serif;">']
+        for sheet in instr.sheets:
+            parts.append(f"<h2>{esc(sheet.name)}</h2>")
+            parts.append(_preview_table(sheet.data, limit))
+            if sheet.formulas:
+                formulas = ", ".join(f"{k} {v}" for k, v in list(sheet.formulas.items())[:limit])
+                parts.append(f"<p><small>Formulas: {esc(formulas)}</small></p>")
+        if instr.chart:
+            parts.append(f"<div>[Bar chart: {esc(str(instr.chart.get('data_range', '')))}]</div>")
+    parts.append("</section>")
+    return "".join(parts)
+
+
+def _read_source_file(
+    expected_ext: str,
+    files: List[Dict[str, Any]],
+    hint: Optional[str],
+    source_path: Optional[str],
+    allow_server_paths: bool,
+) -> bytes:
+    """Bytes of the document to modify, from the attachments or (admin) a server path."""
+    existing_bytes: Optional[bytes] = None
+    pick = _find_attached_file(expected_ext, files, hint)
+    if pick:
+        _, existing_bytes = pick
+
+    if not existing_bytes and source_path:
+        if allow_server_paths and os.path.isfile(source_path):
+            with open(source_path, "rb") as fh:
+                existing_bytes = fh.read()
+        else:
+            raise PermissionError(
+                "Server path access is disabled. Attach the file to the chat or enable allow_server_paths."
+            )
+    if not existing_bytes:
+        raise FileNotFoundError(
+            f"No existing {expected_ext} file found to modify. Attach a file or provide a valid source_path."
+        )
+    return existing_bytes
+
+
+# ----------------------------
+# Source documents (repeated modify)
+# ----------------------------
+
+# Parsed lxml trees of python-docx/python-pptx take about this many times the
+# uncompressed size of the package's XML parts.
+_PARSED_XML_FACTOR = 4
+
+
+class _SourceCache:
+    """
+    Source documents of 'modify' (and 'inspect'/'preview') calls, per user and chat,
+    keyed by content hash, so a chat that modifies the same attachment, or its own
+    previous output, several times decodes and parses it once.
+
+    Attachments and generated files are also indexed by file_id; such a hit skips the
+    base64 decode or disk read. A .docx/.pptx is parsed (as a _zip_skeleton) on first
+    use, and every checkout gets a deep copy, as with templates, so the cached document
+    is never mutated. .xlsx sources keep only their bytes: patch mode works on the
+    bytes, and an unpickled openpyxl snapshot is barely faster than load_workbook.
+    Entries are evicted least-recently-used once their estimated memory exceeds
+    max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._file_ids: Dict[Tuple[str, str], str] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def configure(self, max_bytes: int) -> None:
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._entries and self._size > max(self.max_bytes, 0):
+            (scope, digest), entry = self._entries.popitem(last=False)
+            self._size -= entry["cost"]
+            for file_id in entry["file_ids"]:
+                if self._file_ids.get((scope, file_id)) == digest:
+                    del self._file_ids[(scope, file_id)]
+
+    def add(self, scope: str, data: bytes, file_id: Optional[str] = None) -> str:
+        """Remember data (and its file_id) for this scope; returns the content hash."""
+        digest = hashlib.sha256(data).hexdigest()
+        if self.max_bytes <= 0:
+            return digest
+        with self._lock:
+            key = (scope, digest)
+            if key not in self._entries:
+                self._entries[key] = {
+                    "data": data,
+                    "parsed": None,
+                    "cost": len(data),
+                    "file_ids": set(),  # attachment/output ids mapped to this entry
+                }
+                self._size += len(data)
+            self._entries.move_to_end(key)
+            if file_id:
+                self._file_ids[(scope, file_id)] = digest
+                self._entries[key]["file_ids"].add(file_id)
+            self._evict()
+        return digest
+
+    def data(self, scope: str, digest: str) -> Optional[bytes]:
+        """Bytes of the source with this content hash in this scope, if still cached."""
+        with self._lock:
+            entry = self._entries.get((scope, digest))
+            if entry is None:
+                return None
+            self._entries.move_to_end((scope, digest))
+            return entry["data"]
+
+    def lookup(self, scope: str, file_id: str) -> Optional[Tuple[str, bytes]]:
+        """(content hash, bytes) of a file seen earlier in this scope, if still cached."""
+        with self._lock:
+            digest = self._file_ids.get((scope, file_id))
+            entry = self._entries.get((scope, digest)) if digest else None
+            if entry is None:
+                self._file_ids.pop((scope, file_id), None)
+                return None
+            self._entries.move_to_end((scope, digest))
+            return digest, entry["data"]
+
+    def checkout(self, scope: str, digest: str, file_type: str) -> Optional[Tuple[Any, set]]:
+        """
+        (independent copy of the parsed skeleton document, hollow member names) for a
+        cached .docx/.pptx, or None (other types, evicted entries).
+        """
+        if file_type not in ("docx", "pptx"):
+            return None
+        with self._lock:
+            entry = self._entries.get((scope, digest))
+            parsed = entry["parsed"] if entry is not None else None
+            if parsed is not None:
+                self.hits += 1
+                self._entries.move_to_end((scope, digest))
+        if entry is None:
+            return None
+        if parsed is None:
+            self.misses += 1
+            opener = DocxDocument if file_type == "docx" else Presentation
+            parsed = _open_skeleton(entry["data"], opener)
+            with zipfile.ZipFile(io.BytesIO(entry["data"])) as zf:
+                xml = sum(i.file_size for i in zf.infolist() if i.filename not in parsed[1])
+            with self._lock:
+                if self._entries.get((scope, digest)) is entry and entry["parsed"] is None:
+                    entry["parsed"] = parsed
+                    entry["cost"] += _PARSED_XML_FACTOR * xml
+                    self._size += _PARSED_XML_FACTOR * xml
+                    self._evict()
+        return copy.deepcopy(parsed[0]), set(parsed[1])
+
+
+_SOURCES = _SourceCache()
+
+
+def _source_document(
+    scope: str,
+    expected_ext: str,
+    files: List[Dict[str, Any]],
+    hint: Optional[str],
+    source_path: Optional[str],
+    allow_server_paths: bool,
+    base_file_id: Optional[str] = None,
+) -> Tuple[str, bytes]:
+    """
+    (content hash, bytes) of the source document: an earlier result of this chat by
+    base_file_id, an attachment already seen in this chat, or a freshly read one.
+    """
+    if base_file_id:
+        found = _SOURCES.lookup(scope, base_file_id)
+        if found is None:
+            raise FileNotFoundError(
+                f"Unknown or expired base_file_id for this chat. Attach the {expected_ext} file to modify instead."
+            )
+        return found
+    pick = _pick_attached_file(
+        expected_ext, files, hint, lambda file_id: (_SOURCES.lookup(scope, file_id) or (None, None))[1]
+    )
+    if pick is None:
+        data = _read_source_file(expected_ext, files, hint, source_path, allow_server_paths)
+        return _SOURCES.add(scope, data), data
+    file_id, _, data = pick
+    found = _SOURCES.lookup(scope, file_id) if file_id else None
+    if found is not None and found[1] is data:
+        return found
+    return _SOURCES.add(scope, data, file_id), data
+
+
+# ----------------------------
+# Inspect (structural summary)
+# ----------------------------
+
+# Summaries keyed by (content hash, file type, item limit). The same bytes always give
+# the same summary, so re-inspecting a re-attached file costs one hash instead of a parse.
+_INSPECTIONS = _TTLCache(maxsize=128, ttl=3600)
+
+_PML_NS = "http://schemas.openxmlformats.org/presentationml/2006/main"
+_REL_CORE_PROPERTIES = (
+    "http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties"
+)
+_DC_TITLE = "{http://purl.org/dc/elements/1.1/}title"
+_HEADING_STYLE_RE = re.compile(r"heading\s*(\d)$", re.IGNORECASE)
+_EMU_PER_INCH = 914400
+_TWIPS_PER_INCH = 1440
+
+
+def _pml(tag: str) -> str:
+    return f"{{{_PML_NS}}}{tag}"
+
+
+def _size_label(data: bytes) -> str:
+    return f"{len(data) / 1e6:.2f} MB" if len(data) >= 1e6 else f"{len(data) / 1e3:.0f} KB"
+
+
+def _short(value: Any, width: int = 40) -> str:
+    text = " ".join(str(value).split())
+    return text if len(text) <= width else text[: width - 1] + "…"
+
+
+def _package_part(zf: zipfile.ZipFile, rel_type: str, source: str = "") -> Optional[str]:
+    """Member name of the first relationship of rel_type from `source` ('' = package)."""
+    for kind, member in _rel_targets(zf, source).values():
+        if kind == rel_type and member in zf.NameToInfo:
+            return member
+    return None
+
+
+def _package_title(zf: zipfile.ZipFile) -> Optional[str]:
+    core = _package_part(zf, _REL_CORE_PROPERTIES)
+    if not core:
+        return None
+    title = etree.fromstring(zf.read(core)).findtext(_DC_TITLE)
+    return _short(title, 80) if title and title.strip() else None
+
+
+def _heading_levels(zf: zipfile.ZipFile, document: str) -> Dict[str, int]:
+    """styleId -> outline level (0 = Title, 1 = Heading 1, ...) for heading-like styles."""
+    styles = _package_part(zf, _OFFICE_REL_NS + "/styles", document)
+    levels: Dict[str, int] = {}
+    if not styles:
+        return levels
+    for style in etree.fromstring(zf.read(styles)).iterfind(qn("w:style")):
+        if style.get(qn("w:type")) != "paragraph":
+            continue
+        name_el = style.find(qn("w:name"))
+        name = name_el.get(qn("w:val"), "") if name_el is not None else ""
+        outline = style.find(f"{qn('w:pPr')}/{qn('w:outlineLvl')}")
+        match = _HEADING_STYLE_RE.match(name)
+        if match:
+            levels[style.get(qn("w:styleId"), "")] = int(match.group(1))
+        elif name.lower() == "title":
+            levels[style.get(qn("w:styleId"), "")] = 0
+        elif outline is not None and (outline.get(qn("w:val")) or "").isdigit():
+            levels[style.get(qn("w:styleId"), "")] = int(outline.get(qn("w:val"))) + 1
+    return levels
+
+
+def _inspect_docx(data: bytes, limit: int) -> str:
+    """
+    Headings and tables in document order, plus counts and page setup. The body is
+    streamed with iterparse and freed element by element; media is never read.
+    """
+    w_body, w_p, w_tbl, w_t = qn("w:body"), qn("w:p"), qn("w:tbl"), qn("w:t")
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        document = _package_part(zf, _REL_OFFICE_DOCUMENT) or "word/document.xml"
+        levels = _heading_levels(zf, document)
+        title = _package_title(zf)
+
+        outline: List[str] = []
+        shown = paragraphs = tables = images = words = sections = 0
+        depth = 0
+        page = ""
+        for _, el in etree.iterparse(
+            zf.open(document), events=("end",), tag=(w_p, w_tbl, qn("w:sectPr"))
+        ):
+            parent = el.getparent()
+            if parent is None or parent.tag != w_body:
+                if el.tag == qn("w:sectPr"):
+                    sections += 1  # section break inside a paragraph's pPr
+                continue
+            images += sum(1 for _ in el.iter(qn("w:drawing"), qn("w:pict")))
+            text = "".join(t.text or "" for t in el.iter(w_t)).strip()
+            words += len(text.split())
+            if el.tag == w_p:
+                paragraphs += 1
+                style = el.find(f"{qn('w:pPr')}/{qn('w:pStyle')}")
+                level = levels.get(style.get(qn("w:val"), "")) if style is not None else None
+                if level is not None and text:
+                    depth = max(level - 1, 0)
+                    if len(outline) < limit:
+                        kind = "Title" if level == 0 else f"H{level}"
+                        outline.append(f"{'  ' * depth}- {kind}: {_short(text, 80)}")
+                    shown += 1
+            elif el.tag == w_tbl:
+                tables += 1
+                rows = el.findall(qn("w:tr"))
+                cols = len(rows[0].findall(qn("w:tc"))) if rows else 0
+                if len(outline) < limit:
+                    first = [
+                        _short("".join(t.text or "" for t in tc.iter(w_t)), 20)
+                        for tc in (rows[0].findall(qn("w:tc")) if rows else [])[:8]
+                    ]
+                    head = f" ({' | '.join(first)})" if any(first) else ""
+                    indent = "  " * (depth + 1 if shown else 0)
+                    outline.append(f"{indent}- Table {tables}: {len(rows)}×{cols}{head}")
+                shown += 1
+            else:
+                sections += 1
+                size = el.find(qn("w:pgSz"))
+                if size is not None and size.get(qn("w:w")) and size.get(qn("w:h")):
+                    page = (
+                        f"{int(size.get(qn('w:w'))) / _TWIPS_PER_INCH:.4g}×"
+                        f"{int(size.get(qn('w:h'))) / _TWIPS_PER_INCH:.4g} in"
+                    )
+            el.clear()
+            while el.getprevious() is not None:
+                del parent[0]
+
+    lines = [
+        f"DOCX, {paragraphs} paragraphs, {tables} tables, {images} images, "
+        f"~{words:,} words, {_size_label(data)}"
+    ]
+    if page or sections > 1:
+        lines.append(f"Page: {page or 'default'}, {max(sections, 1)} section(s)")
+    if title:
+        lines.append(f"Title: {title}")
+    if outline:
+        lines.append("Structure:")
+        lines.extend(outline)
+        if shown > len(outline):
+            lines.append(f"… {shown - len(outline)} more headings/tables")
+    else:
+        lines.append("Structure: no headings or tables")
+    return "\n".join(lines)
+
+
+def _inspect_pptx(data: bytes, limit: int) -> str:
+    """Slide size and, for the first `limit` slides, title and content kinds. Other slides are only counted."""
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        presentation = _package_part(zf, _REL_OFFICE_DOCUMENT) or "ppt/presentation.xml"
+        rels = _rel_targets(zf, presentation)
+        root = etree.fromstring(zf.read(presentation))
+        slide_ids = root.findall(f"{_pml('sldIdLst')}/{_pml('sldId')}")
+        title = _package_title(zf)
+
+        lines = [f"PPTX, {len(slide_ids)} slides, {_size_label(data)}"]
+        size = root.find(_pml("sldSz"))
+        if size is not None and int(size.get("cy", 0)):
+            cx, cy = int(size.get("cx", 0)), int(size.get("cy", 0))
+            ratio = next((r for r, v in (("16:9", 16 / 9), ("4:3", 4 / 3)) if abs(cx / cy - v) < 0.01), "")
+            lines[0] += f", {cx / _EMU_PER_INCH:.4g}×{cy / _EMU_PER_INCH:.4g} in"
+            lines[0] += f" ({ratio})" if ratio else ""
+        if title:
+            lines.append(f"Title: {title}")
+
+        for n, sld in enumerate(slide_ids[:limit], start=1):
+            member = rels.get(sld.get(qn("r:id"), ""), ("", ""))[1]
+            if member not in zf.NameToInfo:
+                lines.append(f"{n}. (missing slide part)")
+                continue
+            slide = etree.fromstring(zf.read(member))
+            heading = ""
+            for sp in slide.iter(_pml("sp")):
+                ph = sp.find(f"{_pml('nvSpPr')}/{_pml('nvPr')}/{_pml('ph')}")
+                if ph is not None and ph.get("type") in ("title", "ctrTitle"):
+                    heading = "".join(t.text or "" for t in sp.iter(qn("a:t"))).strip()
+                    break
+            kinds = []
+            pictures = sum(1 for _ in slide.iter(_pml("pic")))
+            if pictures:
+                kinds.append(f"{pictures} picture{'s' if pictures > 1 else ''}")
+            uris = [g.get("uri", "") for g in slide.iter(qn("a:graphicData"))]
+            if any(u.endswith("/table") for u in uris):
+                kinds.append("table")
+            if any(u.endswith("/chart") for u in uris):
+                kinds.append("chart")
+            if any(kind.endswith("/notesSlide") for kind, _ in _rel_targets(zf, member).values()):
+                kinds.append("notes")
+            if slide.get("show") == "0":
+                kinds.append("hidden")
+            extra = f" ({', '.join(kinds)})" if kinds else ""
+            lines.append(f"{n}. {_short(heading, 80) or '(untitled)'}{extra}")
+        if len(slide_ids) > limit:
+            lines.append(f"… {len(slide_ids) - limit} more slides")
+    return "\n".join(lines)
+
+
+def _inspect_xlsx(data: bytes, limit: int) -> str:
+    """Sheet names, used ranges and header rows via a read-only (streaming) workbook."""
+    wb = load_workbook(io.BytesIO(data), read_only=True)
+    try:
+        names = wb.sheetnames
+        lines = [f"XLSX, {len(names)} sheets, {_size_label(data)}"]
+        for name in names[:limit]:
+            ws = wb[name]
+            if not hasattr(ws, "iter_rows"):
+                lines.append(f"- {name}: chart sheet")
+                continue
+            try:
+                used = ws.calculate_dimension()
+            except ValueError:  # no <dimension> element; finding it would mean a full scan
+                used = None
+            if used and ws.max_row and ws.max_column:
+                extent = f"{used} ({ws.max_row:,} rows × {ws.max_column} cols)"
+            else:
+                extent = "size not recorded"
+            header = next(ws.iter_rows(min_row=1, max_row=1, max_col=12, values_only=True), ())
+            values = list(header)
+            while values and values[-1] is None:
+                values.pop()
+            head = f"; header: {' | '.join(_short('' if v is None else v, 24) for v in values)}" if values else ""
+            lines.append(f"- {name}: {extent}{head}")
+        if len(names) > limit:
+            lines.append(f"… {len(names) - limit} more sheets")
+    finally:
+        wb.close()
+    return "\n".join(lines)
+
+
+_INSPECTORS = {"docx": _inspect_docx, "pptx": _inspect_pptx, "xlsx": _inspect_xlsx}
+
+
+# ----------------------------
+# Revisions (JSON-Patch deltas)
+# ----------------------------
+
+# Validated instruction tree of every generated file (and the _SOURCES key of the file
+# it modified), keyed by its file_id, so that operation='revise' can apply a small patch
+# instead of receiving the whole payload again.
+_GENERATIONS = _TTLCache(maxsize=128, ttl=3600)
+
+def _pointer_tokens(path: str) -> List[str]:
+    if not path.startswith("/"):
+        raise ValueError(f"Invalid patch path {path!r}: paths start with '/'.")
+    return [t.replace("~1", "/").replace("~0", "~") for t in path[1:].split("/")]
+
+
+def _pointer_child(node: Any, token: str, path: str) -> Any:
+    if isinstance(node, dict) and token in node:
+        return node[token]
+    if isinstance(node, list) and token.isdigit() and int(token) < len(node):
+        return node[int(token)]
+    raise ValueError(f"Patch path {path!r} does not exist in the document.")
+
+
+def _apply_json_patch(doc: Dict[str, Any], patch: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Apply an RFC 6902 subset (add, remove, replace, test) to a copy of `doc`.
+    "-" as the last token of an 'add' path appends to a list.
+    """
+    doc = copy.deepcopy(doc)
+    for n, op in enumerate(patch, 1):
+        kind, path = op.get("op"), op.get("path")
+        if kind not in ("add", "remove", "replace", "test") or not isinstance(path, str):
+            raise ValueError(f"Patch op {n}: needs 'op' (add/remove/replace/test) and a 'path'.")
+        if kind != "remove" and "value" not in op:
+            raise ValueError(f"Patch op {n} ({kind} {path}): missing 'value'.")
+        tokens = _pointer_tokens(path)
+        if not tokens or tokens == [""]:
+            raise ValueError(f"Patch op {n}: the document root cannot be patched.")
+        parent: Any = doc
+        for token in tokens[:-1]:
+            parent = _pointer_child(parent, token, path)
+        last = tokens[-1]
+        if kind == "test":
+            if _pointer_child(parent, last, path) != op["value"]:
+                raise ValueError(f"Patch op {n}: test failed at {path!r}.")
+        elif isinstance(parent, list):
+            if kind == "add" and last == "-":
+                parent.append(op["value"])
+            elif kind == "add" and last.isdigit() and int(last) <= len(parent):
+                parent.insert(int(last), op["value"])
+            else:
+                _pointer_child(parent, last, path)
+                if kind == "remove":
+                    del parent[int(last)]
+                else:
+                    parent[int(last)] = op["value"]
+        elif isinstance(parent, dict):
+            if kind != "add":
+                _pointer_child(parent, last, path)
+            if kind == "remove":
+                del parent[last]
+            else:
+                parent[last] = op["value"]
+        else:
+            raise ValueError(f"Patch path {path!r} does not exist in the document.")
+    return doc
+
+
+# ----------------------------
+# Worker processes
+# ----------------------------
+
+
+def _read_own_source() -> Optional[str]:
+    # Open WebUI execs a tool from a temporary file that it deletes after loading.
+    try:
+        with open(__file__, encoding="utf-8") as fh:
+            return fh.read()
+    except (NameError, OSError):
+        return None
+
+
+_MODULE_SOURCE = _read_own_source()
+
+# Initializer of every worker, run through the builtin exec so that it unpickles
+# without this module: rebuild the module from its source under the same name (jobs
+# refer to its functions and models by that name), keeping Open WebUI's database and
+# storage layers out of the worker, then restore the parent's setup (_worker_state).
+_WORKER_BOOTSTRAP = """
+import sys, types
+for blocked in ("open_webui.models", "open_webui.storage"):
+    sys.modules.setdefault(blocked, None)
+if name not in sys.modules:
+    module = types.ModuleType(name)
+    module.__file__ = path
+    sys.modules[name] = module
+    exec(compile(source, path, "exec"), module.__dict__)
+sys.modules[name]._init_worker(state)
+"""
+
+# Failures of the pool itself: a worker died or could not start, or a job did not
+# pickle. The caller then renders serially; errors raised by a render propagate.
+_POOL_ERRORS = (BrokenProcessPool, pickle.PicklingError)
+
+
+def _worker_state() -> Dict[str, Any]:
+    return {"asset_dir": _ASSETS.root, "asset_cache_size": _ASSETS.cache_size}
+
+
+def _worker_key(state: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (state["asset_dir"], state["asset_cache_size"])
+
+
+def _init_worker(state: Dict[str, Any]) -> None:
+    _ASSETS.configure(state["asset_dir"], state["asset_cache_size"])
+
+
+class _WorkerPool:
+    """
+    Process pool for CPU-bound renders, kept warm across requests. Workers are fresh
+    interpreters (forkserver, else spawn), not forks of this multithreaded server
+    process, so they never inherit a lock another thread held. The pool is replaced
+    when the worker count or _worker_key changes; a broken pool is dropped and the
+    call falls back to a serial render.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._key: Optional[Tuple[Any, ...]] = None
+
+    def _get(self, workers: int) -> Optional[ProcessPoolExecutor]:
+        if workers < 2 or _MODULE_SOURCE is None:
+            return None
+        state = _worker_state()
+        key = (workers, _worker_key(state))
+        with self._lock:
+            if self._pool is None or self._key != key:
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False)
+                methods = multiprocessing.get_all_start_methods()
+                ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                self._pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=ctx,
+                    initializer=exec,
+                    initargs=(
+                        _WORKER_BOOTSTRAP,
+                        {"name": __name__, "path": __file__, "source": _MODULE_SOURCE, "state": state},
+                    ),
+                )
+                self._key = key
+            return self._pool
+
+    def _discard(self, pool: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._pool is pool:
+                self._pool, self._key = None, None
+        pool.shutdown(wait=False)
+
+    def map(self, fn: Any, items: List[Any], workers: int) -> Optional[List[Any]]:
+        """[fn(item) ...] computed in the pool, or None if no pool is available or it failed."""
+        pool = self._get(workers)
+        if pool is None:
+            return None
+        try:
+            return list(pool.map(fn, items, chunksize=max(1, len(items) // (workers * 4))))
+        except _POOL_ERRORS:
+            self._discard(pool)
+            return None
+
+    def submit(self, fn: Any, item: Any, workers: int) -> Optional[Future]:
+        """Future of fn(item) in the pool, or None if no pool is available."""
+        pool = self._get(workers)
+        if pool is None:
+            return None
+        try:
+            return pool.submit(fn, item)
+        except _POOL_ERRORS:
+            self._discard(pool)
+            return None
+
+
+_WORKERS = _WorkerPool()
+
+
+# ----------------------------
+# Mail merge (one template x N records)
+# ----------------------------
+
+_MERGE_FIELD_RE = re.compile(r"\{\{\s*([^{}]+?)\s*\}\}")
+_MERGE_RECORD_EXTS = (".csv", ".jsonl", ".json")
+
+
+def _merge_plan(node: Any, mode: Optional[str] = None) -> Optional[Tuple[str, Any]]:
+    """
+    Where a validated template holds {{field}} placeholders, or None if nowhere. Per
+    record only the nodes on a path to a placeholder are copied; the rest is shared.
+    A worksheet cell that is exactly one placeholder takes a number when the value
+    looks like one ('cell' mode).
+    """
+    if isinstance(node, str):
+        pieces = _MERGE_FIELD_RE.split(node)
+        return ("s", (pieces, mode)) if len(pieces) > 1 else None
+    if isinstance(node, BaseModel):
+        sheet = isinstance(node, SheetSpec)
+        kind, children = "m", {
+            name: _merge_plan(getattr(node, name), "cell" if sheet and name == "data" else None)
+            for name in type(node).model_fields
+        }
+    elif isinstance(node, list):
+        kind, children = "l", {i: _merge_plan(v, mode) for i, v in enumerate(node)}
+    elif isinstance(node, dict):
+        kind, children = "d", {k: _merge_plan(v, mode) for k, v in node.items()}
+    else:
+        return None
+    children = {k: v for k, v in children.items() if v is not None}
+    return (kind, children) if children else None
+
+
+def _merge_fields(plan: Tuple[str, Any]) -> Set[str]:
+    kind, spec = plan
+    if kind == "s":
+        return set(spec[0][1::2])
+    return set().union(*(_merge_fields(sub) for sub in spec.values()))
+
+
+def _merge_apply(node: Any, plan: Tuple[str, Any], record: Dict[str, str]) -> Any:
+    kind, spec = plan
+    if kind == "s":
+        pieces, mode = spec
+        if mode == "cell" and len(pieces) == 3 and not pieces[0] and not pieces[2]:
+            return _md_cell(record[pieces[1]])
+        out = list(pieces)
+        for i in range(1, len(out), 2):
+            out[i] = record[out[i]]
+        return "".join(out)
+    if kind == "m":
+        return node.model_copy(
+            update={name: _merge_apply(getattr(node, name), sub, record) for name, sub in spec.items()}
+        )
+    out = list(node) if kind == "l" else dict(node)
+    for key, sub in spec.items():
+        out[key] = _merge_apply(node[key], sub, record)
+    return out
+
+
+def _parse_records(name: str, data: bytes) -> List[Dict[str, str]]:
+    """CSV (header row; delimiter sniffed), JSON Lines or a JSON array of objects."""
+    text = data.decode("utf-8-sig")
+    lower = name.lower()
+    if lower.endswith(".csv"):
+        try:
+            dialect: Any = csv.Sniffer().sniff(text[:4096], delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        rows: List[Any] = list(csv.DictReader(io.StringIO(text), dialect=dialect))
+    elif lower.endswith(".json"):
+        rows = json.loads(text)
+        if not isinstance(rows, list):
+            raise ValueError(f"{name}: expected a JSON array of records.")
+    else:
+        rows = []
+        for lineno, line in enumerate(text.splitlines(), 1):
+            if line.strip():
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError as exc:
+                    raise ValueError(f"{name} line {lineno}: {exc}") from None
+    return _normalize_records(rows)
+
+
+def _normalize_records(rows: List[Any]) -> List[Dict[str, str]]:
+    out: List[Dict[str, str]] = []
+    for n, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            raise ValueError(f"Record {n} is not an object of field -> value.")
+        out.append(
+            {str(k): "" if v is None else str(v) for k, v in row.items() if k is not None}
+        )
+    return out
+
+
+def _load_merge_records(
+    records: Optional[List[Dict[str, Any]]],
+    files: List[Dict[str, Any]],
+    hint: Optional[str],
+) -> List[Dict[str, str]]:
+    if records:
+        return _normalize_records(records)
+    for ext in _MERGE_RECORD_EXTS:
+        if hint and not hint.lower().endswith(ext):
+            continue
+        pick = _find_attached_file(ext, files, hint)
+        if pick:
+            return _parse_records(*pick)
+    raise FileNotFoundError(
+        "No merge records found. Attach a .csv/.jsonl file or pass `records`."
+    )
+
+
+def _merge_instructions(template: Any, records: List[Dict[str, str]]) -> List[Any]:
+    """
+    One instruction tree per record from a template validated once. {{_n}} is the
+    1-based record number.
+    """
+    plan = _merge_plan(template)
+    fields = _merge_fields(plan) if plan else set()
+    out: List[Any] = []
+    for n, record in enumerate(records, 1):
+        record = dict(record, _n=str(n))
+        missing = fields - record.keys()
+        if missing:
+            raise ValueError(f"Merge record {n} has no value for {sorted(missing)}.")
+        out.append(_merge_apply(template, plan, record) if plan else template)
+    return out
+
+
+def _merge_names(
+    records: List[Dict[str, str]], pattern: Optional[str], basename: str, ext: str
+) -> List[str]:
+    """Unique, filesystem-safe entry names for a merge ZIP."""
+    names: List[str] = []
+    seen: Set[str] = set()
+    width = max(4, len(str(len(records))))
+    for n, record in enumerate(records, 1):
+        stem = f"{basename}-{n:0{width}d}"
+        if pattern:
+            filled = _MERGE_FIELD_RE.sub(
+                lambda m: record.get(m.group(1), str(n) if m.group(1) == "_n" else ""), pattern
+            )
+            filled = "".join(ch for ch in filled if ch.isalnum() or ch in "-_ .")
+            stem = " ".join(filled.split()).strip(" .") or stem
+        name = f"{stem}{ext}"
+        if name in seen:
+            name = f"{stem}-{n}{ext}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def _zip_outputs(entries: List[Tuple[str, bytes]]) -> bytes:
+    # Office files are ZIP packages already; storing them is as small and much faster.
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
+        for name, data in entries:
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+def _render_record(job: Tuple[str, Any, str, Optional[str], int]) -> bytes:
+    file_type, instr, template_dir, template_id, streaming_min_cells = job
+    base = _TEMPLATES.checkout(template_dir, template_id, file_type) if template_id else None
+    if file_type == "docx":
+        return _create_docx(instr, base)
+    if file_type == "pptx":
+        return _create_pptx(instr, base)
+    return _create_xlsx(instr, base, streaming_min_cells)
+
+
+def _render_records(jobs: List[Tuple[str, Any, str, Optional[str], int]], workers: int) -> List[bytes]:
+    """Render merge records, in worker processes when workers > 1."""
+    rendered = (
+        _WORKERS.map(_render_record, jobs, min(workers, len(jobs))) if len(jobs) > 1 else None
+    )
+    if rendered is None:
+        rendered = [_render_record(job) for job in jobs]
+    return rendered
+
+
+def _merge_docx(instrs: List[WordInstructions], base: Optional[Any] = None) -> bytes:
+    """
+    One document with every record in turn, each from a new page. Header, footer and
+    find/replace apply to the whole document, so they are taken from the first record.
+    """
+    doc = base if base is not None else DocxDocument()
+    for n, instr in enumerate(instrs):
+        update: Dict[str, Any] = {"find_replace": []}
+        if n:
+            doc.add_page_break()
+            update.update(header_text=None, footer_text=None, default_style=None)
+        _apply_word_instructions(doc, instr.model_copy(update=update))
+    if instrs and instrs[0].find_replace:
+        _apply_word_instructions(doc, WordInstructions(find_replace=instrs[0].find_replace))
+    bio = io.BytesIO()
+    doc.save(bio)
+    return bio.getvalue()
+
+
+def _merge_pptx(instrs: List[PptInstructions], base: Optional[Any] = None) -> bytes:
+    """One deck: each record's title slide (if any) followed by its slides."""
+    prs = base if base is not None else Presentation()
+    with _DeckBuilder(prs) as deck:
+        for instr in instrs:
+            if instr.title:
+                _add_ppt_title_slide(prs, instr.title)
+            for s in instr.slides:
+                deck.add_slide(s)
+    bio = io.BytesIO()
+    prs.save(bio)
+    return bio.getvalue()
+
+
+def _merge_xlsx(
+    instrs: List[ExcelInstructions], base: Optional[Any] = None, streaming_min_cells: int = 0
+) -> bytes:
+    """One workbook with every record's sheets; a repeated name gets the record number."""
+    sheets: List[SheetSpec] = []
+    seen: Set[str] = set()
+    for n, instr in enumerate(instrs, 1):
+        for sheet in instr.sheets:
+            name, k = sheet.name[:31], 1
+            while name in seen:
+                suffix = f" {n}" if k == 1 else f" {n}-{k}"
+                name, k = f"{sheet.name[:31 - len(suffix)]}{suffix}", k + 1
+            seen.add(name)
+            sheets.append(sheet if name == sheet.name else sheet.model_copy(update={"name": name}))
+    return _create_xlsx(instrs[0].model_copy(update={"sheets": sheets}), base, streaming_min_cells)
+
+
+# ----------------------------
+# Headless rendering
+# ----------------------------
+
+_INSTRUCTION_MODELS = {"docx": WordInstructions, "pptx": PptInstructions, "xlsx": ExcelInstructions}
+
+
+def _render_document(
+    file_type: str,
+    payload: Union[Dict[str, Any], str],
+    existing: Optional[bytes] = None,
+    streaming_min_cells: int = 50000,
+) -> bytes:
+    """
+    Instructions (a dict for file_type, or compact Markdown) to file bytes without
+    Open WebUI; with `existing`, that document is modified. Images must be inline b64
+    or asset_id. This is the entry point of bulk_runner.py.
+    """
+    model = _INSTRUCTION_MODELS.get(file_type)
+    if model is None:
+        raise ValueError(f"office_document_tool renders docx/pptx/xlsx, not {file_type!r}.")
+    if isinstance(payload, str):
+        payload = _markdown_to_payload(file_type, payload)
+    instr = model(**payload)
+    if file_type == "docx":
+        return _modify_docx(existing, instr) if existing is not None else _create_docx(instr)
+    if file_type == "pptx":
+        return _modify_pptx(existing, instr) if existing is not None else _create_pptx(instr)
+    if existing is not None:
+        return _modify_xlsx(existing, instr)
+    return _create_xlsx(instr, None, streaming_min_cells)
+
+
 # ----------------------------
 # File Upload Helper (FIXED - correct FileForm structure)
 # ----------------------------
@@ -544,6 +3209,9 @@ def _upload_generated_file(
 
     This matches the exact structure used in open_webui/routers/files.py
     """
+    if Storage is None:
+        raise RuntimeError("Open WebUI is not installed; nothing to upload to.")
+
     # Generate unique file ID
     file_id = str(uuid.uuid4())
 
@@ -584,6 +3252,19 @@ def _upload_generated_file(
     return new_file.id
 
 
+# Storage providers and the Files model are synchronous (disk, S3, DB). Run them on a
+# small dedicated pool so a slow upload never stalls the event loop, and a burst of
+# large uploads cannot exhaust the loop's default executor.
+_UPLOAD_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="doc-upload")
+
+
+async def _run_blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _UPLOAD_EXECUTOR, functools.partial(fn, *args, **kwargs)
+    )
+
+
 # ----------------------------
 # Main Tools class
 # ----------------------------
@@ -618,11 +3299,76 @@ class Tools:
             default="http://localhost:8080/",
             description="Base URL to build file download links.",
         )
+        template_dir: str = Field(
+            default="",
+            description="Server directory of admin-provided .docx/.pptx/.xlsx templates, referenced by template_id.",
+        )
+        asset_dir: str = Field(
+            default="",
+            description="Server directory of shared images (logos, signatures), referenced by ImageSpec.asset_id.",
+        )
+        asset_cache_size: int = Field(
+            default=64,
+            description="Decoded/resized asset variants kept in memory (LRU).",
+        )
+        xlsx_streaming_min_cells: int = Field(
+            default=50000,
+            description="With writer_backend='auto', new workbooks with at least this many data cells use the streaming writer (0 disables).",
+        )
+        render_workers: int = Field(
+            default=1,
+            description="Worker processes for 'merge' records with merge_output='zip' (1 = render serially).",
+        )
+        merge_max_records: int = Field(
+            default=5000,
+            description="Maximum number of records one 'merge' call may render.",
+        )
+        preview_max_items: int = Field(
+            default=50,
+            description="Paragraphs/slides/rows shown per section in 'preview' drafts.",
+        )
+        inspect_max_items: int = Field(
+            default=40,
+            description="Headings/tables, slides or sheets listed by 'inspect'.",
+        )
+        inspect_cache_size: int = Field(
+            default=128,
+            description="Inspected documents whose summary is kept in memory (by content hash).",
+        )
+        preview_ttl_s: int = Field(
+            default=3600,
+            description="Seconds a staged preview can still be committed.",
+        )
+        preview_cache_size: int = Field(
+            default=64,
+            description="Maximum number of staged previews kept in memory.",
+        )
+        revision_history_size: int = Field(
+            default=128,
+            description="Generated documents whose instructions are kept for 'revise'; 0 disables revisions.",
+        )
+        revision_ttl_s: int = Field(
+            default=3600,
+            description="Seconds a generated document can still be revised by base_file_id.",
+        )
+        source_cache_mb: int = Field(
+            default=256,
+            description="Memory (MB) for decoded and parsed source documents reused by repeated 'modify' calls in a chat, for modifying earlier results by base_file_id, and for committing previews and revising results of 'modify'; 0 disables.",
+        )
+        user_cache_ttl_s: int = Field(
+            default=300,
+            description="Seconds a user's email/name (used for upload tags) stays cached; 0 disables the cache.",
+        )
+        user_cache_size: int = Field(
+            default=1024,
+            description="Maximum number of cached user profiles.",
+        )
 
     def __init__(self):
         self.valves = self.Valves()
         self.citation = False
         self.file_handler = True  # Prevents default RAG processing of generated files
+        self.metrics: Dict[str, int] = {"user_cache_hits": 0, "user_cache_misses": 0}
 
     async def _emit_status(
         self, __event_emitter__, text: str, done: bool = False
@@ -644,9 +3390,19 @@ class Tools:
         source_filename_hint: Optional[str] = None,
         source_path: Optional[str] = None,
         output_basename: Optional[str] = None,
+        template_id: Optional[str] = None,
+        preview_id: Optional[str] = None,
+        base_file_id: Optional[str] = None,
+        patch: Optional[List[Dict[str, Any]]] = None,
+        markdown: Optional[str] = None,
+        records: Optional[List[Dict[str, Any]]] = None,
+        records_filename_hint: Optional[str] = None,
+        merge_output: Literal["combined", "zip"] = "combined",
+        merge_filename: Optional[str] = None,
         __files__: Optional[List[Dict[str, Any]]] = None,
         __event_emitter__=None,
         __user__: Optional[Dict[str, Any]] = None,
+        __metadata__: Optional[Dict[str, Any]] = None,
     ) -> str:
         """
         Create or modify Office documents (.docx, .pptx, .xlsx) and attach them to the chat.
@@ -654,23 +3410,55 @@ class Tools:
         Parameters
         ----------
         file_type : Literal["docx","pptx","xlsx"]
-        operation : Literal["create","modify"]
+        operation : Literal["create","modify","preview","commit","revise","merge","inspect"]
+            'preview' validates the payload, shows an HTML draft and returns a preview_id;
+            'commit' with that preview_id produces the file without resending the payload.
+            A preview with a source file commits as 'modify', otherwise as 'create'.
+            'revise' applies `patch` to the instructions behind `base_file_id`.
+            'merge' renders the instructions once per record, replacing {{field}}
+            placeholders in any text ({{_n}} is the record number).
+            'inspect' summarizes the attached file (docx headings and tables, pptx slide
+            titles, xlsx sheets with used range and header row) without producing a file.
         instructions : dict | None
             Structured instruction payload shaped like WordInstructions, PptInstructions, or ExcelInstructions.
         raw_instructions : dict | None
             Fallback raw instructions; used if `instructions` is omitted or partially structured.
+        markdown : str | None
+            Compact alternative to the JSON instructions: `---` front matter with instruction
+            fields, then Markdown (headings, lists, pipe tables, images, ```chart blocks).
         source_filename_hint : str | None
             Name hint for which attached file to modify (if multiple are present).
         source_path : str | None
             Server-side file path to an existing doc (admins only, requires valves.allow_server_paths = True).
         output_basename : str | None
             Desired base name for the generated file (extension will be added automatically).
+        template_id : str | None
+            ID of an admin-provided template to use as the starting document for 'create'.
+        preview_id : str | None
+            ID returned by a 'preview' call; required for 'commit'.
+        base_file_id : str | None
+            file_id of an earlier result of this tool; required for 'revise'. With
+            'modify', that result (from this chat) is modified instead of an attachment.
+        patch : list[dict] | None
+            JSON-Patch ops (add/remove/replace/test), e.g.
+            {"op": "replace", "path": "/sheets/0/data/12/1", "value": 42}.
+        records : list[dict] | None
+            Inline merge records; otherwise the attached CSV/JSONL named by records_filename_hint.
+        records_filename_hint : str | None
+            Attached .csv (header row), .jsonl or .json file with one record per row.
+        merge_output : Literal["combined","zip"]
+            'combined': one file (docx: a page run per record, pptx: slides, xlsx: sheets);
+            'zip': one file per record.
+        merge_filename : str | None
+            Name pattern for 'zip' entries, e.g. 'offer-{{name}}'.
         __files__ : list[dict] | None
             Files attached by the user to this message (Open WebUI provides these).
         __event_emitter__ : callable
             Event emitter provided by Open WebUI. We'll emit status and files events.
         __user__ : dict | None
             Current user (used to upload via OWUI file router).
+        __metadata__ : dict | None
+            Request metadata from Open WebUI; its chat_id scopes the source document cache.
 
         Returns
         -------
@@ -684,6 +3472,10 @@ class Tools:
             await asyncio.sleep(self.valves.min_progress_delay_ms / 1000.0)
 
         try:
+            _ASSETS.configure(self.valves.asset_dir, self.valves.asset_cache_size)
+            if markdown and not (raw_instructions or instructions):
+                raw_instructions = _markdown_to_payload(file_type, markdown)
+
             # Build validated params (coerce instructions by file type)
             parsed = OfficeToolParams(
                 file_type=file_type,
@@ -693,11 +3485,81 @@ class Tools:
                 source_filename_hint=source_filename_hint,
                 source_path=source_path,
                 output_basename=output_basename,
+                template_id=template_id,
+                preview_id=preview_id,
+                base_file_id=base_file_id,
+                patch=patch,
+                records=records,
+                records_filename_hint=records_filename_hint,
+                merge_output=merge_output,
+                merge_filename=merge_filename,
             )
+            user_id = __user__.get("id") if isinstance(__user__, dict) else None
+            chat_id = (__metadata__ or {}).get("chat_id") if isinstance(__metadata__, dict) else None
+            scope = f"{user_id}:{chat_id or ''}"
+            _SOURCES.configure(self.valves.source_cache_mb * 1024 * 1024)
+
+            # Inspect: summarize the source file; nothing is rendered or uploaded
+            if parsed.operation == "inspect":
+                digest, existing = _source_document(
+                    scope,
+                    f".{parsed.file_type}",
+                    __files__ or [],
+                    parsed.source_filename_hint,
+                    parsed.source_path,
+                    self.valves.allow_server_paths,
+                )
+                key = (
+                    digest,
+                    parsed.file_type,
+                    self.valves.inspect_max_items,
+                )
+                _INSPECTIONS.configure(self.valves.inspect_cache_size, _INSPECTIONS.ttl)
+                summary = _INSPECTIONS.get(key)
+                if summary is None:
+                    summary = await _run_blocking(
+                        _INSPECTORS[parsed.file_type], existing, self.valves.inspect_max_items
+                    )
+                    _INSPECTIONS.put(key, summary)
+                label = parsed.source_filename_hint or os.path.basename(
+                    parsed.source_path or f"attached.{parsed.file_type}"
+                )
+                await self._emit_status(__event_emitter__, "Inspected", done=True)
+                return f"**{label}** — {summary}"
+
+            staged: Optional[Dict[str, Any]] = None
+            if parsed.operation == "commit":
+                staged = _PREVIEWS.get(parsed.preview_id) if parsed.preview_id else None
+                if staged is None or staged["params"].file_type != parsed.file_type:
+                    raise FileNotFoundError(
+                        "Unknown or expired preview_id. Run operation='preview' again."
+                    )
+                if staged["user_id"] != user_id:
+                    raise PermissionError("This preview belongs to another user.")
+                parsed = staged["params"].model_copy(
+                    update={"output_basename": parsed.output_basename or staged["params"].output_basename}
+                )
+            elif parsed.operation == "revise":
+                prior = _GENERATIONS.get(parsed.base_file_id) if parsed.base_file_id else None
+                if prior is None or prior["params"].file_type != parsed.file_type:
+                    raise FileNotFoundError(
+                        "Unknown or expired base_file_id. Send the full instructions with 'create' or 'modify'."
+                    )
+                if prior["user_id"] != user_id:
+                    raise PermissionError("This document belongs to another user.")
+                if not parsed.patch:
+                    raise ValueError("operation='revise' needs a non-empty 'patch' list.")
+                revised = _apply_json_patch(prior["instr"].model_dump(), parsed.patch)
+                staged = {"instr": type(prior["instr"])(**revised), "source": prior["source"]}
+                parsed = prior["params"].model_copy(
+                    update={"output_basename": parsed.output_basename or prior["params"].output_basename}
+                )
 
             # Coerce instructions
             payload = parsed.raw_instructions or {}
-            if parsed.file_type == "docx":
+            if staged is not None:
+                instr_obj = staged["instr"]
+            elif parsed.file_type == "docx":
                 instr_obj: Union[
                     WordInstructions, PptInstructions, ExcelInstructions
                 ] = (WordInstructions(**payload) if payload else WordInstructions())
@@ -738,53 +3600,161 @@ class Tools:
                         out.append(im)
                 return out
 
-            if isinstance(instr_obj, WordInstructions):
+            if staged is not None:
+                pass  # images were resolved when the preview was staged
+            elif isinstance(instr_obj, WordInstructions):
                 instr_obj.images = resolve_images(instr_obj.images)
             elif isinstance(instr_obj, PptInstructions):
                 for s in instr_obj.slides:
                     s.images = resolve_images(s.images)
 
-            # Create or modify
             expected_ext = f".{parsed.file_type}"
+
+            # Preview: stage the validated tree and show a draft; nothing is rendered yet
+            if parsed.operation == "preview":
+                # A draft edits a document whenever 'modify' would find one to edit
+                is_modify = bool(
+                    parsed.base_file_id
+                    or parsed.source_filename_hint
+                    or parsed.source_path
+                    or _find_attached_file(expected_ext, __files__ or [])
+                )
+                digest = (
+                    _source_document(
+                        scope,
+                        expected_ext,
+                        __files__ or [],
+                        parsed.source_filename_hint,
+                        parsed.source_path,
+                        self.valves.allow_server_paths,
+                        parsed.base_file_id,
+                    )[0]
+                    if is_modify
+                    else None
+                )
+                new_id = uuid.uuid4().hex[:12]
+                _PREVIEWS.configure(self.valves.preview_cache_size, self.valves.preview_ttl_s)
+                _PREVIEWS.put(
+                    new_id,
+                    {
+                        "user_id": user_id,
+                        "params": parsed.model_copy(
+                            update={"operation": "modify" if is_modify else "create"}
+                        ),
+                        "instr": instr_obj,
+                        "source": (scope, digest) if digest else None,
+                    },
+                )
+                draft = _preview_html(parsed.file_type, instr_obj, self.valves.preview_max_items)
+                if __event_emitter__:
+                    await __event_emitter__(
+                        {"type": "message", "data": {"content": f"```html\n{draft}\n```\n"}}
+                    )
+                    await self._emit_status(__event_emitter__, "Preview ready", done=True)
+                return (
+                    f"Preview `{new_id}` is shown above. After the user approves, call "
+                    f"office_document_tool with operation='commit', file_type='{parsed.file_type}' "
+                    f"and preview_id='{new_id}' (no instructions needed)."
+                )
+
+            # Create or modify
             output_name = _choose_output_name(parsed.file_type, parsed.output_basename)
+            existing_bytes: Optional[bytes] = None
+            source_key: Optional[Tuple[str, str]] = None  # (scope, content hash) of the modified file
 
-            if parsed.operation == "create":
-                if parsed.file_type == "docx":
-                    data_out = _create_docx(cast(WordInstructions, instr_obj))
-                elif parsed.file_type == "pptx":
-                    data_out = _create_pptx(cast(PptInstructions, instr_obj))
-                else:
-                    data_out = _create_xlsx(cast(ExcelInstructions, instr_obj))
-            else:
-                existing_bytes: Optional[bytes] = None
-                pick = _find_attached_file(
-                    expected_ext, __files__ or [], parsed.source_filename_hint
+            if parsed.operation == "merge":
+                rows = _load_merge_records(
+                    parsed.records, __files__ or [], parsed.records_filename_hint
+                )
+                if len(rows) > self.valves.merge_max_records:
+                    raise ValueError(
+                        f"{len(rows)} merge records exceed the limit of {self.valves.merge_max_records}."
+                    )
+                await self._emit_status(
+                    __event_emitter__, f"Merging {len(rows)} records…", done=False
                 )
-                if pick:
-                    _, existing_bytes = pick
-
-                if not existing_bytes and parsed.source_path:
-                    if self.valves.allow_server_paths and os.path.isfile(
-                        parsed.source_path
-                    ):
-                        with open(parsed.source_path, "rb") as fh:
-                            existing_bytes = fh.read()
+                merged = _merge_instructions(instr_obj, rows)
+                if parsed.merge_output == "zip":
+                    parts = await _run_blocking(
+                        _render_records,
+                        [
+                            (
+                                parsed.file_type,
+                                instr,
+                                self.valves.template_dir,
+                                parsed.template_id,
+                                self.valves.xlsx_streaming_min_cells,
+                            )
+                            for instr in merged
+                        ],
+                        self.valves.render_workers,
+                    )
+                    names = _merge_names(
+                        rows, parsed.merge_filename, os.path.splitext(output_name)[0], expected_ext
+                    )
+                    data_out = await _run_blocking(_zip_outputs, list(zip(names, parts)))
+                    output_name = f"{os.path.splitext(output_name)[0]}.zip"
+                else:
+                    base = (
+                        await _run_blocking(
+                            _TEMPLATES.checkout,
+                            self.valves.template_dir,
+                            parsed.template_id,
+                            parsed.file_type,
+                        )
+                        if parsed.template_id
+                        else None
+                    )
+                    if parsed.file_type == "docx":
+                        data_out = await _run_blocking(_merge_docx, merged, base)
+                    elif parsed.file_type == "pptx":
+                        data_out = await _run_blocking(_merge_pptx, merged, base)
                     else:
-                        raise PermissionError(
-                            "Server path access is disabled. Attach the file to the chat or enable allow_server_paths."
+                        data_out = await _run_blocking(
+                            _merge_xlsx, merged, base, self.valves.xlsx_streaming_min_cells
                         )
-                if not existing_bytes:
-                    raise FileNotFoundError(
-                        f"No existing {expected_ext} file found to modify. Attach a file or provide a valid source_path."
+            elif parsed.operation == "create":
+                # Template checkout (a deep copy or unpickle) and render, off the event loop
+                data_out = await _run_blocking(
+                    _render_record,
+                    (
+                        parsed.file_type,
+                        instr_obj,
+                        self.valves.template_dir,
+                        parsed.template_id,
+                        self.valves.xlsx_streaming_min_cells,
+                    ),
+                )
+            else:
+                if staged is not None:
+                    source_scope, digest = staged["source"]
+                    existing_bytes = _SOURCES.data(source_scope, digest)
+                    if existing_bytes is None:
+                        raise FileNotFoundError(
+                            "The source document of this preview or revision is no longer cached. Attach it again and use operation='modify'."
+                        )
+                    if source_scope != scope:
+                        _SOURCES.add(scope, existing_bytes)
+                else:
+                    digest, existing_bytes = _source_document(
+                        scope,
+                        expected_ext,
+                        __files__ or [],
+                        parsed.source_filename_hint,
+                        parsed.source_path,
+                        self.valves.allow_server_paths,
+                        parsed.base_file_id,
                     )
+                source_key = (scope, digest)
+                source = _SOURCES.checkout(scope, digest, parsed.file_type)
 
                 if parsed.file_type == "docx":
                     data_out = _modify_docx(
-                        existing_bytes, cast(WordInstructions, instr_obj)
+                        existing_bytes, cast(WordInstructions, instr_obj), source
                     )
                 elif parsed.file_type == "pptx":
                     data_out = _modify_pptx(
-                        existing_bytes, cast(PptInstructions, instr_obj)
+                        existing_bytes, cast(PptInstructions, instr_obj), source
                     )
                 else:
                     data_out = _modify_xlsx(
@@ -796,28 +3766,55 @@ class Tools:
                 __event_emitter__, "Uploading attachment…", done=False
             )
 
-            # Resolve user ID from __user__ dict
-            user_id = __user__.get("id") if isinstance(__user__, dict) else None
+            # User ID from __user__ (resolved above)
             if not user_id:
                 raise RuntimeError("No user context was provided for upload.")
 
-            # Get full user object to access email and name for tags
-            user_obj = Users.get_user_by_id(user_id)
-            if not user_obj:
+            # Email and name for the storage tags (from __user__, else cached or read once)
+            _USER_CACHE.configure(self.valves.user_cache_size, self.valves.user_cache_ttl_s)
+            profile, cached = await _run_blocking(
+                _lookup_user_profile, user_id, _request_profile(__user__)
+            )
+            self.metrics["user_cache_hits" if cached else "user_cache_misses"] += 1
+            if not profile:
                 raise RuntimeError(f"User not found with ID: {user_id}")
+            user_email, user_name = profile
 
             # Get content type
-            content_type = _get_content_type(parsed.file_type)
+            content_type = (
+                "application/zip"
+                if output_name.endswith(".zip")
+                else _get_content_type(parsed.file_type)
+            )
 
             # Upload file using the fixed helper function (with tags and correct FileForm)
-            file_id = _upload_generated_file(
+            file_id = await _run_blocking(
+                _upload_generated_file,
                 file_bytes=data_out,
                 filename=output_name,
                 content_type=content_type,
                 user_id=user_id,
-                user_email=user_obj.email or "",
-                user_name=user_obj.name or "",
+                user_email=user_email,
+                user_name=user_name,
             )
+            if output_name.endswith(expected_ext):
+                # A later 'modify' with base_file_id starts from this output as is
+                _SOURCES.add(scope, data_out, file_id)
+
+            # Remember the validated tree so the next round can be a small 'revise' patch
+            if parsed.operation != "merge":
+                _GENERATIONS.configure(
+                    self.valves.revision_history_size, self.valves.revision_ttl_s
+                )
+                _GENERATIONS.put(
+                    file_id,
+                    {
+                        "user_id": user_id,
+                        "params": parsed,
+                        "instr": instr_obj,
+                        "source": source_key,
+                    },
+                )
 
             # Build file URL
             base_url = self.valves.open_webui_url.strip("/")
@@ -843,9 +3840,15 @@ class Tools:
                 await self._emit_status(__event_emitter__, "Done", done=True)
 
             # Final user-visible message below the attachment(s) including a direct link
+            follow_up = (
+                f"{len(rows)} records"
+                if parsed.operation == "merge"
+                else f"file_id `{file_id}` for 'revise'"
+            )
             return (
                 f"{parsed.operation.capitalize()}d {parsed.file_type.upper()} — "
-                f"**{output_name}** is ready: [{output_name}]({file_url})"
+                f"**{output_name}** is ready: [{output_name}]({file_url}) "
+                f"({follow_up})"
             )
 
         except ValidationError as ve:
@@ -876,10 +3879,7 @@ class Tools:
                 await __event_emitter__(
                     {
                         "type": "notification",
-                        "data": {
-                            "type": "warning",
-                            "content": "No source file was found to modify.",
-                        },
+                        "data": {"type": "warning", "content": str(fe)},
                     }
                 )
             return _friendly_error("Missing source file", fe)
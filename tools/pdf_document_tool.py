@@ -11,20 +11,41 @@ from __future__ import annotations
 
 import asyncio
 import base64
+import copy
+import csv
+import functools
+import hashlib
+import html
 import io
+import json
+import math
+import multiprocessing
 import os
+import pickle
 import re
+import shutil
+import subprocess
 import tempfile
+import threading
+import time
 import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from typing import Any, Dict, List, Literal, Optional, Tuple, Union, Set
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Literal, Optional, Tuple, Union, Set
 
-from pydantic import BaseModel, Field, ValidationError, field_validator
+from pydantic import BaseModel, Field, PrivateAttr, ValidationError, field_validator
 
 # Open WebUI internals - UPDATED IMPORTS for 0.5.x+
-from open_webui.models.users import Users
-from open_webui.models.files import Files, FileForm
-from open_webui.storage.provider import Storage
+try:
+    from open_webui.models.users import Users
+    from open_webui.models.files import Files, FileForm
+    from open_webui.storage.provider import Storage
+except ImportError:  # headless use (bulk_runner.py); only uploading needs Open WebUI
+    Users = Files = FileForm = Storage = None
 
 # PDF generation & processing
 from reportlab.lib.pagesizes import LETTER, A4
@@ -38,11 +59,44 @@ from reportlab.platypus import (
     Image as RLImage,
     Table,
     TableStyle,
+    PageBreak,
+    Flowable,
 )
-from reportlab.lib.utils import ImageReader
+from reportlab.lib.fonts import addMapping, tt2ps
+from reportlab.lib.utils import ImageReader, simpleSplit
+from reportlab.pdfgen.canvas import Canvas
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    FloatObject,
+    IndirectObject,
+    NameObject,
+    NullObject,
+    NumberObject,
+    StreamObject,
+    TextStringObject,
+)
+
+try:
+    import pikepdf
+except ImportError:  # linearization falls back to the qpdf CLI, if present
+    pikepdf = None
+
+try:
+    from PIL import Image as PILImage
+except ImportError:  # asset variants are then served at their original size
+    PILImage = None
+
+try:
+    from docx import Document as DocxDocument
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+    from docx.shared import Inches as DocxInches, Pt as DocxPt
+except ImportError:  # only output_formats=['docx'] needs python-docx
+    DocxDocument = None
 
 
 # ----------------------------
@@ -50,7 +104,9 @@ from pypdf import PdfReader, PdfWriter
 # ----------------------------
 
 FileType = Literal["pdf"]
-OperationType = Literal["create", "modify"]
+OperationType = Literal[
+    "create", "modify", "preview", "commit", "revise", "merge", "inspect", "combine", "split", "extract"
+]
 
 
 class ImageSpec(BaseModel):
@@ -62,10 +118,17 @@ class ImageSpec(BaseModel):
     b64: Optional[str] = Field(
         default=None, description="Base64-encoded binary of the image."
     )
+    asset_id: Optional[str] = Field(
+        default=None,
+        description="ID of an image in the admin asset library (file name without extension), e.g. 'logo'.",
+    )
     width_inches: float = Field(
         default=3.0, ge=0.1, le=20.0, description="Image display width in inches."
     )
 
+    # Decoded bytes, filled on first use and shared by every output format.
+    _data: Optional[bytes] = PrivateAttr(default=None)
+
 
 class ParagraphSpec(BaseModel):
     """Paragraph with optional inline formatting."""
@@ -89,6 +152,22 @@ class ParagraphSpec(BaseModel):
     align: Optional[Literal["left", "center", "right", "justify"]] = Field(
         default="left"
     )
+    page_break_before: bool = Field(
+        default=False,
+        description="Start this paragraph on a new page (e.g. a chapter heading).",
+    )
+    style: Optional[str] = Field(
+        default=None,
+        description="Word paragraph style for docx output (e.g. 'Heading 1', 'List Bullet'); the PDF ignores it.",
+    )
+    kind: Literal["markup", "plain", "preformatted"] = Field(
+        default="markup",
+        description=(
+            "'markup' parses <b>/<i>/<u> tags; 'plain' takes text literally and wraps it; "
+            "'preformatted' keeps whitespace and line breaks (monospace unless font_name is set), "
+            "e.g. for logs and code. 'plain'/'preformatted' ignore underline."
+        ),
+    )
 
 
 class TableSpec(BaseModel):
@@ -129,6 +208,19 @@ class PdfInstructions(BaseModel):
     header_text: Optional[str] = Field(default=None)
     footer_text: Optional[str] = Field(default=None)
     show_page_numbers: bool = Field(default=True)
+    show_total_pages: bool = Field(
+        default=False, description="Number pages as 'Page X of Y' (needs show_page_numbers)."
+    )
+    watermark_text: Optional[str] = Field(
+        default=None, description="Large diagonal text drawn faintly across every page."
+    )
+    stamp_existing: bool = Field(
+        default=False,
+        description=(
+            "Modify only: also apply header, footer, watermark and page numbers to the existing "
+            "pages; numbering then runs across the whole document."
+        ),
+    )
 
     paragraphs: List[ParagraphSpec] = Field(default_factory=list)
     tables: List[TableSpec] = Field(default_factory=list)
@@ -153,7 +245,17 @@ class PdfToolParams(BaseModel):
     """
 
     file_type: FileType = Field(..., description="Must be 'pdf'.")
-    operation: OperationType = Field(..., description="'create' or 'modify'.")
+    operation: OperationType = Field(
+        ...,
+        description=(
+            "'create' or 'modify'; 'preview' validates and stages the instructions and shows a "
+            "draft; 'commit' renders a staged preview by preview_id; 'revise' applies a patch "
+            "to an earlier result by base_file_id; 'merge' renders the instructions once per "
+            "record, filling {{field}} placeholders; 'inspect' summarizes an attached PDF "
+            "(pages, sizes, outline) without changing it; 'combine' concatenates attached PDFs, "
+            "'extract' copies page ranges into a new PDF and 'split' cuts one into parts (ZIP)."
+        ),
+    )
     instructions: Optional[PdfInstructions] = Field(
         default=None, description="Structured instructions; recommended over free-form."
     )
@@ -162,9 +264,57 @@ class PdfToolParams(BaseModel):
     source_path: Optional[str] = Field(
         default=None, description="Existing PDF path for modify operations."
     )
+    template_id: Optional[str] = Field(
+        default=None,
+        description="ID of an admin-provided letterhead PDF drawn beneath every created page.",
+    )
     output_basename: Optional[str] = Field(
         default=None, description="Base name for the generated file (no extension)."
     )
+    preview_id: Optional[str] = Field(
+        default=None, description="ID returned by a 'preview' call; required for 'commit'."
+    )
+    base_file_id: Optional[str] = Field(
+        default=None,
+        description=(
+            "file_id of an earlier result of this tool; required for 'revise'. With 'modify' "
+            "it selects that result (from this chat) as the source instead of an attachment."
+        ),
+    )
+    patch: Optional[List[Dict[str, Any]]] = Field(
+        default=None,
+        description="JSON-Patch ops (add/remove/replace/test) against the instructions of base_file_id.",
+    )
+    records: Optional[List[Dict[str, Any]]] = Field(
+        default=None, description="Inline merge records (field -> value); else an attached CSV/JSONL."
+    )
+    records_filename_hint: Optional[str] = Field(
+        default=None, description="Name of the attached .csv/.jsonl/.json file with the merge records."
+    )
+    merge_output: Literal["combined", "zip"] = Field(
+        default="combined",
+        description="'combined': one PDF with every record in turn; 'zip': one PDF per record.",
+    )
+    merge_filename: Optional[str] = Field(
+        default=None,
+        description="File name pattern for 'zip' entries, e.g. 'certificate-{{name}}' (default: basename-0001).",
+    )
+    source_filenames: Optional[List[str]] = Field(
+        default=None,
+        description="Attached PDFs to 'combine', in order (default: every attached PDF, in attachment order).",
+    )
+    pages: Optional[str] = Field(
+        default=None,
+        description="1-based page ranges for 'extract' and 'split' (one part per range), e.g. '40-60' or '1-5, 8, 10-'.",
+    )
+    split_every: Optional[int] = Field(
+        default=None, ge=1, description="'split' into parts of this many pages."
+    )
+    output_formats: List[Literal["pdf", "docx"]] = Field(
+        default_factory=lambda: ["pdf"],
+        min_length=1,
+        description="Formats rendered from the same instructions ('create' only), e.g. ['pdf', 'docx'].",
+    )
 
     @field_validator("output_basename")
     @classmethod
@@ -225,8 +375,55 @@ def _friendly_error(prefix: str, exc: Exception) -> str:
     return f"{prefix}: {type(exc).__name__} — {str(exc) or 'unexpected error'}"
 
 
-def _get_content_type(_: str) -> str:
-    return "application/pdf"
+_CONTENT_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "zip": "application/zip",
+}
+
+
+def _get_content_type(ext: str) -> str:
+    return _CONTENT_TYPES.get(ext, "application/pdf")
+
+
+def _attachment_bytes(f: Dict[str, Any]) -> Optional[bytes]:
+    """Content of one __files__ entry: 'content' or 'b64' (base64), else 'path'."""
+    if "content" in f and isinstance(f["content"], str):
+        return base64.b64decode(f["content"])
+    if "b64" in f and isinstance(f["b64"], str):
+        return base64.b64decode(f["b64"])
+    if "path" in f and isinstance(f["path"], str) and os.path.isfile(f["path"]):
+        with open(f["path"], "rb") as fh:
+            return fh.read()
+    return None
+
+
+def _pick_attached_file(
+    expected_ext: str,
+    files: Optional[List[Dict[str, Any]]] = None,
+    hint: Optional[str] = None,
+    cached: Optional[Callable[[str], Optional[bytes]]] = None,
+) -> Optional[Tuple[Optional[str], str, bytes]]:
+    """
+    (Open WebUI file id, name, bytes) of the attachment to use: the file named by the
+    hint, else the first with the extension, skipping entries without readable content.
+    `cached(file_id)` may supply the bytes of a file seen before, saving the decode.
+    """
+    matches = [
+        f for f in files or [] if (f.get("name") or f.get("filename") or "").lower().endswith(expected_ext)
+    ]
+    if hint:
+        matches = [
+            f for f in matches if (f.get("name") or f.get("filename") or "").lower() == hint.lower()
+        ] + matches
+    for f in matches:
+        file_id = f.get("id") or (f.get("file") or {}).get("id")
+        data = cached(file_id) if cached is not None and file_id else None
+        if data is None:
+            data = _attachment_bytes(f)
+        if data:
+            return file_id, f.get("name") or f.get("filename"), data
+    return None
 
 
 def _find_attached_file(
@@ -238,51 +435,8 @@ def _find_attached_file(
     Pick a file from __files__ by extension (and optional name hint).
     Accepts content either in 'content' (base64) or 'b64' keys or 'path' (not recommended).
     """
-    if not files:
-        return None
-
-    # Try hint first
-    if hint:
-        for f in files:
-            name = f.get("name") or f.get("filename") or ""
-            if (
-                name
-                and name.lower() == hint.lower()
-                and name.lower().endswith(expected_ext)
-            ):
-                data = None
-                if "content" in f and isinstance(f["content"], str):
-                    data = base64.b64decode(f["content"])
-                elif "b64" in f and isinstance(f["b64"], str):
-                    data = base64.b64decode(f["b64"])
-                elif (
-                    "path" in f
-                    and isinstance(f["path"], str)
-                    and os.path.isfile(f["path"])
-                ):
-                    with open(f["path"], "rb") as fh:
-                        data = fh.read()
-                if data:
-                    return (name, data)
-
-    # Otherwise first matching extension
-    for f in files:
-        name = f.get("name") or f.get("filename") or ""
-        if name and name.lower().endswith(expected_ext):
-            data = None
-            if "content" in f and isinstance(f["content"], str):
-                data = base64.b64decode(f["content"])
-            elif "b64" in f and isinstance(f["b64"], str):
-                data = base64.b64decode(f["b64"])
-            elif (
-                "path" in f and isinstance(f["path"], str) and os.path.isfile(f["path"])
-            ):
-                with open(f["path"], "rb") as fh:
-                    data = fh.read()
-            if data:
-                return (name, data)
-
-    return None
+    pick = _pick_attached_file(expected_ext, files, hint)
+    return (pick[1], pick[2]) if pick else None
 
 
 # ----------------------------
@@ -333,10 +487,10 @@ def _register_fonts_from_files(__files__: Optional[List[Dict[str, Any]]]) -> Set
     Register modern TTF/OTF fonts provided as attachments.
     Returns the set of successfully registered face names to be added to _ALLOWED_FONTS.
     """
-    registered: Set[str] = set()
     if not __files__:
-        return registered
+        return set()
 
+    families: Dict[str, Dict[str, bytes]] = {}
     for f in __files__:
         name = (f.get("name") or f.get("filename") or "").strip()
         if not name or not _FONT_EXT_RE.search(name):
@@ -358,41 +512,182 @@ def _register_fonts_from_files(__files__: Optional[List[Dict[str, Any]]]) -> Set
 
         if not raw or len(raw) > 25 * 1024 * 1024:
             continue
+        families.setdefault(family, {})[name] = raw
 
-        # Persist to temp file; TTFont expects a file path
-        try:
-            with tempfile.NamedTemporaryFile(
-                suffix=os.path.splitext(name)[1], delete=True
-            ) as tf:
-                tf.write(raw)
-                tf.flush()
-
-                face_name = os.path.splitext(os.path.basename(name))[0]
-                face_name = re.sub(r"[^\w\-\.]", "_", face_name)
-
-                pdfmetrics.registerFont(TTFont(face_name, tf.name))
-                registered.add(face_name)
-
-                bold, italic = _detect_style_flags(name)
-                pdfmetrics.addMapping(family, bold, italic, face_name)
-                if not bold and not italic:
-                    registered.add(family)
-        except Exception:
-            continue
+    return _register_font_bytes(families)
+
+
+# Attached font files by family ({file name: bytes}), as last registered; render
+# workers register the same faces (see _worker_state).
+_ATTACHED_FONTS: Dict[str, Dict[str, bytes]] = {}
+
+
+def _register_font_bytes(families: Dict[str, Dict[str, bytes]]) -> Set[str]:
+    """Register {family: {file name: bytes}} per family; returns the face names."""
+    registered: Set[str] = set()
+    # Persist to a temp dir (TTFont expects file paths), then register per family
+    with tempfile.TemporaryDirectory() as tmp:
+        for family, files in families.items():
+            paths: Dict[str, str] = {}
+            for n, (name, raw) in enumerate(files.items()):
+                paths[name] = os.path.join(tmp, f"{family}_{n}_{_face_name(name)}")
+                with open(paths[name], "wb") as fh:
+                    fh.write(raw)
+            digest = hashlib.sha256()
+            for name in sorted(files):
+                digest.update(name.encode("utf-8") + b"\0" + files[name])
+            try:
+                registered.update(_register_family(family, paths, digest.hexdigest()))
+            except Exception:
+                continue
+            _ATTACHED_FONTS[family] = files
 
     return registered
 
 
+# Family -> face used when a paragraph asks for the family name itself.
+_FAMILY_FACES: Dict[str, str] = {}
+
+# Face or family name -> fingerprint of the files it was last registered from, so
+# cached renders (see _section_key) notice when a name starts to mean another font.
+_FONT_SOURCES: Dict[str, str] = {}
+
+
+def _face_name(fname: str) -> str:
+    return re.sub(r"[^\w\-\.]", "_", os.path.splitext(os.path.basename(fname))[0])
+
+
+def _register_family(family: str, files: Dict[str, str], source: Optional[str] = None) -> Set[str]:
+    """
+    Register TTF/OTF faces ({file name: path}) as one family: one face per
+    (bold, italic) slot, preferring "Regular"/plain over Light/Thin cuts. Missing slots
+    fall back to the closest registered face so <b>/<i> never fail. Returns the face
+    names plus the family name. `source` fingerprints the files (default: their paths
+    and modification times).
+    """
+    if source is None:
+        source = hashlib.sha256(
+            repr(sorted((path, os.path.getmtime(path)) for path in files.values())).encode("utf-8")
+        ).hexdigest()
+    slots: Dict[Tuple[bool, bool], Tuple[str, str]] = {}
+    for fname, path in sorted(
+        files.items(),
+        key=lambda kv: (
+            any(w in kv[0].lower() for w in ("light", "thin", "semibold", "medium")),
+            "regular" not in kv[0].lower(),
+            len(kv[0]),
+        ),
+    ):
+        slots.setdefault(_detect_style_flags(fname), (fname, path))
+    faces: Dict[Tuple[bool, bool], str] = {}
+    for slot, (fname, path) in slots.items():
+        faces[slot] = _face_name(fname)
+        pdfmetrics.registerFont(TTFont(faces[slot], path))
+    regular = faces.get((False, False)) or next(iter(faces.values()))
+    for bold in (False, True):
+        for italic in (False, True):
+            if (bold, italic) not in faces:
+                fallback = faces.get((bold, False)) or faces.get((False, italic)) or regular
+                addMapping(family, bold, italic, fallback)
+    for (bold, italic), face in faces.items():
+        addMapping(family, bold, italic, face)  # last, so each face maps back to its own slot
+    _FAMILY_FACES[family] = regular
+    names = set(faces.values()) | {family}
+    _FONT_SOURCES.update(dict.fromkeys(names, source))
+    return names
+
+
+# ----------------------------
+# Server font directory
+# ----------------------------
+
+
+class _FontDirectory:
+    """
+    Admin font_dir: TTF/OTF files grouped by family. The directory is listed once per
+    path; a family's files are parsed and registered only when a paragraph first asks
+    for it, so fonts never travel as base64 attachments.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._root: Optional[str] = None
+        self._families: Dict[str, Dict[str, str]] = {}
+        self._loaded: Set[str] = set()
+
+    def configure(self, root: str) -> None:
+        with self._lock:
+            if root == self._root:
+                return
+            self._root, self._families = root, {}
+            if not root or not os.path.isdir(root):
+                return
+            for dirpath, _, names in os.walk(root):
+                for name in names:
+                    if not _FONT_EXT_RE.search(name):
+                        continue
+                    family = _derive_family_from_filename(name) or re.split(
+                        r"[-_ ]", _face_name(name)
+                    )[0]
+                    self._families.setdefault(family, {})[name] = os.path.join(dirpath, name)
+
+    @property
+    def root(self) -> str:
+        return self._root or ""
+
+    def families(self) -> List[str]:
+        return sorted(self._families)
+
+    def resolve(self, requested: str) -> Optional[str]:
+        """Face name for a family in font_dir, registering the family on first use."""
+        family = _derive_family_from_filename(requested) or requested
+        with self._lock:
+            if family not in self._families:
+                family = next(
+                    (f for f in self._families if f.lower() == family.lower()), family
+                )
+            files = self._families.get(family)
+            if not files:
+                return None
+            if family not in self._loaded:
+                _ALLOWED_FONTS.update(_register_family(family, files))
+                self._loaded.add(family)
+            return _FAMILY_FACES.get(family)
+
+
+_FONT_DIR = _FontDirectory()
+
+
+def _preload_fonts(instr: PdfInstructions) -> None:
+    """Resolve requested families up front, before sections are handed to workers."""
+    for name in {p.font_name for p in instr.paragraphs if p.font_name}:
+        _safe_font_choice(name)
+
+
 # ----------------------------
 # PDF generation helpers
 # ----------------------------
 
 
 def _make_onpage(
-    header_text: Optional[str], footer_text: Optional[str], show_page_numbers: bool
+    header_text: Optional[str],
+    footer_text: Optional[str],
+    show_page_numbers: bool,
+    watermark_text: Optional[str] = None,
 ):
     def _draw(canvas, doc):
         width, height = canvas._pagesize
+        if watermark_text:
+            canvas.saveState()
+            text_width = pdfmetrics.stringWidth(watermark_text, "Helvetica-Bold", 1)
+            size = min(72.0, 0.8 * math.hypot(width, height) / max(text_width, 1e-6))
+            canvas.setFont("Helvetica-Bold", size)
+            canvas.setFillColor(colors.lightgrey)
+            canvas.setFillAlpha(0.35)
+            canvas.translate(width / 2, height / 2)
+            canvas.rotate(math.degrees(math.atan2(height, width)))
+            canvas.drawCentredString(0, -size / 3, watermark_text)
+            canvas.restoreState()
         if header_text:
             canvas.setFont("Helvetica", 9)
             canvas.setFillColor(colors.grey)
@@ -421,6 +716,43 @@ def _make_onpage(
     return _draw
 
 
+def _page_label_position(instr: PdfInstructions) -> Tuple[float, float]:
+    """Where _make_onpage right-aligns the page number."""
+    (width, _), margins = _page_geometry(instr)
+    return width - margins["right"], margins["bottom"] - 10 - 12
+
+
+class _TotalPagesCanvas(Canvas):
+    """
+    Canvas that holds back each finished page until save(), when the page count is
+    known, then draws "Page X of Y" into every page. The layout runs once; the extra
+    work is one short string per page instead of a second doc.build.
+    """
+
+    def __init__(self, *args: Any, page_label_at: Tuple[float, float] = (0.0, 0.0), **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._page_label_at = page_label_at
+        self._held_pages: List[Dict[str, Any]] = []
+
+    def showPage(self) -> None:
+        self._held_pages.append(dict(self.__dict__))
+        self._startPage()
+
+    def save(self) -> None:
+        if len(self._code):
+            self.showPage()
+        total = len(self._held_pages)
+        x, y = self._page_label_at
+        for state in self._held_pages:
+            self.__dict__.update(state)
+            self.setFont("Helvetica", 9)
+            self.setFillColor(colors.grey)
+            self.drawRightString(x, y, f"Page {self._pageNumber} of {total}")
+            super().showPage()
+        self._held_pages = []
+        super().save()
+
+
 def _wrap_text_with_inline_tags(p: ParagraphSpec) -> str:
     text = p.text
     if p.bold:
@@ -437,12 +769,17 @@ def _safe_font_choice(requested: Optional[str]) -> str:
     Return a font name that is both allowed and registered.
     Falls back to Helvetica if the requested face/family is not available.
     """
-    if requested and requested in _ALLOWED_FONTS:
+    if requested and requested in _ALLOWED_FONTS and requested not in _FAMILY_FACES:
         return requested
     if requested:
         fam = _derive_family_from_filename(requested) or requested
+        if fam in _FAMILY_FACES:
+            return _FAMILY_FACES[fam]
         if fam in _ALLOWED_FONTS:
             return fam
+        face = _FONT_DIR.resolve(requested)
+        if face:
+            return face
     return "Helvetica"
 
 
@@ -465,11 +802,11 @@ def _paragraph_style(base: ParagraphStyle, spec: ParagraphSpec) -> ParagraphStyl
 
 
 def _image_flowable(im: ImageSpec) -> RLImage:
-    if not im.b64:
+    if not im.b64 and not im.asset_id:
         raise ValueError(
-            "ImageSpec requires 'b64' (or provide 'name' resolvable via __files__)."
+            "ImageSpec requires 'b64' or 'asset_id' (or provide 'name' resolvable via __files__)."
         )
-    raw = base64.b64decode(im.b64)
+    raw = _image_bytes(im)
     reader = ImageReader(io.BytesIO(raw))
     iw, ih = reader.getSize()
     target_w = im.width_inches * inch
@@ -509,32 +846,128 @@ def _table_flowable(t: TableSpec) -> Table:
     return tbl
 
 
-def _create_pdf(instr: PdfInstructions) -> bytes:
-    buf = io.BytesIO()
-    pagesize = LETTER if instr.page_size == "LETTER" else A4
-    left = instr.margins_inches.get("left", 1.0) * inch
-    right = instr.margins_inches.get("right", 1.0) * inch
-    top = instr.margins_inches.get("top", 1.0) * inch
-    bottom = instr.margins_inches.get("bottom", 1.0) * inch
+class _TextLines(Flowable):
+    """
+    Literal text laid out as lines without reportlab's markup parser. Lines are broken
+    once, on first wrap; splitting only slices the shared line list, so a block of any
+    length streams across pages in linear time (Preformatted re-joins and re-splits the
+    remainder on every page).
+    """
 
-    doc = SimpleDocTemplate(
-        buf,
-        pagesize=pagesize,
-        leftMargin=left,
-        rightMargin=right,
-        topMargin=top,
-        bottomMargin=bottom,
-        title=instr.title or "",
-        author=instr.author or "",
-        subject=instr.subject or "",
+    def __init__(
+        self,
+        text: str,
+        font: str,
+        size: float,
+        leading: float,
+        align: str = "left",
+        wrap_words: bool = True,
+        lines: Optional[List[str]] = None,
+        start: int = 0,
+        end: Optional[int] = None,
+    ) -> None:
+        super().__init__()
+        self.text = text
+        self.font = font
+        self.size = size
+        self.leading = leading
+        self.align = align
+        self.wrap_words = wrap_words
+        self._lines = lines
+        self._start = start
+        self._end = end
+
+    def _break_lines(self, width: float) -> List[str]:
+        lines: List[str] = []
+        string_width = pdfmetrics.stringWidth
+        for raw in self.text.expandtabs(4).split("\n"):
+            pieces = (
+                simpleSplit(raw, self.font, self.size, width) if self.wrap_words else [raw]
+            ) or [""]
+            for piece in pieces:
+                # Hard-break anything still too wide (long tokens, code lines)
+                while string_width(piece, self.font, self.size) > width and len(piece) > 1:
+                    cut = max(1, int(len(piece) * width / string_width(piece, self.font, self.size)))
+                    while cut > 1 and string_width(piece[:cut], self.font, self.size) > width:
+                        cut -= 1
+                    lines.append(piece[:cut])
+                    piece = piece[cut:]
+                lines.append(piece)
+        return lines
+
+    def wrap(self, availWidth: float, availHeight: float) -> Tuple[float, float]:
+        if self._lines is None:
+            self._lines = self._break_lines(availWidth)
+            self._end = len(self._lines)
+        self.width = availWidth
+        self.height = (self._end - self._start) * self.leading
+        return self.width, self.height
+
+    def split(self, availWidth: float, availHeight: float) -> List[Flowable]:
+        self.wrap(availWidth, availHeight)
+        fits = int(availHeight // self.leading)
+        if fits <= 0:
+            return []
+        if self._start + fits >= self._end:
+            return [self]
+        args = (self.text, self.font, self.size, self.leading, self.align, self.wrap_words, self._lines)
+        return [
+            _TextLines(*args, start=self._start, end=self._start + fits),
+            _TextLines(*args, start=self._start + fits, end=self._end),
+        ]
+
+    def draw(self) -> None:
+        canv = self.canv
+        canv.saveState()
+        canv.setFillColor(colors.black)
+        tx = canv.beginText(0, self.height - self.size)
+        tx.setFont(self.font, self.size, self.leading)
+        lines = self._lines[self._start : self._end]
+        if self.align in ("center", "right"):
+            y = self.height - self.size
+            for line in lines:
+                slack = self.width - pdfmetrics.stringWidth(line, self.font, self.size)
+                tx.setTextOrigin(slack / 2 if self.align == "center" else slack, y)
+                tx.textOut(line)
+                y -= self.leading
+        else:
+            for line in lines:
+                tx.textLine(line)
+        canv.drawText(tx)
+        canv.restoreState()
+
+
+def _text_lines_flowable(p: ParagraphSpec) -> _TextLines:
+    default_face = "Courier" if p.kind == "preformatted" and not p.font_name else None
+    font = default_face or _safe_font_choice(p.font_name)
+    try:
+        font = tt2ps(font, int(p.bold), int(p.italic))
+    except ValueError:
+        pass
+    size = p.font_size_pt or 10
+    return _TextLines(
+        p.text,
+        font,
+        size,
+        p.leading_pt or size * 1.2,
+        align=p.align or "left",
+        wrap_words=p.kind == "plain",
     )
 
+
+def _build_story(instr: PdfInstructions) -> List[Any]:
     styles = getSampleStyleSheet()
     normal = styles["Normal"]
 
     story: List[Any] = []
 
     for p in instr.paragraphs:
+        if p.page_break_before and story:
+            story.append(PageBreak())
+        if p.kind != "markup":
+            story.append(_text_lines_flowable(p))
+            story.append(Spacer(1, 6))
+            continue
         html = _wrap_text_with_inline_tags(p)
         pstyle = _paragraph_style(normal, p)
         story.append(Paragraph(html, pstyle))
@@ -550,19 +983,427 @@ def _create_pdf(instr: PdfInstructions) -> bytes:
 
     if not story:
         story.append(Paragraph(" ", _paragraph_style(normal, ParagraphSpec(text=" "))))
+    return story
+
+
+def _page_geometry(instr: PdfInstructions) -> Tuple[Tuple[float, float], Dict[str, float]]:
+    pagesize = LETTER if instr.page_size == "LETTER" else A4
+    margins = {
+        k: instr.margins_inches.get(k, 1.0) * inch
+        for k in ("left", "right", "top", "bottom")
+    }
+    return pagesize, margins
+
+
+def _render_serial(instr: PdfInstructions) -> bytes:
+    buf = io.BytesIO()
+    pagesize, margins = _page_geometry(instr)
 
-    onpage = _make_onpage(instr.header_text, instr.footer_text, instr.show_page_numbers)
-    doc.build(story, onFirstPage=onpage, onLaterPages=onpage)
+    doc = SimpleDocTemplate(
+        buf,
+        pagesize=pagesize,
+        leftMargin=margins["left"],
+        rightMargin=margins["right"],
+        topMargin=margins["top"],
+        bottomMargin=margins["bottom"],
+        title=instr.title or "",
+        author=instr.author or "",
+        subject=instr.subject or "",
+    )
+
+    story = _build_story(instr)
+    with_total = instr.show_page_numbers and instr.show_total_pages
+    onpage = _make_onpage(
+        instr.header_text,
+        instr.footer_text,
+        instr.show_page_numbers and not with_total,
+        instr.watermark_text,
+    )
+    if with_total:
+        canvasmaker = functools.partial(
+            _TotalPagesCanvas, page_label_at=_page_label_position(instr)
+        )
+        doc.build(story, onFirstPage=onpage, onLaterPages=onpage, canvasmaker=canvasmaker)
+    else:
+        doc.build(story, onFirstPage=onpage, onLaterPages=onpage)
     return buf.getvalue()
 
 
-def _modify_pdf(existing: bytes, instr: PdfInstructions) -> bytes:
+# ----------------------------
+# Page stamping
+# ----------------------------
+
+
+def _overlay_form(writer: PdfWriter, instr: PdfInstructions, width: float, height: float) -> Any:
+    """
+    Header, footer and watermark for a width x height page, drawn once by _make_onpage
+    and wrapped as a form XObject that any number of pages can reference.
+    """
+    buf = io.BytesIO()
+    canv = Canvas(buf, pagesize=(width, height))
+    _, margins = _page_geometry(instr)
+    doc = SimpleNamespace(
+        leftMargin=margins["left"],
+        rightMargin=margins["right"],
+        topMargin=margins["top"],
+        bottomMargin=margins["bottom"],
+        page=0,
+    )
+    _make_onpage(instr.header_text, instr.footer_text, False, instr.watermark_text)(canv, doc)
+    canv.showPage()
+    canv.save()
+
+    drawn = PdfReader(buf).pages[0]
+    form = StreamObject()
+    form.set_data(drawn.get_contents().get_data())
+    form.update(
+        {
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/BBox"): ArrayObject(
+                [FloatObject(0), FloatObject(0), FloatObject(width), FloatObject(height)]
+            ),
+            NameObject("/Resources"): drawn["/Resources"].clone(writer),
+        }
+    )
+    return writer._add_object(form)
+
+
+def _page_resource(page: Any, category: str) -> DictionaryObject:
+    if "/Resources" not in page:
+        page[NameObject("/Resources")] = DictionaryObject()
+    resources = page["/Resources"].get_object()
+    if category not in resources:
+        resources[NameObject(category)] = DictionaryObject()
+    return resources[category].get_object()
+
+
+def _stamp_pages(writer: PdfWriter, instr: PdfInstructions, existing: int = 0) -> None:
+    """
+    Add what _make_onpage would have drawn, without re-layout and without merging pages:
+
+    - the first `existing` pages (foreign content) get the header/footer/watermark overlay,
+      rendered once per page size as a shared form XObject and referenced with `Do`;
+      their original content is wrapped in q/Q so its graphics state cannot leak;
+    - with show_page_numbers, every page gets "Page N" (or "Page N of T").
+
+    Per page this adds a single stream of a few dozen bytes.
+    """
+    total = len(writer.pages)
+    font = None
+    if instr.show_page_numbers:
+        font = writer._add_object(
+            DictionaryObject(
+                {
+                    NameObject("/Type"): NameObject("/Font"),
+                    NameObject("/Subtype"): NameObject("/Type1"),
+                    NameObject("/BaseFont"): NameObject("/Helvetica"),
+                    NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+                }
+            )
+        )
+    save_state = None
+    forms: Dict[Tuple[float, float], Tuple[str, Any]] = {}
+    _, margins = _page_geometry(instr)
+
+    for number, page in enumerate(writer.pages, start=1):
+        box = page.mediabox
+        llx, lly = float(box.left), float(box.bottom)
+        ops: List[str] = []
+        isolate = number <= existing
+
+        if isolate:
+            size = (float(box.width), float(box.height))
+            if size not in forms:
+                forms[size] = (f"/DocStamp{len(forms)}", _overlay_form(writer, instr, *size))
+            name, form = forms[size]
+            _page_resource(page, "/XObject")[NameObject(name)] = form
+            ops.append(f"Q q 1 0 0 1 {llx:.3f} {lly:.3f} cm {name} Do Q")
+
+        if font is not None:
+            label = f"Page {number} of {total}" if instr.show_total_pages else f"Page {number}"
+            x = llx + float(box.width) - margins["right"] - pdfmetrics.stringWidth(label, "Helvetica", 9)
+            y = lly + margins["bottom"] - 10 - 12
+            _page_resource(page, "/Font")[NameObject("/FPageNo")] = font
+            ops.append(
+                f"q .501961 .501961 .501961 rg BT /FPageNo 9 Tf 10.8 TL "
+                f"1 0 0 1 {x:.3f} {y:.3f} Tm ({label}) Tj T* ET Q"
+            )
+        if not ops:
+            continue
+
+        stream = StreamObject()
+        stream.set_data(" ".join(ops).encode("ascii"))
+        contents = page.get("/Contents")
+        parts = ArrayObject()
+        if isolate:
+            if save_state is None:
+                save_state = StreamObject()
+                save_state.set_data(b"q")
+                save_state = writer._add_object(save_state)
+            parts.append(save_state)
+        if contents is not None:
+            target = contents.get_object()
+            if isinstance(target, ArrayObject):
+                parts.extend(target)
+            else:
+                parts.append(contents)
+        parts.append(writer._add_object(stream))
+        page[NameObject("/Contents")] = parts
+
+
+# ----------------------------
+# Worker processes
+# ----------------------------
+
+
+def _read_own_source() -> Optional[str]:
+    # Open WebUI execs a tool from a temporary file that it deletes after loading.
+    try:
+        with open(__file__, encoding="utf-8") as fh:
+            return fh.read()
+    except (NameError, OSError):
+        return None
+
+
+_MODULE_SOURCE = _read_own_source()
+
+# Initializer of every worker, run through the builtin exec so that it unpickles
+# without this module: rebuild the module from its source under the same name (jobs
+# refer to its functions and models by that name), keeping Open WebUI's database and
+# storage layers out of the worker, then restore the parent's setup (_worker_state).
+_WORKER_BOOTSTRAP = """
+import sys, types
+for blocked in ("open_webui.models", "open_webui.storage"):
+    sys.modules.setdefault(blocked, None)
+if name not in sys.modules:
+    module = types.ModuleType(name)
+    module.__file__ = path
+    sys.modules[name] = module
+    exec(compile(source, path, "exec"), module.__dict__)
+sys.modules[name]._init_worker(state)
+"""
+
+# Failures of the pool itself: a worker died or could not start, or a job did not
+# pickle. The caller then renders serially; errors raised by a render propagate.
+_POOL_ERRORS = (BrokenProcessPool, pickle.PicklingError)
+
+
+def _worker_state() -> Dict[str, Any]:
+    return {
+        "font_dir": _FONT_DIR.root,
+        "fonts": dict(_ATTACHED_FONTS),
+        "asset_dir": _ASSETS.root,
+        "asset_cache_size": _ASSETS.cache_size,
+    }
+
+
+def _worker_key(state: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (
+        state["font_dir"],
+        tuple(
+            sorted(
+                (family, tuple((name, hash(raw)) for name, raw in files.items()))
+                for family, files in state["fonts"].items()
+            )
+        ),
+        state["asset_dir"],
+        state["asset_cache_size"],
+    )
+
+
+def _init_worker(state: Dict[str, Any]) -> None:
+    _ALLOWED_FONTS.update(_register_font_bytes(state["fonts"]))
+    _FONT_DIR.configure(state["font_dir"])
+    _ASSETS.configure(state["asset_dir"], state["asset_cache_size"])
+
+
+class _WorkerPool:
+    """
+    Process pool for CPU-bound renders, kept warm across requests. Workers are fresh
+    interpreters (forkserver, else spawn), not forks of this multithreaded server
+    process, so they never inherit a lock another thread held. The pool is replaced
+    when the worker count or _worker_key changes; a broken pool is dropped and the
+    call falls back to a serial render.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._key: Optional[Tuple[Any, ...]] = None
+
+    def _get(self, workers: int) -> Optional[ProcessPoolExecutor]:
+        if workers < 2 or _MODULE_SOURCE is None:
+            return None
+        state = _worker_state()
+        key = (workers, _worker_key(state))
+        with self._lock:
+            if self._pool is None or self._key != key:
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False)
+                methods = multiprocessing.get_all_start_methods()
+                ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                self._pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=ctx,
+                    initializer=exec,
+                    initargs=(
+                        _WORKER_BOOTSTRAP,
+                        {"name": __name__, "path": __file__, "source": _MODULE_SOURCE, "state": state},
+                    ),
+                )
+                self._key = key
+            return self._pool
+
+    def _discard(self, pool: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._pool is pool:
+                self._pool, self._key = None, None
+        pool.shutdown(wait=False)
+
+    def map(self, fn: Any, items: List[Any], workers: int) -> Optional[List[Any]]:
+        """[fn(item) ...] computed in the pool, or None if no pool is available or it failed."""
+        pool = self._get(workers)
+        if pool is None:
+            return None
+        try:
+            return list(pool.map(fn, items, chunksize=max(1, len(items) // (workers * 4))))
+        except _POOL_ERRORS:
+            self._discard(pool)
+            return None
+
+    def submit(self, fn: Any, item: Any, workers: int) -> Optional[Future]:
+        """Future of fn(item) in the pool, or None if no pool is available."""
+        pool = self._get(workers)
+        if pool is None:
+            return None
+        try:
+            return pool.submit(fn, item)
+        except _POOL_ERRORS:
+            self._discard(pool)
+            return None
+
+
+_WORKERS = _WorkerPool()
+
+
+# ----------------------------
+# Parallel sectioned rendering
+# ----------------------------
+
+
+def _split_sections(instr: PdfInstructions) -> List[PdfInstructions]:
+    """
+    Cut the story at page_break_before paragraphs. Each section starts at the top of a
+    fresh page in the serial layout too, so sections lay out independently. Images and
+    tables follow the paragraphs and stay with the last section. Page numbers are left
+    off; they depend on earlier sections and are stamped after stitching.
+    """
+    groups: List[List[ParagraphSpec]] = [[]]
+    for p in instr.paragraphs:
+        if p.page_break_before and groups[-1]:
+            groups.append([])
+        groups[-1].append(p)
+    if len(groups) < 2:
+        return [instr]
+    sections = [
+        instr.model_copy(
+            update={"paragraphs": g, "images": [], "tables": [], "show_page_numbers": False}
+        )
+        for g in groups
+    ]
+    sections[-1] = sections[-1].model_copy(
+        update={"images": instr.images, "tables": instr.tables}
+    )
+    return sections
+
+
+def _section_key(section: PdfInstructions) -> str:
+    """
+    Content hash of a section plus what its names resolve to right now: the font
+    behind each font_name and the file behind each asset_id. A family installed in
+    font_dir, a re-attached font or an edited asset file therefore misses the cache.
+    """
+    fonts = []
+    for name in sorted({p.font_name for p in section.paragraphs if p.font_name}):
+        face = _safe_font_choice(name)
+        fonts.append((name, face, _FONT_SOURCES.get(face, "")))
+    assets = [_ASSETS.version(im.asset_id) for im in section.images if im.asset_id and not im.b64]
+    resolved = json.dumps([fonts, assets])
+    return hashlib.sha256((section.model_dump_json() + resolved).encode("utf-8")).hexdigest()
+
+
+def _render_sections(
+    instr: PdfInstructions,
+    sections: List[PdfInstructions],
+    workers: int,
+    cache: Optional["_TTLCache"] = None,
+) -> bytes:
+    """
+    Render each section on its own and stitch them. With a cache, sections whose
+    content is unchanged since an earlier render are reused, so a revision only lays
+    out the chapters it touched.
+    """
+    keys = [_section_key(sec) for sec in sections] if cache is not None else []
+    parts: List[Optional[bytes]] = (
+        [cache.get(k) for k in keys] if cache is not None else [None] * len(sections)
+    )
+    todo = [i for i, part in enumerate(parts) if part is None]
+    rendered = (
+        _WORKERS.map(_render_serial, [sections[i] for i in todo], workers)
+        if len(todo) > 1
+        else None
+    )
+    if rendered is None:
+        rendered = [_render_serial(sections[i]) for i in todo]
+    for i, part in zip(todo, rendered):
+        parts[i] = part
+        if cache is not None:
+            cache.put(keys[i], part)
+
+    writer = PdfWriter(clone_from=PdfReader(io.BytesIO(parts[0])))
+    for part in parts[1:]:
+        writer.append(PdfReader(io.BytesIO(part)))
+    if instr.show_page_numbers:
+        _stamp_pages(writer, instr)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+# ----------------------------
+# PDF create / modify
+# ----------------------------
+
+
+def _create_pdf(
+    instr: PdfInstructions, workers: int = 1, section_cache: Optional["_TTLCache"] = None
+) -> bytes:
+    if workers > 1 or section_cache is not None:
+        sections = _split_sections(instr)
+        if len(sections) > 1:
+            return _render_sections(instr, sections, workers, section_cache)
+    return _render_serial(instr)
+
+
+def _modify_pdf(
+    existing: bytes,
+    instr: PdfInstructions,
+    workers: int = 1,
+    section_cache: Optional["_TTLCache"] = None,
+    reader: Optional[PdfReader] = None,
+) -> bytes:
     """
     Basic 'modify' behavior: append newly generated pages to the end of the existing PDF.
+    With stamp_existing, the existing pages also get header/footer/watermark and page
+    numbers, numbered continuously with the appended ones. `reader` may be an already
+    parsed reader of `existing`; it is only read from.
     """
-    new_bytes = (
-        _create_pdf(instr)
-        if (
+    if instr.stamp_existing:
+        has_content = bool(instr.paragraphs or instr.images or instr.tables)
+        generate = instr.model_copy(update={"show_page_numbers": False})
+    else:
+        has_content = bool(
             instr.paragraphs
             or instr.images
             or instr.tables
@@ -570,9 +1411,9 @@ def _modify_pdf(existing: bytes, instr: PdfInstructions) -> bytes:
             or instr.header_text
             or instr.footer_text
         )
-        else b""
-    )
-    reader_old = PdfReader(io.BytesIO(existing))
+        generate = instr
+    new_bytes = _create_pdf(generate, workers, section_cache) if has_content else b""
+    reader_old = reader if reader is not None else PdfReader(io.BytesIO(existing))
     writer = PdfWriter()
 
     for page in reader_old.pages:
@@ -583,43 +1424,1740 @@ def _modify_pdf(existing: bytes, instr: PdfInstructions) -> bytes:
         for page in reader_new.pages:
             writer.add_page(page)
 
+    if instr.stamp_existing:
+        _stamp_pages(writer, instr, existing=len(reader_old.pages))
+
     out = io.BytesIO()
     writer.write(out)
     return out.getvalue()
 
 
 # ----------------------------
-# File Upload Helper (FIXED - correct FileForm structure with tags)
+# DOCX output (same instruction tree)
 # ----------------------------
 
+_MARKUP_TOKEN_RE = re.compile(
+    r"<\s*(/?)\s*(b|strong|i|em|u)\s*>|<\s*(br)\s*/?\s*>|<[^>]*>", re.IGNORECASE
+)
+_MARKUP_TAGS = {"b": 0, "strong": 0, "i": 1, "em": 1, "u": 2}
+# Word equivalents of the PDF core fonts; other families keep their name.
+_DOCX_FONTS = {"Helvetica": "Arial", "Times": "Times New Roman", "Courier": "Courier New"}
+_DOCX_ALIGN = {"left": 0, "center": 1, "right": 2, "justify": 3}  # WD_ALIGN_PARAGRAPH
 
-def _upload_generated_file(
-    file_bytes: bytes,
-    filename: str,
-    content_type: str,
-    user_id: str,
-    user_email: str,
-    user_name: str,
-) -> str:
-    """
-    Upload a generated file using Open WebUI's Storage provider and Files model.
-    Returns the file ID for use in event emitter and URLs.
 
-    This matches the exact structure used in open_webui/routers/files.py
+def _markup_runs(text: str) -> Iterator[Tuple[str, bool, bool, bool]]:
     """
-    # Generate unique file ID
-    file_id = str(uuid.uuid4())
+    (text, bold, italic, underline) runs of a 'markup' paragraph. <br/> becomes a line
+    break; other tags (font, link, ...) are dropped and their text kept.
+    """
+    depth = [0, 0, 0]
+    pos = 0
+    for m in _MARKUP_TOKEN_RE.finditer(text):
+        if m.start() > pos:
+            yield html.unescape(text[pos : m.start()]), depth[0] > 0, depth[1] > 0, depth[2] > 0
+        if m.group(2):
+            i = _MARKUP_TAGS[m.group(2).lower()]
+            depth[i] = max(0, depth[i] + (-1 if m.group(1) else 1))
+        elif m.group(3):
+            yield "\n", depth[0] > 0, depth[1] > 0, depth[2] > 0
+        pos = m.end()
+    if pos < len(text):
+        yield html.unescape(text[pos:]), depth[0] > 0, depth[1] > 0, depth[2] > 0
+
+
+def _docx_font(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    family = _derive_family_from_filename(name) or name.split("-")[0]
+    return _DOCX_FONTS.get(family, family)
 
-    # Create a unique storage filename to avoid collisions (matches router pattern)
-    safe_filename = f"{file_id}_{filename}"
 
-    # Build the tags dictionary (REQUIRED for S3StorageProvider)
-    tags = {
-        "OpenWebUI-User-Email": user_email,
-        "OpenWebUI-User-Id": user_id,
-        "OpenWebUI-User-Name": user_name,
-        "OpenWebUI-File-Id": file_id,
-    }
+def _docx_field(paragraph: Any, code: str) -> None:
+    """Append a simple field (PAGE, NUMPAGES) that Word updates when it lays out pages."""
+    field = OxmlElement("w:fldSimple")
+    field.set(qn("w:instr"), code)
+    run = OxmlElement("w:r")
+    placeholder = OxmlElement("w:t")
+    placeholder.text = "1"
+    run.append(placeholder)
+    field.append(run)
+    paragraph._p.append(field)
+
+
+def _docx_paragraph(doc: Any, p: ParagraphSpec) -> None:
+    para = doc.add_paragraph()
+    if p.style:
+        try:
+            para.style = p.style
+        except KeyError:
+            pass
+    fmt = para.paragraph_format
+    fmt.alignment = _DOCX_ALIGN.get(p.align or "left", 0)
+    if p.page_break_before:
+        fmt.page_break_before = True
+    if p.leading_pt:
+        fmt.line_spacing = DocxPt(p.leading_pt)
+    font = _docx_font(p.font_name) or ("Courier New" if p.kind == "preformatted" else None)
+    if p.kind == "markup":
+        runs: Iterable[Tuple[str, bool, bool, bool]] = _markup_runs(p.text)
+    else:
+        runs = [(p.text, False, False, False)]
+    for text, bold, italic, underline in runs:
+        if not text:
+            continue
+        run = para.add_run(text)
+        run.bold = True if (p.bold or bold) else None
+        run.italic = True if (p.italic or italic) else None
+        if p.kind == "markup" and (p.underline or underline):
+            run.underline = True
+        if font:
+            run.font.name = font
+        if p.font_size_pt:
+            run.font.size = DocxPt(p.font_size_pt)
+
+
+def _docx_table(doc: Any, t: TableSpec) -> None:
+    cols = max(len(row) for row in t.rows)
+    table = doc.add_table(rows=len(t.rows), cols=cols)
+    if t.style_grid:
+        try:
+            table.style = "Table Grid"
+        except KeyError:
+            pass
+    for row_obj, row in zip(table.rows, t.rows):
+        for cell, value in zip(row_obj.cells, row):
+            cell.text = "" if value is None else str(value)
+    if t.header:
+        for cell in table.rows[0].cells:
+            for run in cell.paragraphs[0].runs:
+                run.bold = True
+    if t.col_widths_inches:
+        for column, width in zip(table.columns, t.col_widths_inches):
+            for cell in column.cells:
+                cell.width = DocxInches(width)
+
+
+def _render_docx(instr: PdfInstructions) -> bytes:
+    """
+    The same instruction tree as a Word document: page size and margins, metadata,
+    header/footer with PAGE (and NUMPAGES) fields, then paragraphs, images and tables
+    in the PDF's order. Watermarks and letterheads are PDF-only.
+    """
+    if DocxDocument is None:
+        raise RuntimeError("DOCX output needs python-docx on the server (pip install python-docx).")
+    doc = DocxDocument()
+    (width, height), margins = _page_geometry(instr)
+    section = doc.sections[0]
+    section.page_width, section.page_height = DocxPt(width), DocxPt(height)
+    section.left_margin, section.right_margin = DocxPt(margins["left"]), DocxPt(margins["right"])
+    section.top_margin, section.bottom_margin = DocxPt(margins["top"]), DocxPt(margins["bottom"])
+    props = doc.core_properties
+    props.title, props.author, props.subject = instr.title or "", instr.author or "", instr.subject or ""
+    if instr.header_text:
+        section.header.paragraphs[0].text = instr.header_text
+    if instr.footer_text:
+        section.footer.paragraphs[0].text = instr.footer_text
+    if instr.show_page_numbers:
+        numbers = section.footer.add_paragraph()
+        numbers.paragraph_format.alignment = _DOCX_ALIGN["right"]
+        numbers.add_run("Page ")
+        _docx_field(numbers, "PAGE")
+        if instr.show_total_pages:
+            numbers.add_run(" of ")
+            _docx_field(numbers, "NUMPAGES")
+
+    for p in instr.paragraphs:
+        _docx_paragraph(doc, p)
+    for im in instr.images:
+        if not im.b64 and not im.asset_id:
+            raise ValueError(
+                f"Image '{im.name or '?'}' is not attached and has no b64 or asset_id."
+            )
+        doc.add_picture(io.BytesIO(_image_bytes(im)), width=DocxInches(im.width_inches))
+    for t in instr.tables:
+        _docx_table(doc, t)
+
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def _render_outputs(
+    instr: PdfInstructions,
+    formats: List[str],
+    workers: int = 1,
+    section_cache: Optional["_TTLCache"] = None,
+) -> Dict[str, bytes]:
+    """
+    Render one validated tree to every requested format. Images are decoded once up
+    front and shared; with workers > 1 the DOCX is written in a worker process while
+    this process lays out the PDF.
+    """
+    for im in instr.images:
+        if im.b64 or im.asset_id:
+            _image_bytes(im)
+    pending = (
+        _WORKERS.submit(_render_docx, instr, workers) if {"pdf", "docx"} <= set(formats) else None
+    )
+    out: Dict[str, bytes] = {}
+    if "pdf" in formats:
+        out["pdf"] = _create_pdf(instr, workers, section_cache)
+    if "docx" in formats:
+        docx: Optional[bytes] = None
+        if pending is not None:
+            try:
+                docx = pending.result()
+            except _POOL_ERRORS:
+                pass
+        out["docx"] = docx if docx is not None else _render_docx(instr)
+    return {fmt: out[fmt] for fmt in formats}
+
+
+# ----------------------------
+# Letterhead templates
+# ----------------------------
+
+
+class _TemplateRegistry:
+    """
+    Admin-provided letterhead PDFs (valves.template_dir), parsed once per process.
+
+    Templates are addressed by file name without extension. A file is read only when
+    its mtime changes; each get returns its own PdfReader over the cached bytes, since
+    a reader resolves objects lazily and is not safe to share between the threads that
+    apply letterheads concurrently.
+    """
+
+    def __init__(self) -> None:
+        self._dir: Optional[str] = None
+        self._parsed: Dict[str, Tuple[float, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, template_dir: str, template_id: str) -> PdfReader:
+        if not template_dir:
+            raise PermissionError(
+                "Templates are not configured. Ask an admin to set the template_dir valve."
+            )
+        if os.path.basename(template_id) != template_id or template_id.startswith("."):
+            raise ValueError(f"Invalid template_id: {template_id!r}")
+        path = os.path.join(template_dir, f"{template_id}.pdf")
+        if not os.path.isfile(path):
+            raise FileNotFoundError(
+                f"Template '{template_id}' (.pdf) was not found in the template directory."
+            )
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            if template_dir != self._dir:
+                self._dir = template_dir
+                self._parsed.clear()
+            cached = self._parsed.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, "rb") as fh:
+                cached = (mtime, fh.read())
+            with self._lock:
+                self._parsed[path] = cached
+        return PdfReader(io.BytesIO(cached[1]))
+
+
+_TEMPLATES = _TemplateRegistry()
+
+
+def _apply_letterhead(pdf_bytes: bytes, template: PdfReader) -> bytes:
+    """Merge the template's first page beneath every page of pdf_bytes."""
+    letterhead = template.pages[0]
+    writer = PdfWriter(clone_from=PdfReader(io.BytesIO(pdf_bytes)))
+    for page in writer.pages:
+        page.merge_page(letterhead, over=False)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+# ----------------------------
+# Linearization ("fast web view")
+# ----------------------------
+
+_LINEARIZED_RE = re.compile(rb"<<[^>]*/Linearized\s+[\d.]+[^>]*>>", re.S)
+
+
+def _linearization_info(pdf_bytes: bytes) -> Optional[Dict[str, int]]:
+    """
+    The linearization parameter dictionary, if present. It must be the first object
+    in the file; /E is the offset where the first page's objects end, /L the file size.
+    """
+    match = _LINEARIZED_RE.search(pdf_bytes[:2048])
+    if not match:
+        return None
+    info: Dict[str, int] = {}
+    for key in ("L", "E", "N", "O", "T"):
+        found = re.search(rb"/" + key.encode() + rb"\s+(\d+)", match.group(0))
+        if found:
+            info[key] = int(found.group(1))
+    return info
+
+
+def _linearize(pdf_bytes: bytes) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Rewrite pdf_bytes linearized so browsers can show page 1 before the download ends.
+    Uses pikepdf when installed, else a local qpdf binary; otherwise returns the input.
+    """
+    if pikepdf is not None:
+        with pikepdf.open(io.BytesIO(pdf_bytes)) as pdf:
+            out = io.BytesIO()
+            pdf.save(out, linearize=True)
+            linearized = out.getvalue()
+    elif shutil.which("qpdf"):
+        with tempfile.TemporaryDirectory() as tmp:
+            src, dst = os.path.join(tmp, "in.pdf"), os.path.join(tmp, "out.pdf")
+            with open(src, "wb") as fh:
+                fh.write(pdf_bytes)
+            subprocess.run(
+                ["qpdf", "--linearize", src, dst], check=True, capture_output=True
+            )
+            with open(dst, "rb") as fh:
+                linearized = fh.read()
+    else:
+        return pdf_bytes, {"linearized": False, "reason": "neither pikepdf nor qpdf is available"}
+
+    info = _linearization_info(linearized) or {}
+    return linearized, {
+        "linearized": bool(info),
+        "first_page_end": info.get("E"),
+        "size_before": len(pdf_bytes),
+        "size_after": len(linearized),
+        "overhead_bytes": len(linearized) - len(pdf_bytes),
+    }
+
+
+# ----------------------------
+# User profile cache (upload tags)
+# ----------------------------
+
+
+# Open WebUI installs every tool as a single file, so the two document tools each carry
+# this class (and the other shared helpers); tests/test_shared_helpers.py keeps the
+# copies identical.
+class _TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize: int, ttl: float) -> None:
+        with self._lock:
+            self.maxsize, self.ttl = maxsize, ttl
+            if ttl <= 0:
+                self._data.clear()
+            while len(self._data) > max(maxsize, 0):
+                self._data.popitem(last=False)
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Any, value: Any) -> None:
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Any = None) -> None:
+        """Drop one entry, or everything when key is None."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+
+_USER_CACHE = _TTLCache()
+
+
+def _request_profile(user: Optional[Dict[str, Any]]) -> Optional[Tuple[str, str]]:
+    """(email, name) as Open WebUI passed them in __user__ for this request, if present."""
+    if not isinstance(user, dict) or "email" not in user or "name" not in user:
+        return None
+    return user.get("email") or "", user.get("name") or ""
+
+
+def _lookup_user_profile(
+    user_id: str, current: Optional[Tuple[str, str]] = None
+) -> Tuple[Optional[Tuple[str, str]], bool]:
+    """
+    (email, name) for the storage tags, and whether it was had without a database read.
+    `current` is the profile from this request's __user__: it is already up to date
+    (a renamed user's next request carries the new name), so it is used as is and
+    refreshes the cache. Only requests without one fall back to the cache, then the DB.
+    """
+    if current is not None:
+        _USER_CACHE.put(user_id, current)
+        return current, True
+    profile = _USER_CACHE.get(user_id)
+    if profile is not None:
+        return profile, True
+    user_obj = Users.get_user_by_id(user_id)
+    if not user_obj:
+        return None, False
+    profile = (user_obj.email or "", user_obj.name or "")
+    _USER_CACHE.put(user_id, profile)
+    return profile, False
+
+
+def _invalidate_user_profile(user_id: Optional[str] = None) -> None:
+    """Forget a cached profile (e.g. after a rename), or all of them."""
+    _USER_CACHE.invalidate(user_id)
+
+
+# ----------------------------
+# Asset library
+# ----------------------------
+
+_ASSET_EXTS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif", ".tiff", ".webp")
+
+# Standard variant widths (px). A placement of width_inches gets the smallest variant
+# that still has _ASSET_DPI pixels per inch; larger originals are never embedded whole.
+_ASSET_WIDTHS = (256, 512, 1024, 2048)
+_ASSET_DPI = 200
+
+
+def _downscale(raw: bytes, width_px: int) -> bytes:
+    """Resize to width_px (aspect kept), same format; unchanged if already narrower."""
+    if PILImage is None:
+        return raw
+    with PILImage.open(io.BytesIO(raw)) as img:
+        if img.width <= width_px:
+            return raw
+        fmt = img.format if img.format in ("PNG", "JPEG") else "PNG"
+        height = max(1, round(img.height * width_px / img.width))
+        resized = img.resize((width_px, height), PILImage.LANCZOS)
+        out = io.BytesIO()
+        resized.save(out, fmt, **({"quality": 90} if fmt == "JPEG" else {"optimize": True}))
+    return out.getvalue()
+
+
+class _AssetStore:
+    """
+    Admin image library (valves.asset_dir): logos, signatures, letterhead art,
+    referenced by ImageSpec.asset_id (file name without extension).
+
+    A file is read and hashed once per mtime. Originals and resized variants sit in an
+    LRU keyed by (content hash, width), so identical files under different IDs share
+    entries and each variant is decoded and resized once per process.
+    """
+
+    def __init__(self) -> None:
+        self._root = ""
+        self._hashes: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+        self._variants = _TTLCache(maxsize=64, ttl=float("inf"))
+
+    def configure(self, root: str, cache_size: int) -> None:
+        self._root = root
+        self._variants.configure(cache_size, float("inf"))
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    @property
+    def cache_size(self) -> int:
+        return self._variants.maxsize
+
+    def _path(self, asset_id: str) -> str:
+        if not self._root:
+            raise PermissionError(
+                "The asset library is not configured. Ask an admin to set the asset_dir valve."
+            )
+        if os.path.basename(asset_id) != asset_id or asset_id.startswith("."):
+            raise ValueError(f"Invalid asset_id: {asset_id!r}")
+        for ext in _ASSET_EXTS + tuple(e.upper() for e in _ASSET_EXTS):
+            path = os.path.join(self._root, asset_id + ext)
+            if os.path.isfile(path):
+                return path
+        raise FileNotFoundError(f"Asset '{asset_id}' was not found in the asset library.")
+
+    def version(self, asset_id: str) -> Tuple[str, float]:
+        """(path, modification time) of the file behind asset_id."""
+        path = self._path(asset_id)
+        return path, os.path.getmtime(path)
+
+    def _original(self, path: str) -> Tuple[str, bytes]:
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            known = self._hashes.get(path)
+        if known is not None and known[0] == mtime:
+            raw = self._variants.get((known[1], 0))
+            if raw is not None:
+                return known[1], raw
+        with open(path, "rb") as fh:
+            raw = fh.read()
+        digest = hashlib.sha256(raw).hexdigest()
+        with self._lock:
+            self._hashes[path] = (mtime, digest)
+        self._variants.put((digest, 0), raw)
+        return digest, raw
+
+    def get(self, asset_id: str, width_inches: float) -> bytes:
+        """Image bytes for asset_id, sized for a placement width_inches wide."""
+        digest, raw = self._original(self._path(asset_id))
+        width = next((w for w in _ASSET_WIDTHS if w >= width_inches * _ASSET_DPI), 0)
+        if not width:
+            return raw
+        data = self._variants.get((digest, width))
+        if data is None:
+            data = _downscale(raw, width)
+            self._variants.put((digest, width), data)
+        return data
+
+
+_ASSETS = _AssetStore()
+
+
+def _image_bytes(im: ImageSpec) -> bytes:
+    if im._data is None:
+        im._data = (
+            base64.b64decode(im.b64) if im.b64 else _ASSETS.get(im.asset_id or "", im.width_inches)
+        )
+    return im._data
+
+
+# ----------------------------
+# Compact Markdown instructions
+# ----------------------------
+
+# `markdown` is a terse alternative to the JSON instructions: optional front matter
+# (`key: value` lines between `---` fences, using the instruction field names) followed
+# by Markdown blocks. It is read in one pass and mapped onto the same instruction model.
+
+_MD_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)(?:\s+#+)?\s*$")
+_MD_BREAK_RE = re.compile(r"^\s*(?:\*\s*){3,}$|^\s*(?:-\s*){3,}$|^\s*(?:_\s*){3,}$")
+_MD_ITEM_RE = re.compile(r"^\s*([-*+]|\d+[.)])\s+(.*)$")
+_MD_IMAGE_RE = re.compile(r"^!\[([^\]]*)\]\(([^)\s]+)\)\s*(?:\{([^{}]*)\})?\s*$")
+_MD_TABLE_SEP_RE = re.compile(r"^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$")
+_MD_ATTRS_RE = re.compile(r"\s*\{([^{}]*)\}\s*$")
+_MD_NUMBER_RE = re.compile(r"^-?\d+(\.\d+)?$")
+
+
+def _md_scalar(value: str) -> Any:
+    v = value.strip()
+    if len(v) >= 2 and v[0] == v[-1] and v[0] in "\"'":
+        return v[1:-1]
+    low = v.lower()
+    if low in ("true", "yes", "on"):
+        return True
+    if low in ("false", "no", "off"):
+        return False
+    if low in ("null", "none", "~", ""):
+        return None
+    if _MD_NUMBER_RE.match(v):
+        return float(v) if "." in v else int(v)
+    return v
+
+
+def _md_attrs(text: str) -> Tuple[str, Dict[str, Any]]:
+    """Split a trailing `{center size=14 font=Inter}` attribute block off a line."""
+    m = _MD_ATTRS_RE.search(text)
+    if not m:
+        return text, {}
+    attrs: Dict[str, Any] = {}
+    for token in m.group(1).split():
+        key, sep, value = token.partition("=")
+        attrs[key] = _md_scalar(value) if sep else True
+    return text[: m.start()], attrs
+
+
+def _md_cells(line: str) -> List[str]:
+    inner = line.strip()
+    if inner.startswith("|"):
+        inner = inner[1:]
+    if inner.endswith("|") and not inner.endswith("\\|"):
+        inner = inner[:-1]
+    return [c.strip().replace("\\|", "|") for c in re.split(r"(?<!\\)\|", inner)]
+
+
+class _MarkdownBlocks:
+    """
+    Single-pass block reader. feed() accepts text in arbitrary chunks and returns the
+    blocks completed so far; close() flushes the rest. Blocks are (kind, data) tuples:
+    ("meta", dict), ("heading", (level, text, attrs)), ("para", (text, attrs)),
+    ("item", (ordered, text, attrs)), ("code", (info, text)), ("table", (rows, header)),
+    ("image", (name, attrs)) and ("break", None).
+    """
+
+    def __init__(self) -> None:
+        self._tail = ""
+        self._state = "start"
+        self._meta: Dict[str, Any] = {}
+        self._para: List[str] = []
+        self._rows: List[List[str]] = []
+        self._header = False
+        self._code: Optional[Tuple[str, List[str]]] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        out: List[Tuple[str, Any]] = []
+        *lines, self._tail = (self._tail + chunk).split("\n")
+        for line in lines:
+            self._line(line.rstrip("\r"), out)
+        return out
+
+    def close(self) -> List[Tuple[str, Any]]:
+        out: List[Tuple[str, Any]] = []
+        if self._tail:
+            self._line(self._tail.rstrip("\r"), out)
+            self._tail = ""
+        if self._state == "meta":
+            raise ValueError("Markdown front matter is not closed with a '---' line.")
+        if self._code is not None:
+            out.append(("code", (self._code[0], "\n".join(self._code[1]))))
+            self._code = None
+        self._flush(out)
+        return out
+
+    def _flush(self, out: List[Tuple[str, Any]]) -> None:
+        if self._para:
+            text, attrs = _md_attrs(" ".join(self._para))
+            out.append(("para", (text, attrs)))
+            self._para = []
+        if self._rows:
+            out.append(("table", (self._rows, self._header)))
+            self._rows, self._header = [], False
+
+    def _line(self, line: str, out: List[Tuple[str, Any]]) -> None:
+        stripped = line.strip()
+        if self._state == "start":
+            if not stripped:
+                return
+            self._state = "body"
+            if stripped == "---":
+                self._state = "meta"
+                return
+        if self._state == "meta":
+            if stripped == "---":
+                self._state = "body"
+                out.append(("meta", self._meta))
+            elif stripped and not stripped.startswith("#"):
+                key, sep, value = stripped.partition(":")
+                if not sep:
+                    raise ValueError(f"Front matter line {stripped!r} is not 'key: value'.")
+                self._meta[key.strip()] = _md_scalar(value)
+            return
+        if self._code is not None:
+            if stripped.startswith("```"):
+                out.append(("code", (self._code[0], "\n".join(self._code[1]))))
+                self._code = None
+            else:
+                self._code[1].append(line)
+            return
+        if stripped.startswith("```"):
+            self._flush(out)
+            self._code = (stripped[3:].strip(), [])
+            return
+        if stripped.startswith("|"):
+            if self._para:
+                self._flush(out)
+            if self._rows and len(self._rows) == 1 and _MD_TABLE_SEP_RE.match(stripped):
+                self._header = True
+            else:
+                self._rows.append(_md_cells(stripped))
+            return
+        if self._rows or not stripped:
+            self._flush(out)
+            if not stripped:
+                return
+        m = _MD_HEADING_RE.match(stripped)
+        if m:
+            self._flush(out)
+            text, attrs = _md_attrs(m.group(2))
+            out.append(("heading", (len(m.group(1)), text, attrs)))
+            return
+        if _MD_BREAK_RE.match(stripped):
+            self._flush(out)
+            out.append(("break", None))
+            return
+        m = _MD_IMAGE_RE.match(stripped)
+        if m:
+            self._flush(out)
+            _, attrs = _md_attrs("{" + (m.group(3) or "") + "}")
+            attrs.setdefault("alt", m.group(1))
+            out.append(("image", (m.group(2), attrs)))
+            return
+        m = _MD_ITEM_RE.match(line)
+        if m:
+            self._flush(out)
+            text, attrs = _md_attrs(m.group(2))
+            out.append(("item", (m.group(1)[0].isdigit(), text, attrs)))
+            return
+        self._para.append(stripped)
+
+
+def _md_blocks(text: str) -> Iterator[Tuple[str, Any]]:
+    reader = _MarkdownBlocks()
+    yield from reader.feed(text)
+    yield from reader.close()
+
+
+_MD_HEADING_PT = {1: 20.0, 2: 16.0, 3: 13.0, 4: 12.0, 5: 11.0, 6: 11.0}
+_MD_ALIGNS = ("left", "center", "right", "justify")
+
+
+def _md_inline(text: str) -> str:
+    """Markdown emphasis and code spans -> the markup ParagraphSpec understands."""
+    text = html.escape(text, quote=False)
+    text = re.sub(r"`([^`]+)`", r'<font face="Courier">\1</font>', text)
+    text = re.sub(r"\*\*(.+?)\*\*", r"<b>\1</b>", text)
+    return re.sub(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])", r"<i>\1</i>", text)
+
+
+def _md_paragraph_fields(attrs: Dict[str, Any]) -> Dict[str, Any]:
+    fields: Dict[str, Any] = {}
+    for key, value in attrs.items():
+        if key in _MD_ALIGNS:
+            fields["align"] = key
+        elif key == "size":
+            fields["font_size_pt"] = value
+        elif key == "font":
+            fields["font_name"] = value
+        elif key == "break":
+            fields["page_break_before"] = bool(value)
+        else:
+            fields[key] = value
+    return fields
+
+
+def _md_image(target: str, attrs: Dict[str, Any]) -> Dict[str, Any]:
+    """`![alt](logo.png)` names an attachment; `![alt](asset:logo)` a library asset."""
+    image: Dict[str, Any] = (
+        {"asset_id": target[6:]} if target.startswith("asset:") else {"name": target}
+    )
+    if "width" in attrs:
+        image["width_inches"] = attrs["width"]
+    return image
+
+
+def _markdown_to_payload(text: str) -> Dict[str, Any]:
+    """
+    Map the compact Markdown format onto PdfInstructions fields. Headings become bold
+    paragraphs, list items get bullets/numbers, fenced code is 'preformatted', a `---`
+    line starts a new page, pipe tables become TableSpec and `![alt](name){width=2}`
+    an ImageSpec (`asset:logo` for library assets). Tables and images render after
+    the paragraphs, as in the JSON form.
+    """
+    payload: Dict[str, Any] = {}
+    paragraphs: List[Dict[str, Any]] = []
+    tables: List[Dict[str, Any]] = []
+    images: List[Dict[str, Any]] = []
+    page_break = False
+    number = 0
+    for kind, data in _md_blocks(text):
+        if kind == "meta":
+            payload.update(data)
+            margins = payload.get("margins_inches")
+            if isinstance(margins, (int, float)):
+                payload["margins_inches"] = dict.fromkeys(("left", "right", "top", "bottom"), margins)
+            continue
+        if kind == "break":
+            page_break = True
+            continue
+        if kind == "table":
+            rows, header = data
+            tables.append({"rows": rows, "header": header})
+            continue
+        if kind == "image":
+            images.append(_md_image(*data))
+            continue
+        if kind == "code":
+            para: Dict[str, Any] = {"text": data[1], "kind": "preformatted"}
+        elif kind == "heading":
+            level, body, attrs = data
+            para = {
+                "text": _md_inline(body),
+                "bold": True,
+                "font_size_pt": _MD_HEADING_PT[level],
+                "style": f"Heading {level}",
+            }
+            para.update(_md_paragraph_fields(attrs))
+        elif kind == "item":
+            ordered, body, attrs = data
+            number = number + 1 if ordered else 0
+            para = {"text": f"{number}. " if ordered else "• "}
+            para["text"] += _md_inline(body)
+            para.update(_md_paragraph_fields(attrs))
+        else:
+            body, attrs = data
+            para = {"text": _md_inline(body)}
+            para.update(_md_paragraph_fields(attrs))
+        if kind != "item":
+            number = 0
+        if page_break:
+            para["page_break_before"] = True
+            page_break = False
+        paragraphs.append(para)
+    for key, blocks in (("paragraphs", paragraphs), ("tables", tables), ("images", images)):
+        if blocks:
+            payload[key] = blocks
+    return payload
+
+
+# ----------------------------
+# Draft previews (preview -> commit)
+# ----------------------------
+
+# operation='preview' stages the validated instruction tree (and, for modify, the
+# _SOURCES key of the source) here; operation='commit' renders it from the ID alone, so
+# the model never has to emit the full payload twice.
+_PREVIEWS = _TTLCache(maxsize=64, ttl=3600)
+
+_PREVIEW_CELL = 'style="border:1px solid #e5e7eb; padding:4px 6px;"'
+
+
+def _preview_html(instr: PdfInstructions, limit: int) -> str:
+    """Lightweight HTML draft straight from the validated instructions (no rendering)."""
+    esc = html.escape
+    parts = [
+        '<section data-doc="pdf" style="font-family: Helvetica, Arial, sans-serif; '
+        'line-height:1.5; max-width:800px; margin:auto;">'
+    ]
+    if instr.header_text:
+        parts.append(
+            f'<header style="color:#6b7280; border-bottom:1px solid #e5e7eb;">{esc(instr.header_text)}</header>'
+        )
+    if instr.watermark_text:
+        parts.append(f'<p style="color:#d1d5db;">[Watermark: {esc(instr.watermark_text)}]</p>')
+    for p in instr.paragraphs[:limit]:
+        if p.page_break_before:
+            parts.append('<hr style="border-top:2px dashed #d1d5db;">')
+        text = esc(p.text)
+        if p.bold:
+            text = f"<b>{text}</b>"
+        if p.italic:
+            text = f"<i>{text}</i>"
+        style = f"text-align:{p.align or 'left'};"
+        if p.font_size_pt:
+            style += f" font-size:{p.font_size_pt}pt;"
+        if p.kind == "preformatted":
+            parts.append(f'<pre style="{style}">{text}</pre>')
+        else:
+            parts.append(f'<p style="{style}">{text}</p>')
+    if len(instr.paragraphs) > limit:
+        parts.append(f"<p><em>… {len(instr.paragraphs) - limit} more paragraphs</em></p>")
+    for im in instr.images:
+        parts.append(f"<figure>[Image: {esc(im.name or im.asset_id or 'embedded')}]</figure>")
+    for t in instr.tables:
+        parts.append('<table style="border-collapse:collapse; width:100%; margin:.5em 0;">')
+        for row in t.rows[:limit]:
+            cells = "".join(
+                f"<td {_PREVIEW_CELL}>{esc('' if v is None else str(v))}</td>" for v in row
+            )
+            parts.append(f"<tr>{cells}</tr>")
+        parts.append("</table>")
+        if len(t.rows) > limit:
+            parts.append(f"<p><em>… {len(t.rows) - limit} more rows</em></p>")
+    footer = [esc(instr.footer_text)] if instr.footer_text else []
+    if instr.show_page_numbers:
+        footer.append("Page 1 of N" if instr.show_total_pages else "Page 1")
+    if footer:
+        parts.append(
+            '<footer style="color:#6b7280; font-size:12px; border-top:1px solid #e5e7eb;">'
+            + " — ".join(footer)
+            + "</footer>"
+        )
+    parts.append("</section>")
+    return "".join(parts)
+
+
+def _read_source_file(
+    files: List[Dict[str, Any]],
+    hint: Optional[str],
+    source_path: Optional[str],
+    allow_server_paths: bool,
+) -> bytes:
+    """Bytes of the PDF to modify, from the attachments or (admin) a server path."""
+    existing_bytes: Optional[bytes] = None
+    pick = _find_attached_file(".pdf", files, hint)
+    if pick:
+        _, existing_bytes = pick
+
+    if not existing_bytes and source_path:
+        if allow_server_paths and os.path.isfile(source_path):
+            with open(source_path, "rb") as fh:
+                existing_bytes = fh.read()
+        else:
+            raise PermissionError(
+                "Server path access is disabled. Attach the file to the chat or enable allow_server_paths."
+            )
+    if not existing_bytes:
+        raise FileNotFoundError(
+            "No existing .pdf file found to modify. Attach a file or provide a valid source_path."
+        )
+    return existing_bytes
+
+
+# ----------------------------
+# Source documents (repeated modify)
+# ----------------------------
+
+
+class _SourceCache:
+    """
+    Source PDFs of 'modify' (and 'inspect'/'preview') calls, per user and chat, keyed by
+    content hash, so a chat that modifies the same attachment, or its own previous
+    output, several times decodes and parses it once.
+
+    Attachments and generated files are also indexed by file_id; such a hit skips the
+    base64 decode or disk read. Entries are evicted least-recently-used once their
+    estimated memory (bytes plus parsed reader) exceeds max_bytes. The PdfReader is only
+    ever read from (PdfWriter.add_page clones pages), so every checkout shares it.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._file_ids: Dict[Tuple[str, str], str] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def configure(self, max_bytes: int) -> None:
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._entries and self._size > max(self.max_bytes, 0):
+            (scope, digest), entry = self._entries.popitem(last=False)
+            self._size -= entry["cost"]
+            for file_id in entry["file_ids"]:
+                if self._file_ids.get((scope, file_id)) == digest:
+                    del self._file_ids[(scope, file_id)]
+
+    def add(self, scope: str, data: bytes, file_id: Optional[str] = None) -> str:
+        """Remember data (and its file_id) for this scope; returns the content hash."""
+        digest = hashlib.sha256(data).hexdigest()
+        if self.max_bytes <= 0:
+            return digest
+        with self._lock:
+            key = (scope, digest)
+            if key not in self._entries:
+                self._entries[key] = {
+                    "data": data,
+                    "parsed": None,
+                    "cost": len(data),
+                    "file_ids": set(),  # attachment/output ids mapped to this entry
+                }
+                self._size += len(data)
+            self._entries.move_to_end(key)
+            if file_id:
+                self._file_ids[(scope, file_id)] = digest
+                self._entries[key]["file_ids"].add(file_id)
+            self._evict()
+        return digest
+
+    def data(self, scope: str, digest: str) -> Optional[bytes]:
+        """Bytes of the source with this content hash in this scope, if still cached."""
+        with self._lock:
+            entry = self._entries.get((scope, digest))
+            if entry is None:
+                return None
+            self._entries.move_to_end((scope, digest))
+            return entry["data"]
+
+    def lookup(self, scope: str, file_id: str) -> Optional[Tuple[str, bytes]]:
+        """(content hash, bytes) of a file seen earlier in this scope, if still cached."""
+        with self._lock:
+            digest = self._file_ids.get((scope, file_id))
+            entry = self._entries.get((scope, digest)) if digest else None
+            if entry is None:
+                self._file_ids.pop((scope, file_id), None)
+                return None
+            self._entries.move_to_end((scope, digest))
+            return digest, entry["data"]
+
+    def reader(self, scope: str, digest: str) -> Optional[PdfReader]:
+        """The shared reader of a cached source, parsed on first use (None if evicted)."""
+        with self._lock:
+            entry = self._entries.get((scope, digest))
+            if entry is not None and entry["parsed"] is not None:
+                self.hits += 1
+                self._entries.move_to_end((scope, digest))
+                return entry["parsed"]
+        if entry is None:
+            return None
+        self.misses += 1
+        reader = PdfReader(io.BytesIO(entry["data"]))
+        with self._lock:
+            if self._entries.get((scope, digest)) is entry and entry["parsed"] is None:
+                entry["parsed"] = reader
+                # Resolved objects end up roughly as large as the file itself.
+                entry["cost"] += len(entry["data"])
+                self._size += len(entry["data"])
+                self._evict()
+        return reader
+
+
+_SOURCES = _SourceCache()
+
+
+def _source_document(
+    scope: str,
+    files: List[Dict[str, Any]],
+    hint: Optional[str],
+    source_path: Optional[str],
+    allow_server_paths: bool,
+    base_file_id: Optional[str] = None,
+) -> Tuple[str, bytes]:
+    """
+    (content hash, bytes) of the source PDF: an earlier result of this chat by
+    base_file_id, an attachment already seen in this chat, or a freshly read one.
+    """
+    if base_file_id:
+        found = _SOURCES.lookup(scope, base_file_id)
+        if found is None:
+            raise FileNotFoundError(
+                "Unknown or expired base_file_id for this chat. Attach the PDF to modify instead."
+            )
+        return found
+    pick = _pick_attached_file(
+        ".pdf", files, hint, lambda file_id: (_SOURCES.lookup(scope, file_id) or (None, None))[1]
+    )
+    if pick is None:
+        data = _read_source_file(files, hint, source_path, allow_server_paths)
+        return _SOURCES.add(scope, data), data
+    file_id, _, data = pick
+    found = _SOURCES.lookup(scope, file_id) if file_id else None
+    if found is not None and found[1] is data:
+        return found
+    return _SOURCES.add(scope, data, file_id), data
+
+
+# ----------------------------
+# Inspect (structural summary)
+# ----------------------------
+
+# Summaries keyed by (content hash, item limit). The same bytes always give the same
+# summary, so re-inspecting a re-attached file costs one hash instead of a parse.
+_INSPECTIONS = _TTLCache(maxsize=128, ttl=3600)
+
+_NAMED_PAGE_SIZES = {
+    (612, 792): "Letter",
+    (612, 1008): "Legal",
+    (792, 1224): "Tabloid",
+    (595, 842): "A4",
+    (420, 595): "A5",
+    (842, 1191): "A3",
+}
+
+
+def _size_label(data: bytes) -> str:
+    return f"{len(data) / 1e6:.2f} MB" if len(data) >= 1e6 else f"{len(data) / 1e3:.0f} KB"
+
+
+def _page_size_label(width: float, height: float) -> str:
+    w, h = round(width), round(height)
+    name = _NAMED_PAGE_SIZES.get((min(w, h), max(w, h)))
+    if name and w > h:
+        name += ", landscape"
+    return f"{w}×{h} pt ({name})" if name else f"{w}×{h} pt"
+
+
+def _outline_lines(
+    reader: PdfReader, items: List[Any], depth: int, lines: List[str], limit: int
+) -> int:
+    """Append indented outline entries (up to limit lines); return the number of entries."""
+    count = 0
+    for item in items:
+        if isinstance(item, list):
+            count += _outline_lines(reader, item, depth + 1, lines, limit)
+            continue
+        count += 1
+        if len(lines) < limit:
+            try:
+                number = reader.get_destination_page_number(item)
+            except Exception:
+                number = None
+            page = f" (p. {number + 1})" if number is not None and number >= 0 else ""
+            lines.append(f"{'  ' * depth}- {item.title}{page}")
+    return count
+
+
+def _inspect_pdf(data: bytes, limit: int) -> str:
+    """
+    Page count, page sizes, metadata, form fields and outline of a PDF. pypdf resolves
+    the xref and the page tree only; no content stream is decoded.
+    """
+    reader = PdfReader(io.BytesIO(data))
+    if reader.is_encrypted and not reader.decrypt(""):
+        return f"PDF, encrypted (password required), {_size_label(data)}"
+
+    sizes: Dict[str, int] = {}
+    for page in reader.pages:
+        box = page.mediabox
+        width, height = float(box.width), float(box.height)
+        if int(page.get("/Rotate", 0) or 0) % 180:
+            width, height = height, width
+        label = _page_size_label(width, height)
+        sizes[label] = sizes.get(label, 0) + 1
+
+    version = (reader.pdf_header or "").lstrip("%").replace("-", " ")
+    lines = [f"{version or 'PDF'}, {len(reader.pages)} pages, {_size_label(data)}"]
+    if len(sizes) == 1:
+        lines.append(f"Page size: {next(iter(sizes))}")
+    else:
+        common = sorted(sizes.items(), key=lambda kv: -kv[1])
+        lines.append("Page sizes: " + "; ".join(f"{label} ×{n}" for label, n in common[:4]))
+
+    meta = reader.metadata or {}
+    facts = [
+        f"{key}: {str(meta.get(f'/{key}')).strip()}"
+        for key in ("Title", "Author", "Subject")
+        if meta.get(f"/{key}") and str(meta.get(f"/{key}")).strip()
+    ]
+    if facts:
+        lines.append("; ".join(facts))
+
+    acro = reader.trailer["/Root"].get("/AcroForm")
+    fields = acro.get_object().get("/Fields") if acro is not None else None
+    if fields:
+        lines.append(f"Form fields: {len(fields)}")
+
+    try:
+        outline = reader.outline
+    except Exception:
+        outline = []
+    entries: List[str] = []
+    total = _outline_lines(reader, outline, 0, entries, limit)
+    if total:
+        lines.append(f"Outline ({total} entries):")
+        lines.extend(entries)
+        if total > len(entries):
+            lines.append(f"… {total - len(entries)} more entries")
+    else:
+        lines.append("Outline: none")
+    return "\n".join(lines)
+
+
+# ----------------------------
+# Revisions (JSON-Patch deltas)
+# ----------------------------
+
+# Validated instruction tree of every generated file (and the _SOURCES key of the file
+# it modified), keyed by its file_id, so that operation='revise' can apply a small patch
+# instead of receiving the whole payload again.
+_GENERATIONS = _TTLCache(maxsize=128, ttl=3600)
+
+# Rendered sections (see _render_sections), keyed by their content hash. A revision
+# that edits one chapter re-lays-out only that chapter.
+_SECTIONS = _TTLCache(maxsize=256, ttl=3600)
+
+def _pointer_tokens(path: str) -> List[str]:
+    if not path.startswith("/"):
+        raise ValueError(f"Invalid patch path {path!r}: paths start with '/'.")
+    return [t.replace("~1", "/").replace("~0", "~") for t in path[1:].split("/")]
+
+
+def _pointer_child(node: Any, token: str, path: str) -> Any:
+    if isinstance(node, dict) and token in node:
+        return node[token]
+    if isinstance(node, list) and token.isdigit() and int(token) < len(node):
+        return node[int(token)]
+    raise ValueError(f"Patch path {path!r} does not exist in the document.")
+
+
+def _apply_json_patch(doc: Dict[str, Any], patch: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Apply an RFC 6902 subset (add, remove, replace, test) to a copy of `doc`.
+    "-" as the last token of an 'add' path appends to a list.
+    """
+    doc = copy.deepcopy(doc)
+    for n, op in enumerate(patch, 1):
+        kind, path = op.get("op"), op.get("path")
+        if kind not in ("add", "remove", "replace", "test") or not isinstance(path, str):
+            raise ValueError(f"Patch op {n}: needs 'op' (add/remove/replace/test) and a 'path'.")
+        if kind != "remove" and "value" not in op:
+            raise ValueError(f"Patch op {n} ({kind} {path}): missing 'value'.")
+        tokens = _pointer_tokens(path)
+        if not tokens or tokens == [""]:
+            raise ValueError(f"Patch op {n}: the document root cannot be patched.")
+        parent: Any = doc
+        for token in tokens[:-1]:
+            parent = _pointer_child(parent, token, path)
+        last = tokens[-1]
+        if kind == "test":
+            if _pointer_child(parent, last, path) != op["value"]:
+                raise ValueError(f"Patch op {n}: test failed at {path!r}.")
+        elif isinstance(parent, list):
+            if kind == "add" and last == "-":
+                parent.append(op["value"])
+            elif kind == "add" and last.isdigit() and int(last) <= len(parent):
+                parent.insert(int(last), op["value"])
+            else:
+                _pointer_child(parent, last, path)
+                if kind == "remove":
+                    del parent[int(last)]
+                else:
+                    parent[int(last)] = op["value"]
+        elif isinstance(parent, dict):
+            if kind != "add":
+                _pointer_child(parent, last, path)
+            if kind == "remove":
+                del parent[last]
+            else:
+                parent[last] = op["value"]
+        else:
+            raise ValueError(f"Patch path {path!r} does not exist in the document.")
+    return doc
+
+
+# ----------------------------
+# Mail merge (one template x N records)
+# ----------------------------
+
+_MERGE_FIELD_RE = re.compile(r"\{\{\s*([^{}]+?)\s*\}\}")
+_MERGE_RECORD_EXTS = (".csv", ".jsonl", ".json")
+
+
+def _merge_plan(node: Any, mode: Optional[str] = None) -> Optional[Tuple[str, Any]]:
+    """
+    Where a validated template holds {{field}} placeholders, or None if nowhere. Per
+    record only the nodes on a path to a placeholder are copied; the rest is shared.
+    Text of markup paragraphs gets its values XML-escaped ('markup' mode).
+    """
+    if isinstance(node, str):
+        pieces = _MERGE_FIELD_RE.split(node)
+        return ("s", (pieces, mode)) if len(pieces) > 1 else None
+    if isinstance(node, BaseModel):
+        markup = isinstance(node, ParagraphSpec) and node.kind == "markup"
+        kind, children = "m", {
+            name: _merge_plan(getattr(node, name), "markup" if markup and name == "text" else None)
+            for name in type(node).model_fields
+        }
+    elif isinstance(node, list):
+        kind, children = "l", {i: _merge_plan(v, mode) for i, v in enumerate(node)}
+    elif isinstance(node, dict):
+        kind, children = "d", {k: _merge_plan(v, mode) for k, v in node.items()}
+    else:
+        return None
+    children = {k: v for k, v in children.items() if v is not None}
+    return (kind, children) if children else None
+
+
+def _merge_fields(plan: Tuple[str, Any]) -> Set[str]:
+    kind, spec = plan
+    if kind == "s":
+        return set(spec[0][1::2])
+    return set().union(*(_merge_fields(sub) for sub in spec.values()))
+
+
+def _merge_apply(node: Any, plan: Tuple[str, Any], record: Dict[str, str]) -> Any:
+    kind, spec = plan
+    if kind == "s":
+        pieces, mode = spec
+        out = list(pieces)
+        for i in range(1, len(out), 2):
+            value = record[out[i]]
+            out[i] = html.escape(value, quote=False) if mode == "markup" else value
+        return "".join(out)
+    if kind == "m":
+        return node.model_copy(
+            update={name: _merge_apply(getattr(node, name), sub, record) for name, sub in spec.items()}
+        )
+    out = list(node) if kind == "l" else dict(node)
+    for key, sub in spec.items():
+        out[key] = _merge_apply(node[key], sub, record)
+    return out
+
+
+def _parse_records(name: str, data: bytes) -> List[Dict[str, str]]:
+    """CSV (header row; delimiter sniffed), JSON Lines or a JSON array of objects."""
+    text = data.decode("utf-8-sig")
+    lower = name.lower()
+    if lower.endswith(".csv"):
+        try:
+            dialect: Any = csv.Sniffer().sniff(text[:4096], delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        rows: List[Any] = list(csv.DictReader(io.StringIO(text), dialect=dialect))
+    elif lower.endswith(".json"):
+        rows = json.loads(text)
+        if not isinstance(rows, list):
+            raise ValueError(f"{name}: expected a JSON array of records.")
+    else:
+        rows = []
+        for lineno, line in enumerate(text.splitlines(), 1):
+            if line.strip():
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError as exc:
+                    raise ValueError(f"{name} line {lineno}: {exc}") from None
+    return _normalize_records(rows)
+
+
+def _normalize_records(rows: List[Any]) -> List[Dict[str, str]]:
+    out: List[Dict[str, str]] = []
+    for n, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            raise ValueError(f"Record {n} is not an object of field -> value.")
+        out.append(
+            {str(k): "" if v is None else str(v) for k, v in row.items() if k is not None}
+        )
+    return out
+
+
+def _load_merge_records(
+    records: Optional[List[Dict[str, Any]]],
+    files: List[Dict[str, Any]],
+    hint: Optional[str],
+) -> List[Dict[str, str]]:
+    if records:
+        return _normalize_records(records)
+    for ext in _MERGE_RECORD_EXTS:
+        if hint and not hint.lower().endswith(ext):
+            continue
+        pick = _find_attached_file(ext, files, hint)
+        if pick:
+            return _parse_records(*pick)
+    raise FileNotFoundError(
+        "No merge records found. Attach a .csv/.jsonl file or pass `records`."
+    )
+
+
+def _merge_instructions(
+    template: PdfInstructions, records: List[Dict[str, str]]
+) -> List[PdfInstructions]:
+    """
+    One PdfInstructions per record from a template validated once. {{_n}} is the
+    1-based record number.
+    """
+    plan = _merge_plan(template)
+    fields = _merge_fields(plan) if plan else set()
+    out: List[PdfInstructions] = []
+    for n, record in enumerate(records, 1):
+        record = dict(record, _n=str(n))
+        missing = fields - record.keys()
+        if missing:
+            raise ValueError(f"Merge record {n} has no value for {sorted(missing)}.")
+        out.append(_merge_apply(template, plan, record) if plan else template)
+    return out
+
+
+def _merge_names(
+    records: List[Dict[str, str]], pattern: Optional[str], basename: str, ext: str
+) -> List[str]:
+    """Unique, filesystem-safe entry names for a merge ZIP."""
+    names: List[str] = []
+    seen: Set[str] = set()
+    width = max(4, len(str(len(records))))
+    for n, record in enumerate(records, 1):
+        stem = f"{basename}-{n:0{width}d}"
+        if pattern:
+            filled = _MERGE_FIELD_RE.sub(
+                lambda m: record.get(m.group(1), str(n) if m.group(1) == "_n" else ""), pattern
+            )
+            filled = "".join(ch for ch in filled if ch.isalnum() or ch in "-_ .")
+            stem = " ".join(filled.split()).strip(" .") or stem
+        name = f"{stem}{ext}"
+        if name in seen:
+            name = f"{stem}-{n}{ext}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def _zip_outputs(entries: List[Tuple[str, bytes]]) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        for name, data in entries:
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+def _render_records(instrs: List[PdfInstructions], workers: int) -> List[bytes]:
+    """Render merge records, in worker processes when workers > 1 (as sections)."""
+    rendered = (
+        _WORKERS.map(_render_serial, instrs, min(workers, len(instrs))) if len(instrs) > 1 else None
+    )
+    if rendered is None:
+        rendered = [_render_serial(instr) for instr in instrs]
+    return rendered
+
+
+def _concat_pdfs(parts: List[bytes]) -> bytes:
+    writer = PdfWriter(clone_from=PdfReader(io.BytesIO(parts[0])))
+    for part in parts[1:]:
+        writer.append(PdfReader(io.BytesIO(part)))
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+# ----------------------------
+# Page assembly (combine / split / extract)
+# ----------------------------
+
+_PAGE_OPERATIONS = ("combine", "split", "extract")
+# Attributes a page may inherit from its /Pages ancestors (ISO 32000-1, 7.7.3.4).
+_INHERITED_PAGE_KEYS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+_PAGE_RANGE_RE = re.compile(r"^\s*(\d+)\s*(?:(-)\s*(\d+)?)?\s*$")
+# Parsed objects a source reader may hold before its cache is dropped. Pages already
+# copied never need them again; shared fonts/images are tracked by object number.
+_READER_CACHE_LIMIT = 4096
+
+
+def _page_ranges(spec: str, total: int) -> List[Tuple[int, int]]:
+    """'1-5, 8, 10-' -> [(0, 5), (7, 8), (9, total)]: 0-based, end exclusive."""
+    ranges: List[Tuple[int, int]] = []
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        m = _PAGE_RANGE_RE.match(part)
+        if not m:
+            raise ValueError(f"Invalid page range {part.strip()!r}; use e.g. '1-5, 8, 10-'.")
+        first = int(m.group(1))
+        last = int(m.group(3)) if m.group(3) else (total if m.group(2) else first)
+        if not 1 <= first <= last <= total:
+            raise ValueError(f"Page range {part.strip()!r} is outside 1-{total}.")
+        ranges.append((first - 1, last))
+    if not ranges:
+        raise ValueError("'pages' names no pages.")
+    return ranges
+
+
+def _inherited(page: DictionaryObject, key: str) -> Any:
+    node = page.get("/Parent")
+    for _ in range(64):  # guard against cyclic page trees
+        if node is None:
+            return None
+        node = node.get_object()
+        if key in node:
+            return node.raw_get(key)
+        node = node.get("/Parent")
+    return None
+
+
+class _PdfStreamWriter:
+    """
+    Writes a PDF page by page. Each page's object graph is copied from its PdfReader
+    straight to `out` (stream data verbatim, never decoded or re-compressed), so only
+    the xref offsets and the page list stay in memory. Objects shared by pages of one
+    source (fonts, images) are written once; links to pages that are not copied
+    become null. `out` only needs write().
+    """
+
+    def __init__(self, out: Any) -> None:
+        self._out = out
+        self._pos = 0
+        self._offsets: List[int] = [0, 0]  # 1: catalog, 2: page tree (written by close)
+        self._kids: List[int] = []
+        self._bookmarks: List[Tuple[str, int]] = []
+        # Object numbers of the current source's objects; reset when the source changes.
+        self._reader: Optional[PdfReader] = None
+        self._refs: Dict[Tuple[int, int], int] = {}
+        self._write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    @property
+    def page_count(self) -> int:
+        return len(self._kids)
+
+    def _write(self, data: bytes) -> None:
+        self._out.write(data)
+        self._pos += len(data)
+
+    def _reserve(self) -> int:
+        self._offsets.append(0)
+        return len(self._offsets)
+
+    def _write_object(self, num: int, obj: Any) -> None:
+        self._offsets[num - 1] = self._pos
+        buf = io.BytesIO()
+        buf.write(b"%d 0 obj\n" % num)
+        obj.write_to_stream(buf)
+        buf.write(b"\nendobj\n")
+        self._write(buf.getvalue())
+
+    def _copy(self, obj: Any, refs: Dict[Tuple[int, int], int], queue: List[Tuple[Any, int]]) -> Any:
+        """obj with every reference renumbered; referenced objects are queued for writing."""
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            num = refs.get(key)
+            if num is None:
+                target = obj.get_object()
+                if isinstance(target, DictionaryObject) and target.get("/Type") in ("/Page", "/Pages"):
+                    return NullObject()
+                num = refs[key] = self._reserve()
+                queue.append((target, num))
+            return IndirectObject(num, 0, None)
+        if isinstance(obj, StreamObject):
+            out = StreamObject()
+            out._data = obj._data  # still encoded; /Filter is copied below
+            for key, value in obj.items():
+                if key != "/Length":
+                    out[NameObject(key)] = self._copy(value, refs, queue)
+            return out
+        if isinstance(obj, DictionaryObject):
+            out = DictionaryObject()
+            for key, value in obj.items():
+                out[NameObject(key)] = self._copy(value, refs, queue)
+            return out
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self._copy(value, refs, queue) for value in obj)
+        return obj
+
+    def add_pages(
+        self, reader: PdfReader, indexes: Iterable[int], bookmark: Optional[str] = None
+    ) -> None:
+        """
+        Copy reader's pages at `indexes` (0-based, in order), optionally bookmarked.
+        Links to pages outside this call (or an earlier one on the same reader) become null.
+        """
+        if reader is not self._reader:
+            self._reader, self._refs = reader, {}
+        refs = self._refs
+        pages = [reader.pages[i] for i in indexes]
+        nums = [self._reserve() for _ in pages]
+        for page, num in zip(pages, nums):
+            if page.indirect_reference is not None:
+                ref = page.indirect_reference
+                refs.setdefault((ref.idnum, ref.generation), num)
+        if bookmark and nums:
+            self._bookmarks.append((bookmark, nums[0]))
+
+        for page, num in zip(pages, nums):
+            queue: List[Tuple[Any, int]] = []
+            copied = DictionaryObject()
+            for key, value in page.items():
+                if key != "/Parent":
+                    copied[NameObject(key)] = self._copy(value, refs, queue)
+            for key in _INHERITED_PAGE_KEYS:
+                if key not in page:
+                    value = _inherited(page, key)
+                    if value is not None:
+                        copied[NameObject(key)] = self._copy(value, refs, queue)
+            copied[NameObject("/Parent")] = IndirectObject(2, 0, None)
+            self._write_object(num, copied)
+            while queue:
+                obj, obj_num = queue.pop()
+                self._write_object(obj_num, self._copy(obj, refs, queue))
+            self._kids.append(num)
+            if len(reader.resolved_objects) > _READER_CACHE_LIMIT:
+                reader.resolved_objects.clear()
+
+    def close(self) -> None:
+        """Write the page tree, bookmarks, catalog and cross-reference table."""
+        catalog = DictionaryObject(
+            {
+                NameObject("/Type"): NameObject("/Catalog"),
+                NameObject("/Pages"): IndirectObject(2, 0, None),
+            }
+        )
+        if self._bookmarks:
+            root = self._reserve()
+            items = [self._reserve() for _ in self._bookmarks]
+            for i, ((title, page), num) in enumerate(zip(self._bookmarks, items)):
+                item = DictionaryObject(
+                    {
+                        NameObject("/Title"): TextStringObject(title),
+                        NameObject("/Parent"): IndirectObject(root, 0, None),
+                        NameObject("/Dest"): ArrayObject(
+                            [IndirectObject(page, 0, None), NameObject("/Fit")]
+                        ),
+                    }
+                )
+                if i > 0:
+                    item[NameObject("/Prev")] = IndirectObject(items[i - 1], 0, None)
+                if i + 1 < len(items):
+                    item[NameObject("/Next")] = IndirectObject(items[i + 1], 0, None)
+                self._write_object(num, item)
+            self._write_object(
+                root,
+                DictionaryObject(
+                    {
+                        NameObject("/Type"): NameObject("/Outlines"),
+                        NameObject("/First"): IndirectObject(items[0], 0, None),
+                        NameObject("/Last"): IndirectObject(items[-1], 0, None),
+                        NameObject("/Count"): NumberObject(len(items)),
+                    }
+                ),
+            )
+            catalog[NameObject("/Outlines")] = IndirectObject(root, 0, None)
+            catalog[NameObject("/PageMode")] = NameObject("/UseOutlines")
+        self._write_object(
+            2,
+            DictionaryObject(
+                {
+                    NameObject("/Type"): NameObject("/Pages"),
+                    NameObject("/Kids"): ArrayObject(
+                        IndirectObject(num, 0, None) for num in self._kids
+                    ),
+                    NameObject("/Count"): NumberObject(len(self._kids)),
+                }
+            ),
+        )
+        self._write_object(1, catalog)
+
+        xref = self._pos
+        size = len(self._offsets) + 1
+        self._write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        self._write(b"".join(b"%010d 00000 n \n" % offset for offset in self._offsets))
+        self._write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref))
+
+
+def _open_source_pdf(data: bytes, name: str) -> PdfReader:
+    reader = PdfReader(io.BytesIO(data))
+    if reader.is_encrypted and not reader.decrypt(""):
+        raise PermissionError(f"{name} is password-protected; remove the password first.")
+    return reader
+
+
+def _combine_inputs(files: List[Dict[str, Any]], names: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """Attached PDFs to combine: those named (in that order), else all in attachment order."""
+    pdfs = [
+        f for f in files if (f.get("name") or f.get("filename") or "").lower().endswith(".pdf")
+    ]
+    if not names:
+        if not pdfs:
+            raise FileNotFoundError("No attached PDF files to combine.")
+        return pdfs
+    by_name = {(f.get("name") or f.get("filename")).lower(): f for f in pdfs}
+    missing = [n for n in names if n.lower() not in by_name]
+    if missing:
+        raise FileNotFoundError(f"Not attached: {', '.join(missing)}.")
+    return [by_name[n.lower()] for n in names]
+
+
+def _combine_pdfs(files: List[Dict[str, Any]]) -> Tuple[bytes, int]:
+    """
+    Concatenate the attached PDFs with one bookmark per source file. Sources are
+    decoded and parsed one at a time, so memory holds one input plus the output.
+    """
+    out = io.BytesIO()
+    writer = _PdfStreamWriter(out)
+    for f in files:
+        found = _find_attached_file(".pdf", [f])
+        if found is None:
+            raise FileNotFoundError(f"Could not read {f.get('name') or f.get('filename')}.")
+        name, data = found
+        reader = _open_source_pdf(data, name)
+        writer.add_pages(reader, range(len(reader.pages)), bookmark=os.path.splitext(name)[0])
+        del found, data, reader
+    writer.close()
+    return out.getvalue(), writer.page_count
+
+
+def _extract_pages(data: bytes, spec: str) -> Tuple[bytes, int]:
+    """One PDF with the pages named by `spec` ('40-60', '1-5, 8'), in that order."""
+    reader = _open_source_pdf(data, "The source PDF")
+    out = io.BytesIO()
+    writer = _PdfStreamWriter(out)
+    ranges = _page_ranges(spec, len(reader.pages))
+    writer.add_pages(reader, [i for start, end in ranges for i in range(start, end)])
+    writer.close()
+    return out.getvalue(), writer.page_count
+
+
+def _split_pdf(
+    data: bytes, spec: Optional[str], every: Optional[int], stem: str
+) -> Tuple[bytes, int]:
+    """
+    A ZIP of parts: one per range of `spec`, or consecutive runs of `every` pages.
+    Each part is written straight into its ZIP entry.
+    """
+    reader = _open_source_pdf(data, "The source PDF")
+    total = len(reader.pages)
+    if every:
+        ranges = [(start, min(start + every, total)) for start in range(0, total, every)]
+    elif spec:
+        ranges = _page_ranges(spec, total)
+    else:
+        raise ValueError("operation='split' needs 'split_every' or 'pages' (one part per range).")
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        for start, end in ranges:
+            label = f"p{start + 1}" if end - start == 1 else f"p{start + 1}-{end}"
+            with zf.open(f"{stem}-{label}.pdf", "w", force_zip64=True) as entry:
+                writer = _PdfStreamWriter(entry)
+                writer.add_pages(reader, range(start, end))
+                writer.close()
+    return buf.getvalue(), len(ranges)
+
+
+# ----------------------------
+# Headless rendering
+# ----------------------------
+
+
+def _render_document(
+    file_type: str,
+    payload: Union[Dict[str, Any], str],
+    existing: Optional[bytes] = None,
+    workers: int = 1,
+) -> bytes:
+    """
+    Instructions (a PdfInstructions dict, or compact Markdown) to PDF bytes without
+    Open WebUI; with `existing`, the new pages are appended as in 'modify'. Images
+    must be inline b64 or asset_id. This is the entry point of bulk_runner.py.
+    """
+    if file_type != "pdf":
+        raise ValueError(f"pdf_document_tool renders 'pdf', not {file_type!r}.")
+    if isinstance(payload, str):
+        payload = _markdown_to_payload(payload)
+    instr = PdfInstructions(**payload)
+    _preload_fonts(instr)
+    if existing is not None:
+        return _modify_pdf(existing, instr, workers)
+    return _create_pdf(instr, workers)
+
+
+# ----------------------------
+# File Upload Helper (FIXED - correct FileForm structure with tags)
+# ----------------------------
+
+
+def _upload_generated_file(
+    file_bytes: bytes,
+    filename: str,
+    content_type: str,
+    user_id: str,
+    user_email: str,
+    user_name: str,
+) -> str:
+    """
+    Upload a generated file using Open WebUI's Storage provider and Files model.
+    Returns the file ID for use in event emitter and URLs.
+
+    This matches the exact structure used in open_webui/routers/files.py
+    """
+    if Storage is None:
+        raise RuntimeError("Open WebUI is not installed; nothing to upload to.")
+
+    # Generate unique file ID
+    file_id = str(uuid.uuid4())
+
+    # Create a unique storage filename to avoid collisions (matches router pattern)
+    safe_filename = f"{file_id}_{filename}"
+
+    # Build the tags dictionary (REQUIRED for S3StorageProvider)
+    tags = {
+        "OpenWebUI-User-Email": user_email,
+        "OpenWebUI-User-Id": user_id,
+        "OpenWebUI-User-Name": user_name,
+        "OpenWebUI-File-Id": file_id,
+    }
 
     # Upload to configured storage backend (local filesystem or S3)
     file_stream = io.BytesIO(file_bytes)
@@ -647,6 +3185,19 @@ def _upload_generated_file(
     return new_file.id
 
 
+# Storage providers and the Files model are synchronous (disk, S3, DB). Run them on a
+# small dedicated pool so a slow upload never stalls the event loop, and a burst of
+# large uploads cannot exhaust the loop's default executor.
+_UPLOAD_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="doc-upload")
+
+
+async def _run_blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _UPLOAD_EXECUTOR, functools.partial(fn, *args, **kwargs)
+    )
+
+
 # ----------------------------
 # Main Tools class
 # ----------------------------
@@ -678,11 +3229,85 @@ class Tools:
             default=700,
             description="Minimal delay to keep status visible (milliseconds).",
         )
+        template_dir: str = Field(
+            default="",
+            description="Server directory of admin-provided letterhead PDFs, referenced by template_id.",
+        )
+        asset_dir: str = Field(
+            default="",
+            description="Server directory of shared images (logos, signatures), referenced by ImageSpec.asset_id.",
+        )
+        asset_cache_size: int = Field(
+            default=64,
+            description="Decoded/resized asset variants kept in memory (LRU).",
+        )
+        font_dir: str = Field(
+            default="",
+            description="Server directory of TTF/OTF fonts (e.g. Inter-Regular.ttf, Inter-Bold.ttf). Families load on first use; no attachments needed.",
+        )
+        linearize: bool = Field(
+            default=False,
+            description="Linearize output PDFs ('fast web view') so viewers show page 1 before the download completes. Needs pikepdf or qpdf.",
+        )
+        render_workers: int = Field(
+            default=1,
+            description="Worker processes for long PDFs split by page_break_before paragraphs, for 'merge' records and for the DOCX of output_formats=['pdf','docx'] (1 = render serially).",
+        )
+        merge_max_records: int = Field(
+            default=5000,
+            description="Maximum number of records one 'merge' call may render.",
+        )
+        preview_max_items: int = Field(
+            default=50,
+            description="Paragraphs/rows shown in 'preview' drafts.",
+        )
+        inspect_max_items: int = Field(
+            default=40,
+            description="Outline entries listed by 'inspect'.",
+        )
+        inspect_cache_size: int = Field(
+            default=128,
+            description="Inspected documents whose summary is kept in memory (by content hash).",
+        )
+        preview_ttl_s: int = Field(
+            default=3600,
+            description="Seconds a staged preview can still be committed.",
+        )
+        preview_cache_size: int = Field(
+            default=64,
+            description="Maximum number of staged previews kept in memory.",
+        )
+        revision_history_size: int = Field(
+            default=128,
+            description="Generated documents whose instructions are kept for 'revise'; 0 disables revisions.",
+        )
+        revision_ttl_s: int = Field(
+            default=3600,
+            description="Seconds a generated document can still be revised by base_file_id.",
+        )
+        section_cache_size: int = Field(
+            default=256,
+            description="Rendered chapters (page_break_before sections) kept for reuse by revisions.",
+        )
+        source_cache_mb: int = Field(
+            default=256,
+            description="Memory (MB) for decoded and parsed source PDFs reused by repeated 'modify' calls in a chat, for modifying earlier results by base_file_id, and for committing previews and revising results of 'modify'; 0 disables.",
+        )
+        user_cache_ttl_s: int = Field(
+            default=300,
+            description="Seconds a user's email/name (used for upload tags) stays cached; 0 disables the cache.",
+        )
+        user_cache_size: int = Field(
+            default=1024,
+            description="Maximum number of cached user profiles.",
+        )
 
     def __init__(self):
         self.valves = self.Valves()
         self.citation = False
         self.file_handler = True  # Prevents default RAG processing of generated files
+        self.metrics: Dict[str, Any] = {"user_cache_hits": 0, "user_cache_misses": 0}
+        _FONT_DIR.configure(self.valves.font_dir)
 
     async def _emit_status(
         self, __event_emitter__, text: str, done: bool = False
@@ -704,12 +3329,50 @@ class Tools:
         source_filename_hint: Optional[str] = None,
         source_path: Optional[str] = None,
         output_basename: Optional[str] = None,
+        template_id: Optional[str] = None,
+        preview_id: Optional[str] = None,
+        base_file_id: Optional[str] = None,
+        patch: Optional[List[Dict[str, Any]]] = None,
+        markdown: Optional[str] = None,
+        records: Optional[List[Dict[str, Any]]] = None,
+        records_filename_hint: Optional[str] = None,
+        merge_output: Literal["combined", "zip"] = "combined",
+        merge_filename: Optional[str] = None,
+        output_formats: Optional[List[str]] = None,
+        source_filenames: Optional[List[str]] = None,
+        pages: Optional[str] = None,
+        split_every: Optional[int] = None,
         __files__: Optional[List[Dict[str, Any]]] = None,
         __event_emitter__=None,
         __user__: Optional[Dict[str, Any]] = None,
+        __metadata__: Optional[Dict[str, Any]] = None,
     ) -> str:
         """
         Create or modify PDF documents and attach them to the chat.
+
+        operation='preview' validates the payload, shows an HTML draft and returns a
+        preview_id; operation='commit' with that preview_id produces the PDF without
+        resending the payload. A preview with a source file commits as 'modify'.
+        operation='revise' applies `patch` (JSON-Patch ops such as
+        {"op": "replace", "path": "/paragraphs/0/font_size_pt", "value": 24}) to the
+        instructions behind base_file_id and renders the result as a new file.
+        `markdown` may replace the JSON instructions: `---` front matter with
+        PdfInstructions fields, then headings, lists, pipe tables, fenced code, images.
+        operation='merge' renders the instructions once per record of an attached
+        CSV/JSONL (records_filename_hint) or inline `records`, replacing {{field}}
+        placeholders in any text; merge_output='combined' gives one PDF, 'zip' one file
+        per record (named by merge_filename, e.g. 'certificate-{{name}}').
+        output_formats=['pdf', 'docx'] renders one 'create' payload as both a PDF and a
+        Word document (paragraph `style` such as 'Heading 1' applies to the Word file).
+        operation='modify' with base_file_id appends to that earlier result of this chat
+        instead of an attachment, so edits can be chained without re-attaching files.
+        operation='combine' concatenates the attached PDFs (source_filenames sets which
+        and in what order); 'extract' copies `pages` ('40-60', '1-5, 8') of the source
+        PDF into a new file; 'split' returns a ZIP of parts, every `split_every` pages or
+        one per range of `pages`. Pages are copied as they are, without re-rendering.
+        operation='inspect' returns page count, page sizes, metadata and outline of the
+        attached PDF (source_filename_hint) without producing a file; use it before
+        'modify' instead of reading the whole document.
         """
 
         # Visible progress in the chat UI
@@ -722,6 +3385,11 @@ class Tools:
             registered_faces = _register_fonts_from_files(__files__)
             if registered_faces:
                 _ALLOWED_FONTS.update(registered_faces)
+            _FONT_DIR.configure(self.valves.font_dir)
+            _ASSETS.configure(self.valves.asset_dir, self.valves.asset_cache_size)
+
+            if markdown and not (raw_instructions or instructions):
+                raw_instructions = _markdown_to_payload(markdown)
 
             # Build validated params (coerce instructions)
             parsed = PdfToolParams(
@@ -732,11 +3400,85 @@ class Tools:
                 source_filename_hint=source_filename_hint,
                 source_path=source_path,
                 output_basename=output_basename,
+                template_id=template_id,
+                preview_id=preview_id,
+                base_file_id=base_file_id,
+                patch=patch,
+                records=records,
+                records_filename_hint=records_filename_hint,
+                merge_output=merge_output,
+                merge_filename=merge_filename,
+                output_formats=output_formats or ["pdf"],
+                source_filenames=source_filenames,
+                pages=pages,
+                split_every=split_every,
             )
+            user_id = __user__.get("id") if isinstance(__user__, dict) else None
+            chat_id = (__metadata__ or {}).get("chat_id") if isinstance(__metadata__, dict) else None
+            scope = f"{user_id}:{chat_id or ''}"
+            _SOURCES.configure(self.valves.source_cache_mb * 1024 * 1024)
+
+            # Inspect: summarize the source PDF; nothing is rendered or uploaded
+            if parsed.operation == "inspect":
+                digest, existing = _source_document(
+                    scope,
+                    __files__ or [],
+                    parsed.source_filename_hint,
+                    parsed.source_path,
+                    self.valves.allow_server_paths,
+                )
+                key = (digest, self.valves.inspect_max_items)
+                _INSPECTIONS.configure(self.valves.inspect_cache_size, _INSPECTIONS.ttl)
+                summary = _INSPECTIONS.get(key)
+                if summary is None:
+                    summary = await _run_blocking(
+                        _inspect_pdf, existing, self.valves.inspect_max_items
+                    )
+                    _INSPECTIONS.put(key, summary)
+                label = parsed.source_filename_hint or os.path.basename(
+                    parsed.source_path or "attached.pdf"
+                )
+                await self._emit_status(__event_emitter__, "Inspected", done=True)
+                return f"**{label}** — {summary}"
+
+            staged: Optional[Dict[str, Any]] = None
+            if parsed.operation == "commit":
+                staged = _PREVIEWS.get(parsed.preview_id) if parsed.preview_id else None
+                if staged is None:
+                    raise FileNotFoundError(
+                        "Unknown or expired preview_id. Run operation='preview' again."
+                    )
+                if staged["user_id"] != user_id:
+                    raise PermissionError("This preview belongs to another user.")
+                parsed = staged["params"].model_copy(
+                    update={"output_basename": parsed.output_basename or staged["params"].output_basename}
+                )
+            elif parsed.operation == "revise":
+                base = _GENERATIONS.get(parsed.base_file_id) if parsed.base_file_id else None
+                if base is None:
+                    raise FileNotFoundError(
+                        "Unknown or expired base_file_id. Send the full instructions with 'create' or 'modify'."
+                    )
+                if base["user_id"] != user_id:
+                    raise PermissionError("This document belongs to another user.")
+                if not parsed.patch:
+                    raise ValueError("operation='revise' needs a non-empty 'patch' list.")
+                staged = {
+                    "instr": PdfInstructions(
+                        **_apply_json_patch(base["instr"].model_dump(), parsed.patch)
+                    ),
+                    "source": base["source"],
+                }
+                parsed = base["params"].model_copy(
+                    update={"output_basename": parsed.output_basename or base["params"].output_basename}
+                )
 
             # Coerce instructions
             payload = parsed.raw_instructions or {}
-            instr_obj = PdfInstructions(**payload) if payload else PdfInstructions()
+            if staged is not None:
+                instr_obj = staged["instr"]
+            else:
+                instr_obj = PdfInstructions(**payload) if payload else PdfInstructions()
 
             # Resolve any image name -> bytes from __files__
             def resolve_images(images: List[ImageSpec]) -> List[ImageSpec]:
@@ -768,93 +3510,282 @@ class Tools:
                         out.append(im)
                 return out
 
-            instr_obj.images = resolve_images(instr_obj.images)
+            if staged is None:
+                instr_obj.images = resolve_images(instr_obj.images)
+
+            # Preview: stage the validated tree and show a draft; nothing is rendered yet
+            if parsed.operation == "preview":
+                # A draft edits a document whenever 'modify' would find one to edit
+                is_modify = bool(
+                    parsed.base_file_id
+                    or parsed.source_filename_hint
+                    or parsed.source_path
+                    or _find_attached_file(".pdf", __files__ or [])
+                )
+                digest = (
+                    _source_document(
+                        scope,
+                        __files__ or [],
+                        parsed.source_filename_hint,
+                        parsed.source_path,
+                        self.valves.allow_server_paths,
+                        parsed.base_file_id,
+                    )[0]
+                    if is_modify
+                    else None
+                )
+                new_id = uuid.uuid4().hex[:12]
+                _PREVIEWS.configure(self.valves.preview_cache_size, self.valves.preview_ttl_s)
+                _PREVIEWS.put(
+                    new_id,
+                    {
+                        "user_id": user_id,
+                        "params": parsed.model_copy(
+                            update={"operation": "modify" if is_modify else "create"}
+                        ),
+                        "instr": instr_obj,
+                        "source": (scope, digest) if digest else None,
+                    },
+                )
+                draft = _preview_html(instr_obj, self.valves.preview_max_items)
+                if __event_emitter__:
+                    await __event_emitter__(
+                        {"type": "message", "data": {"content": f"```html\n{draft}\n```\n"}}
+                    )
+                    await self._emit_status(__event_emitter__, "Preview ready", done=True)
+                return (
+                    f"Preview `{new_id}` is shown above. After the user approves, call "
+                    f"pdf_document_tool with operation='commit', file_type='pdf' and "
+                    f"preview_id='{new_id}' (no instructions needed)."
+                )
 
             # Create or modify
-            expected_ext = ".pdf"
-            output_name = _choose_output_name(parsed.file_type, parsed.output_basename)
-
-            if parsed.operation == "create":
-                data_out = _create_pdf(instr_obj)
-            else:
-                existing_bytes: Optional[bytes] = None
-                pick = _find_attached_file(
-                    expected_ext, __files__ or [], parsed.source_filename_hint
+            if parsed.output_formats != ["pdf"] and parsed.operation != "create":
+                raise ValueError(
+                    "output_formats other than ['pdf'] work with operation='create' only."
                 )
-                if pick:
-                    _, existing_bytes = pick
-
-                if not existing_bytes and parsed.source_path:
-                    if self.valves.allow_server_paths and os.path.isfile(
-                        parsed.source_path
-                    ):
-                        with open(parsed.source_path, "rb") as fh:
-                            existing_bytes = fh.read()
+            output_name = _choose_output_name(parsed.file_type, parsed.output_basename)
+            _preload_fonts(instr_obj)
+            existing_bytes: Optional[bytes] = None
+            source_key: Optional[Tuple[str, str]] = None  # (scope, content hash) of the modified file
+            section_cache = None
+            if self.valves.revision_history_size > 0:
+                _SECTIONS.configure(self.valves.section_cache_size, self.valves.revision_ttl_s)
+                section_cache = _SECTIONS
+
+            outputs: List[Tuple[str, bytes]] = []
+            page_note = ""
+            if parsed.operation in _PAGE_OPERATIONS:
+                await self._emit_status(__event_emitter__, "Assembling pages…", done=False)
+                if parsed.operation == "combine":
+                    sources = _combine_inputs(__files__ or [], parsed.source_filenames)
+                    data_out, count = await _run_blocking(_combine_pdfs, sources)
+                    outputs = [(output_name, data_out)]
+                    page_note = f"{count} pages from {len(sources)} files"
+                else:
+                    _, existing_bytes = _source_document(
+                        scope,
+                        __files__ or [],
+                        parsed.source_filename_hint,
+                        parsed.source_path,
+                        self.valves.allow_server_paths,
+                        parsed.base_file_id,
+                    )
+                    stem = os.path.splitext(output_name)[0]
+                    if parsed.operation == "extract":
+                        if not parsed.pages:
+                            raise ValueError("operation='extract' needs 'pages', e.g. '40-60'.")
+                        data_out, count = await _run_blocking(
+                            _extract_pages, existing_bytes, parsed.pages
+                        )
+                        outputs = [(output_name, data_out)]
+                        page_note = f"{count} pages"
                     else:
-                        raise PermissionError(
-                            "Server path access is disabled. Attach the file to the chat or enable allow_server_paths."
+                        data_out, count = await _run_blocking(
+                            _split_pdf, existing_bytes, parsed.pages, parsed.split_every, stem
                         )
-                if not existing_bytes:
-                    raise FileNotFoundError(
-                        "No existing .pdf file found to modify. Attach a file or provide a valid source_path."
+                        outputs = [(f"{stem}.zip", data_out)]
+                        page_note = f"{count} parts"
+            elif parsed.operation == "merge":
+                rows = _load_merge_records(
+                    parsed.records, __files__ or [], parsed.records_filename_hint
+                )
+                if len(rows) > self.valves.merge_max_records:
+                    raise ValueError(
+                        f"{len(rows)} merge records exceed the limit of {self.valves.merge_max_records}."
+                    )
+                await self._emit_status(
+                    __event_emitter__, f"Merging {len(rows)} records…", done=False
+                )
+                parts = await _run_blocking(
+                    _render_records,
+                    _merge_instructions(instr_obj, rows),
+                    self.valves.render_workers,
+                )
+                letterhead = (
+                    await _run_blocking(
+                        _TEMPLATES.get, self.valves.template_dir, parsed.template_id
+                    )
+                    if parsed.template_id
+                    else None
+                )
+                if parsed.merge_output == "zip":
+                    if letterhead is not None:
+                        parts = [
+                            await _run_blocking(_apply_letterhead, part, letterhead)
+                            for part in parts
+                        ]
+                    names = _merge_names(
+                        rows, parsed.merge_filename, os.path.splitext(output_name)[0], ".pdf"
                     )
+                    zip_name = f"{os.path.splitext(output_name)[0]}.zip"
+                    data_out = await _run_blocking(_zip_outputs, list(zip(names, parts)))
+                    outputs = [(zip_name, data_out)]
+                else:
+                    data_out = await _run_blocking(_concat_pdfs, parts)
+                    if letterhead is not None:
+                        data_out = await _run_blocking(_apply_letterhead, data_out, letterhead)
+                    outputs = [(output_name, data_out)]
+            elif parsed.operation == "create":
+                rendered = await _run_blocking(
+                    _render_outputs,
+                    instr_obj,
+                    parsed.output_formats,
+                    self.valves.render_workers,
+                    section_cache,
+                )
+                if parsed.template_id and "pdf" in rendered:
+                    letterhead = await _run_blocking(
+                        _TEMPLATES.get, self.valves.template_dir, parsed.template_id
+                    )
+                    rendered["pdf"] = await _run_blocking(
+                        _apply_letterhead, rendered["pdf"], letterhead
+                    )
+                stem = os.path.splitext(output_name)[0]
+                outputs = [(f"{stem}.{fmt}", data) for fmt, data in rendered.items()]
+            else:
+                if staged is not None:
+                    source_scope, digest = staged["source"]
+                    existing_bytes = _SOURCES.data(source_scope, digest)
+                    if existing_bytes is None:
+                        raise FileNotFoundError(
+                            "The source document of this preview or revision is no longer cached. Attach it again and use operation='modify'."
+                        )
+                    if source_scope != scope:
+                        _SOURCES.add(scope, existing_bytes)
+                else:
+                    digest, existing_bytes = _source_document(
+                        scope,
+                        __files__ or [],
+                        parsed.source_filename_hint,
+                        parsed.source_path,
+                        self.valves.allow_server_paths,
+                        parsed.base_file_id,
+                    )
+                source_key = (scope, digest)
+
+                data_out = _modify_pdf(
+                    existing_bytes,
+                    instr_obj,
+                    self.valves.render_workers,
+                    section_cache,
+                    _SOURCES.reader(scope, digest),
+                )
+                outputs = [(output_name, data_out)]
 
-                data_out = _modify_pdf(existing_bytes, instr_obj)
+            if self.valves.linearize:
+                for i, (name, data) in enumerate(outputs):
+                    if name.endswith(".pdf"):
+                        data, self.metrics["last_linearization"] = await _run_blocking(
+                            _linearize, data
+                        )
+                        outputs[i] = (name, data)
 
             # Upload using Storage provider + Files model (0.5.x+ compatible)
             await self._emit_status(
                 __event_emitter__, "Uploading attachment…", done=False
             )
 
-            # Resolve user ID from __user__ dict
-            user_id = __user__.get("id") if isinstance(__user__, dict) else None
+            # User ID from __user__ (resolved above)
             if not user_id:
                 raise RuntimeError("No user context was provided for upload.")
 
-            # Get full user object to access email and name for tags
-            user_obj = Users.get_user_by_id(user_id)
-            if not user_obj:
-                raise RuntimeError(f"User not found with ID: {user_id}")
-
-            # Get content type
-            content_type = _get_content_type(parsed.file_type)
-
-            # Upload file using the fixed helper function (with tags and correct FileForm)
-            file_id = _upload_generated_file(
-                file_bytes=data_out,
-                filename=output_name,
-                content_type=content_type,
-                user_id=user_id,
-                user_email=user_obj.email or "",
-                user_name=user_obj.name or "",
+            # Email and name for the storage tags (from __user__, else cached or read once)
+            _USER_CACHE.configure(self.valves.user_cache_size, self.valves.user_cache_ttl_s)
+            profile, cached = await _run_blocking(
+                _lookup_user_profile, user_id, _request_profile(__user__)
             )
+            self.metrics["user_cache_hits" if cached else "user_cache_misses"] += 1
+            if not profile:
+                raise RuntimeError(f"User not found with ID: {user_id}")
+            user_email, user_name = profile
+
+            # Upload each output using the fixed helper function (with tags and correct FileForm)
+            uploaded: List[Tuple[str, str]] = []
+            for name, data in outputs:
+                file_id = await _run_blocking(
+                    _upload_generated_file,
+                    file_bytes=data,
+                    filename=name,
+                    content_type=_get_content_type(name.rsplit(".", 1)[-1]),
+                    user_id=user_id,
+                    user_email=user_email,
+                    user_name=user_name,
+                )
+                uploaded.append((file_id, name))
+                if name.endswith(".pdf"):
+                    # A later 'modify' with base_file_id starts from this output as is
+                    _SOURCES.add(scope, data, file_id)
+
+            # Remember the validated tree so the next round can be a small 'revise' patch
+            if parsed.operation != "merge" and parsed.operation not in _PAGE_OPERATIONS:
+                _GENERATIONS.configure(
+                    self.valves.revision_history_size, self.valves.revision_ttl_s
+                )
+                for file_id, _ in uploaded:
+                    _GENERATIONS.put(
+                        file_id,
+                        {
+                            "user_id": user_id,
+                            "params": parsed,
+                            "instr": instr_obj,
+                            "source": source_key,
+                        },
+                    )
 
-            # Build file URL (use relative path for compatibility)
-            file_url = f"/api/v1/files/{file_id}/content"
+            # File URLs (use relative paths for compatibility)
+            files_out = [
+                {"type": "file", "id": fid, "name": name, "url": f"/api/v1/files/{fid}/content"}
+                for fid, name in uploaded
+            ]
 
             # Emit file attachment event (works in both Default and Native modes)
             if __event_emitter__:
                 await __event_emitter__(
                     {
                         "type": "files",  # Use "files" for compatibility with both modes
-                        "data": {
-                            "files": [
-                                {
-                                    "type": "file",
-                                    "id": file_id,
-                                    "name": output_name,
-                                    "url": file_url,
-                                }
-                            ]
-                        },
+                        "data": {"files": files_out},
                     }
                 )
                 await self._emit_status(__event_emitter__, "Done", done=True)
 
-            # Final user-visible message with relative URL
+            # Final user-visible message with relative URLs
+            if parsed.operation == "merge":
+                follow_up = f"{len(rows)} records"
+            elif parsed.operation in _PAGE_OPERATIONS:
+                follow_up = f"{page_note}; file_id `{uploaded[0][0]}`"
+            else:
+                follow_up = f"file_id `{uploaded[0][0]}` for 'revise'"
+            names = ", ".join(f"**{f['name']}**" for f in files_out)
+            links = ", ".join(f"[{f['name']}]({f['url']})" for f in files_out)
+            formats = " + ".join(fmt.upper() for fmt in parsed.output_formats)
+            done = {"split": "Split", "extract": "Extracted"}.get(
+                parsed.operation, f"{parsed.operation.capitalize()}d"
+            )
             return (
-                f"{parsed.operation.capitalize()}d PDF — "
-                f"**{output_name}** is ready: [{output_name}]({file_url})"
+                f"{done} {formats} — "
+                f"{names} {'is' if len(files_out) == 1 else 'are'} ready: {links} "
+                f"({follow_up})"
             )
 
         except ValidationError as ve:
@@ -885,10 +3816,7 @@ class Tools:
                 await __event_emitter__(
                     {
                         "type": "notification",
-                        "data": {
-                            "type": "warning",
-                            "content": "No source file was found to modify.",
-                        },
+                        "data": {"type": "warning", "content": str(fe)},
                     }
                 )
             return _friendly_error("Missing source file", fe)